@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Benchmark query_flights.py against synthetic Flighty databases.
+
+Generates (or reuses) a database per size with generate_flighty_db.py,
+then times each command two ways:
+- cli: a fresh `python3 query_flights.py ...` process, as the agent runs it
+  (daemon and result cache bypassed)
+- inprocess: run_command() plus JSON encoding on a new connection with the
+  per-user state cache cleared, isolating query and processing cost
+
+Results are written as JSON so two runs can be compared with --compare.
+The databases are anchored at the start of the current UTC day unless
+--anchor is given; with --compare the baseline's anchor is reused, so both
+runs query the same data.
+
+Usage:
+    python3 benchmark_flights.py --sizes 1k,10k --output bench.json
+    python3 benchmark_flights.py --sizes 10k --compare bench.json
+"""
+
+import argparse
+import importlib.util
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+QUERY_SCRIPT = SCRIPT_DIR / "query_flights.py"
+DEFAULT_WORK_DIR = Path.home() / ".cache/travel-agent/bench"
+
+COMMANDS = ("list", "next", "date", "pnr", "stats", "year", "recent")
+
+
+def load_script(name):
+    """Import a sibling script as a module."""
+    spec = importlib.util.spec_from_file_location(name, SCRIPT_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def pick_arguments(db_path, anchor):
+    """Choose realistic arguments for date, pnr and year from the database.
+
+    Picks the busiest local departure date and a confirmation code with
+    several legs among the main user's flights, and last year.
+    """
+    conn = sqlite3.connect(db_path)
+    busiest_date = conn.execute("""
+        SELECT date(COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal), 'unixepoch') AS day
+        FROM Flight f
+        GROUP BY day
+        ORDER BY COUNT(*) DESC, day
+        LIMIT 1
+    """).fetchone()[0]
+    pnr = conn.execute("""
+        SELECT pnr FROM Ticket
+        GROUP BY pnr
+        ORDER BY COUNT(*) DESC, pnr
+        LIMIT 1
+    """).fetchone()[0]
+    conn.close()
+    year = datetime.fromtimestamp(anchor, tz=timezone.utc).year - 1
+    return {
+        "list": [],
+        "next": [],
+        "date": [busiest_date],
+        "pnr": [pnr],
+        "stats": [],
+        "year": [str(year)],
+        "recent": [],
+    }
+
+
+def summarize(samples):
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "runs": len(samples),
+    }
+
+
+def result_size(result):
+    """Number of flights (or 1 for scalar answers) in a command result."""
+    for key in ("flights", "recent_flights", "results"):
+        if isinstance(result.get(key), list):
+            return len(result[key])
+    if "next_flight" in result:
+        return 1 if result["next_flight"] else 0
+    return result.get("count", 1)
+
+
+def time_cli(db_path, command, args, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, str(QUERY_SCRIPT), command, *args,
+             "--db", str(db_path), "--no-daemon", "--no-cache"],
+            capture_output=True, check=False,
+        )
+        samples.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{command} failed: {completed.stdout.decode()[:200]}")
+    return summarize(samples)
+
+
+def time_inprocess(query_flights, db_path, command, args, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        query_flights.invalidate_state_cache()
+        start = time.perf_counter()
+        conn = query_flights.connect_db(db_path)
+        result = query_flights.run_command(conn, command, list(args), db_path)
+        json.dumps(result, indent=2)
+        conn.close()
+        samples.append(time.perf_counter() - start)
+    if "error" in result:
+        raise RuntimeError(f"{command} failed: {result['error']}")
+    return summarize(samples), result_size(result)
+
+
+def run_benchmarks(sizes, seed, repeat, work_dir, commands, modes, anchor):
+    generator = load_script("generate_flighty_db")
+    query_flights = load_script("query_flights")
+    work_dir = Path(work_dir)
+
+    results = []
+    databases = []
+    for size in sizes:
+        db_path = work_dir / f"flighty-{size}-seed{seed}-{int(anchor)}.db"
+        if not db_path.exists():
+            start = time.perf_counter()
+            summary = generator.generate(db_path, size, seed, anchor)
+            summary["generate_seconds"] = round(time.perf_counter() - start, 3)
+            databases.append(summary)
+        else:
+            databases.append({"path": str(db_path), **generator.read_meta(db_path), "reused": True})
+
+        arguments = pick_arguments(db_path, anchor)
+        for command in commands:
+            args = arguments[command]
+            entry = {"size": size, "command": command, "args": args}
+            if "inprocess" in modes:
+                entry["inprocess"], entry["result_size"] = time_inprocess(
+                    query_flights, db_path, command, args, repeat)
+            if "cli" in modes:
+                entry["cli"] = time_cli(db_path, command, args, repeat)
+            results.append(entry)
+            print(f"{size:>8} {command:<7} " + "  ".join(
+                f"{mode} {entry[mode]['median_ms']:9.2f} ms" for mode in modes if mode in entry
+            ), file=sys.stderr)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+            "anchor": anchor,
+            "repeat": repeat,
+            "modes": list(modes),
+        },
+        "databases": databases,
+        "results": results,
+    }
+
+
+def baseline_anchor(baseline):
+    """The anchor a previous run generated its databases with, if recorded."""
+    anchor = baseline.get("meta", {}).get("anchor")
+    if anchor is None:
+        anchor = next((db["anchor"] for db in baseline.get("databases", []) if "anchor" in db), None)
+    return anchor
+
+
+def compare(current, baseline):
+    """Per (size, command, mode) median change against a previous run."""
+    previous = {}
+    for entry in baseline.get("results", []):
+        for mode in ("inprocess", "cli"):
+            if mode in entry:
+                previous[(entry["size"], entry["command"], mode)] = entry[mode]["median_ms"]
+
+    rows = []
+    for entry in current["results"]:
+        for mode in ("inprocess", "cli"):
+            key = (entry["size"], entry["command"], mode)
+            if mode not in entry or key not in previous:
+                continue
+            before, after = previous[key], entry[mode]["median_ms"]
+            rows.append({
+                "size": entry["size"],
+                "command": entry["command"],
+                "mode": mode,
+                "baseline_ms": before,
+                "current_ms": after,
+                "change_pct": round((after - before) / before * 100, 1) if before else None,
+            })
+    return rows
+
+
+def main():
+    generator = load_script("generate_flighty_db")
+    parser = argparse.ArgumentParser(description="Benchmark query_flights.py on synthetic data")
+    parser.add_argument("--sizes", default="1k,10k,100k",
+                        help="Comma-separated sizes: 1k, 10k, 100k, 1m or integers (default: 1k,10k,100k)")
+    parser.add_argument("--seed", type=int, default=1, help="Generator seed (default: 1)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per command (default: 5)")
+    parser.add_argument("--commands", default=",".join(COMMANDS),
+                        help=f"Comma-separated commands (default: {','.join(COMMANDS)})")
+    parser.add_argument("--mode", choices=("both", "inprocess", "cli"), default="both",
+                        help="Timing mode (default: both)")
+    parser.add_argument("--work-dir", default=str(DEFAULT_WORK_DIR),
+                        help="Where generated databases are kept and reused")
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--anchor", type=float,
+                        help="Unix timestamp the databases treat as 'now' "
+                             "(default: the --compare baseline's, else start of today, UTC)")
+    args = parser.parse_args()
+
+    sizes = [generator.parse_size(size.strip()) for size in args.sizes.split(",") if size.strip()]
+    commands = [command.strip() for command in args.commands.split(",") if command.strip()]
+    unknown = [command for command in commands if command not in COMMANDS]
+    if unknown:
+        print(json.dumps({"error": f"Unknown commands: {', '.join(unknown)}. Use: {', '.join(COMMANDS)}"}))
+        sys.exit(1)
+    modes = ("inprocess", "cli") if args.mode == "both" else (args.mode,)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    anchor = args.anchor
+    if anchor is None and baseline is not None:
+        anchor = baseline_anchor(baseline)
+    if anchor is None:
+        anchor = datetime.now(tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    if baseline is not None and baseline_anchor(baseline) not in (None, anchor):
+        print("warning: baseline was generated with a different --anchor; "
+              "its databases hold different flights", file=sys.stderr)
+
+    report = run_benchmarks(sizes, args.seed, args.repeat, args.work_dir, commands, modes, anchor)
+    if baseline is not None:
+        report["comparison"] = compare(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
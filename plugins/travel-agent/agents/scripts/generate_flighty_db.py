@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic Flighty database for benchmarking query_flights.py.
+
+Builds the tables query_flights.py and validate_flights.py read (Flight,
+UserFlight, Ticket, ManualFlight, UserManualFlight, Airport, Airline,
+AircraftType) with the quirks of a real multi-year history:
+- NULL importSource rows next to EMAIL/TRIPIT/CALENDAR imports
+- CONNECTED_FRIEND flights and a second device user
+- Soft-deleted links, codeshare duplicates and re-imported tail numbers
+- ManualFlight entries superseding tracked flights (originalFlightId)
+- Airports across many time zones, including half-hour offsets,
+  southern-hemisphere DST, ICAO-only airports and a missing zone
+
+The same seed, size and anchor always produce the same database. The
+anchor (the timestamp treated as "now") defaults to the start of the
+current UTC day, so it is recorded with the seed and size in a
+SyntheticMeta table; read_meta() returns them.
+
+Usage:
+    python3 generate_flighty_db.py --size 10k --output /tmp/flighty-10k.db
+    python3 generate_flighty_db.py --size 1m --seed 7 --output /tmp/flighty-1m.db
+"""
+
+import argparse
+import json
+import math
+import random
+import sqlite3
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+SCHEMA = """
+CREATE TABLE Airline (
+    id TEXT PRIMARY KEY, iata TEXT, icao TEXT, name TEXT
+);
+CREATE TABLE Airport (
+    id TEXT PRIMARY KEY, iata TEXT, icao TEXT, name TEXT, city TEXT,
+    timeZoneIdentifier TEXT, latitude REAL, longitude REAL
+);
+CREATE TABLE AircraftType (
+    id TEXT PRIMARY KEY, name TEXT
+);
+CREATE TABLE Flight (
+    id TEXT PRIMARY KEY, number TEXT, airlineId TEXT,
+    departureAirportId TEXT, scheduledArrivalAirportId TEXT,
+    lastKnownDepartureDate REAL, departureScheduleGateOriginal REAL,
+    lastKnownArrivalDate REAL, arrivalScheduleGateOriginal REAL,
+    equipmentModelId TEXT, equipmentModelName TEXT,
+    departureTerminal TEXT, departureGate TEXT, arrivalTerminal TEXT, arrivalGate TEXT,
+    distance REAL, equipmentTailNumber TEXT
+);
+CREATE TABLE UserFlight (
+    id TEXT PRIMARY KEY, flightId TEXT, userId TEXT, isMyFlight INTEGER,
+    importSource TEXT, deleted REAL
+);
+CREATE TABLE Ticket (
+    id TEXT PRIMARY KEY, flightId TEXT, userId TEXT, pnr TEXT, seatNumber TEXT, cabinClass TEXT
+);
+CREATE TABLE ManualFlight (
+    id TEXT PRIMARY KEY, number TEXT, airlineId TEXT,
+    departureAirportId TEXT, scheduledArrivalAirportId TEXT,
+    lastKnownDepartureDate REAL, lastKnownArrivalDate REAL,
+    equipmentModelId TEXT, equipmentModelName TEXT,
+    departureTerminal TEXT, departureGate TEXT, arrivalTerminal TEXT, arrivalGate TEXT,
+    distance REAL, equipmentTailNumber TEXT, originalFlightId TEXT
+);
+CREATE TABLE UserManualFlight (
+    id TEXT PRIMARY KEY, flightId TEXT, userId TEXT, isMyFlight INTEGER, deleted REAL
+);
+CREATE TABLE SyntheticMeta (
+    key TEXT PRIMARY KEY, value TEXT
+);
+"""
+
+# (iata, icao, name, city, time zone, latitude, longitude)
+AIRPORTS = (
+    ("SEA", "KSEA", "Seattle-Tacoma International", "Seattle", "America/Los_Angeles", 47.449, -122.309),
+    ("SFO", "KSFO", "San Francisco International", "San Francisco", "America/Los_Angeles", 37.619, -122.375),
+    ("LAX", "KLAX", "Los Angeles International", "Los Angeles", "America/Los_Angeles", 33.942, -118.408),
+    ("DEN", "KDEN", "Denver International", "Denver", "America/Denver", 39.856, -104.674),
+    ("PHX", "KPHX", "Phoenix Sky Harbor", "Phoenix", "America/Phoenix", 33.437, -112.008),
+    ("ORD", "KORD", "O'Hare International", "Chicago", "America/Chicago", 41.978, -87.905),
+    ("JFK", "KJFK", "John F. Kennedy International", "New York", "America/New_York", 40.640, -73.779),
+    ("BOS", "KBOS", "Logan International", "Boston", "America/New_York", 42.366, -71.010),
+    ("HNL", "PHNL", "Daniel K. Inouye International", "Honolulu", "Pacific/Honolulu", 21.319, -157.922),
+    ("ANC", "PANC", "Ted Stevens Anchorage International", "Anchorage", "America/Anchorage", 61.174, -149.998),
+    ("YVR", "CYVR", "Vancouver International", "Vancouver", "America/Vancouver", 49.194, -123.184),
+    ("YYT", "CYYT", "St. John's International", "St. John's", "America/St_Johns", 47.619, -52.752),
+    ("MEX", "MMMX", "Benito Juarez International", "Mexico City", "America/Mexico_City", 19.436, -99.072),
+    ("GRU", "SBGR", "Guarulhos International", "Sao Paulo", "America/Sao_Paulo", -23.432, -46.469),
+    ("SCL", "SCEL", "Arturo Merino Benitez", "Santiago", "America/Santiago", -33.393, -70.786),
+    ("KEF", "BIKF", "Keflavik International", "Reykjavik", "Atlantic/Reykjavik", 63.985, -22.605),
+    ("LHR", "EGLL", "Heathrow", "London", "Europe/London", 51.470, -0.454),
+    ("CDG", "LFPG", "Charles de Gaulle", "Paris", "Europe/Paris", 49.010, 2.548),
+    ("FRA", "EDDF", "Frankfurt am Main", "Frankfurt", "Europe/Berlin", 50.033, 8.571),
+    ("MUC", "EDDM", "Munich", "Munich", "Europe/Berlin", 48.354, 11.786),
+    ("AMS", "EHAM", "Schiphol", "Amsterdam", "Europe/Amsterdam", 52.310, 4.768),
+    ("IST", "LTFM", "Istanbul", "Istanbul", "Europe/Istanbul", 41.262, 28.742),
+    ("DXB", "OMDB", "Dubai International", "Dubai", "Asia/Dubai", 25.253, 55.366),
+    ("DOH", "OTHH", "Hamad International", "Doha", "Asia/Qatar", 25.273, 51.608),
+    ("JNB", "FAOR", "O. R. Tambo International", "Johannesburg", "Africa/Johannesburg", -26.134, 28.242),
+    ("NBO", "HKJK", "Jomo Kenyatta International", "Nairobi", "Africa/Nairobi", -1.319, 36.928),
+    ("DEL", "VIDP", "Indira Gandhi International", "Delhi", "Asia/Kolkata", 28.556, 77.100),
+    ("KTM", "VNKT", "Tribhuvan International", "Kathmandu", "Asia/Kathmandu", 27.697, 85.359),
+    ("SIN", "WSSS", "Changi", "Singapore", "Asia/Singapore", 1.364, 103.991),
+    ("HKG", "VHHH", "Hong Kong International", "Hong Kong", "Asia/Hong_Kong", 22.308, 113.918),
+    ("PEK", "ZBAA", "Beijing Capital International", "Beijing", "Asia/Shanghai", 40.080, 116.584),
+    ("ICN", "RKSI", "Incheon International", "Seoul", "Asia/Seoul", 37.463, 126.440),
+    ("HND", "RJTT", "Haneda", "Tokyo", "Asia/Tokyo", 35.552, 139.780),
+    ("SYD", "YSSY", "Kingsford Smith", "Sydney", "Australia/Sydney", -33.946, 151.177),
+    ("ADL", "YPAD", "Adelaide", "Adelaide", "Australia/Adelaide", -34.945, 138.531),
+    ("PER", "YPPH", "Perth", "Perth", "Australia/Perth", -31.940, 115.967),
+    ("AKL", "NZAA", "Auckland", "Auckland", "Pacific/Auckland", -37.008, 174.792),
+    # Private-aviation fields: ICAO only, and one with no zone on record
+    (None, "KBFI", "Boeing Field", "Seattle", "America/Los_Angeles", 47.530, -122.302),
+    (None, "KTEB", "Teterboro", "Teterboro", "America/New_York", 40.850, -74.061),
+    (None, "LFMD", "Cannes-Mandelieu", "Cannes", None, 43.542, 6.953),
+)
+
+# (iata, icao, name)
+AIRLINES = (
+    ("AS", "ASA", "Alaska Airlines"), ("UA", "UAL", "United Airlines"),
+    ("DL", "DAL", "Delta Air Lines"), ("AA", "AAL", "American Airlines"),
+    ("BA", "BAW", "British Airways"), ("LH", "DLH", "Lufthansa"),
+    ("AF", "AFR", "Air France"), ("KL", "KLM", "KLM"),
+    ("EK", "UAE", "Emirates"), ("QR", "QTR", "Qatar Airways"),
+    ("SQ", "SIA", "Singapore Airlines"), ("CX", "CPA", "Cathay Pacific"),
+    ("NH", "ANA", "All Nippon Airways"), ("QF", "QFA", "Qantas"),
+    ("NZ", "ANZ", "Air New Zealand"), ("LA", "LAN", "LATAM"),
+)
+
+AIRCRAFT = (
+    "Boeing 737-800", "Boeing 737 MAX 9", "Boeing 787-9", "Boeing 777-300ER",
+    "Airbus A320neo", "Airbus A321neo", "Airbus A350-900", "Airbus A380-800",
+    "Embraer E175", "Bombardier Q400",
+)
+
+PRIVATE_AIRCRAFT = ("Citation Latitude", "Challenger 350", "Phenom 300", "Gulfstream G280")
+
+IMPORT_SOURCES = (
+    (None, 0.58), ("EMAIL", 0.14), ("TRIPIT", 0.05), ("CALENDAR", 0.04),
+    ("CONNECTED_FRIEND", 0.19),
+)
+
+# Flighty's own cabin identifiers
+CABINS = (("economy", 0.62), ("premiumEconomy", 0.12), ("business", 0.22), ("first", 0.04))
+
+YEAR_SECONDS = 365 * 86400
+
+
+def parse_size(value):
+    """Accept 1k/10k/100k/1m or a plain integer."""
+    if value.lower() in SIZES:
+        return SIZES[value.lower()]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"size must be one of {', '.join(SIZES)} or an integer")
+
+
+def haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[5], a[6], b[5], b[6]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+def weighted(rng, choices):
+    roll = rng.random()
+    for value, weight in choices:
+        roll -= weight
+        if roll < 0:
+            return value
+    return choices[-1][0]
+
+
+class Generator:
+    """Produces the rows for one synthetic database."""
+
+    def __init__(self, size, seed, anchor):
+        self.size = size
+        self.rng = random.Random(seed)
+        self.anchor = anchor
+        self.main_user = self.uid()
+        self.family_user = self.uid()
+        self.flight_links = 0
+        self.stats = dict.fromkeys((
+            "flights", "manual_flights", "user_flights", "tickets", "friend_flights",
+            "null_import_source", "deleted_links", "codeshares", "superseded",
+        ), 0)
+
+    def uid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def departure_time(self):
+        # Ten years of history, most of it past, a few months ahead
+        if self.rng.random() < 0.05:
+            return self.anchor + self.rng.uniform(0, 0.5 * YEAR_SECONDS)
+        return self.anchor - self.rng.triangular(0, 10 * YEAR_SECONDS, 0)
+
+    def route(self, private=False):
+        pool = AIRPORTS if private else AIRPORTS[:-3]
+        dep, arr = self.rng.sample(range(len(pool)), 2)
+        return dep, arr, haversine_km(pool[dep], pool[arr])
+
+    def pnr(self):
+        return "".join(self.rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ23456789") for _ in range(6))
+
+    def build(self, conn):
+        rng = self.rng
+        airport_ids = [self.uid() for _ in AIRPORTS]
+        airline_ids = [self.uid() for _ in AIRLINES]
+        aircraft_ids = [self.uid() for _ in AIRCRAFT]
+        conn.executemany("INSERT INTO Airport VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(airport_ids[i],) + airport for i, airport in enumerate(AIRPORTS)])
+        conn.executemany("INSERT INTO Airline VALUES (?, ?, ?, ?)",
+                         [(airline_ids[i],) + airline for i, airline in enumerate(AIRLINES)])
+        conn.executemany("INSERT INTO AircraftType VALUES (?, ?)",
+                         [(aircraft_ids[i], name) for i, name in enumerate(AIRCRAFT)])
+
+        manual_count = max(1, self.size // 20)
+        tracked_count = self.size - manual_count
+        flights, links, tickets = [], [], []
+        superseded_candidates = []
+
+        def flush():
+            conn.executemany(f"INSERT INTO Flight VALUES ({', '.join('?' * 17)})", flights)
+            conn.executemany("INSERT INTO UserFlight VALUES (?, ?, ?, ?, ?, ?)", links)
+            conn.executemany("INSERT INTO Ticket VALUES (?, ?, ?, ?, ?, ?)", tickets)
+            flights.clear()
+            links.clear()
+            tickets.clear()
+
+        pnr = self.pnr()
+        made = 0
+        while made < tracked_count:
+            dep, arr, km = self.route()
+            departure = self.departure_time()
+            block = km / 820 * 3600 + rng.uniform(1200, 3000)
+            airline = rng.randrange(len(AIRLINES))
+            number = str(rng.randint(1, 2999))
+            tail = f"N{rng.randint(100, 999)}{rng.choice('ABCDEFGHJK')}{rng.choice('ABCDEFGHJK')}"
+            aircraft = rng.randrange(len(AIRCRAFT))
+            if rng.random() < 0.35:
+                pnr = self.pnr()  # New booking; otherwise another leg of the last one
+            source = weighted(rng, IMPORT_SOURCES)
+            deleted = self.anchor - rng.uniform(0, YEAR_SECONDS) if rng.random() < 0.03 else None
+
+            # A codeshare duplicates the operating flight under another
+            # airline; a re-import keeps only one copy's tail number.
+            copies = 1
+            if rng.random() < 0.04:
+                copies = 2
+                self.stats["codeshares"] += 1
+
+            for copy in range(copies):
+                if made >= tracked_count:
+                    break
+                flight_id = self.uid()
+                known = departure if rng.random() > 0.05 else None
+                flights.append((
+                    flight_id,
+                    number if copy == 0 else str(rng.randint(3000, 9999)),
+                    airline_ids[airline if copy == 0 else rng.randrange(len(AIRLINES))],
+                    airport_ids[dep], airport_ids[arr],
+                    known, departure - rng.uniform(0, 900),
+                    departure + block if known else None, departure + block,
+                    aircraft_ids[aircraft] if rng.random() < 0.8 else None, AIRCRAFT[aircraft],
+                    rng.choice(("1", "2", "3", "A", "B", "M", None)),
+                    f"{rng.choice('ABCDEN')}{rng.randint(1, 60)}" if rng.random() < 0.8 else None,
+                    rng.choice(("1", "2", "I", None)), None,
+                    km if rng.random() < 0.9 else None,
+                    tail if copy == 0 and rng.random() < 0.7 else None,
+                ))
+                user = self.main_user if rng.random() < 0.93 else self.family_user
+                links.append((self.uid(), flight_id, user, 1 if rng.random() < 0.97 else 0, source, deleted))
+                self.stats["user_flights"] += 1
+                if source is None:
+                    self.stats["null_import_source"] += 1
+                if source == "CONNECTED_FRIEND":
+                    self.stats["friend_flights"] += 1
+                if deleted:
+                    self.stats["deleted_links"] += 1
+                if rng.random() < 0.03:
+                    # Shared with the second device user
+                    links.append((self.uid(), flight_id, self.family_user, 1, None, None))
+                    self.stats["user_flights"] += 1
+                if source != "CONNECTED_FRIEND" and rng.random() < 0.65:
+                    tickets.append((
+                        self.uid(), flight_id, user, pnr,
+                        f"{rng.randint(1, 60)}{rng.choice('ABCDEFHJK')}" if rng.random() < 0.8 else None,
+                        weighted(rng, CABINS),
+                    ))
+                    self.stats["tickets"] += 1
+                if user == self.main_user and source != "CONNECTED_FRIEND" and rng.random() < 0.2:
+                    superseded_candidates.append((flight_id, dep, arr, km, known or departure, block))
+                made += 1
+            self.stats["flights"] = made
+            if len(flights) >= 10_000:
+                flush()
+        flush()
+
+        manual, manual_links = [], []
+        for i in range(manual_count):
+            original = None
+            if superseded_candidates and rng.random() < 0.3:
+                # Hand-corrected copy of a tracked flight (e.g. a diversion)
+                original, dep, arr, km, departure, block = superseded_candidates.pop(
+                    rng.randrange(len(superseded_candidates)))
+                number = f"{rng.choice(AIRLINES)[0]} {rng.randint(1, 2999)}"
+                airline = airline_ids[rng.randrange(len(AIRLINES))]
+                aircraft = rng.choice(AIRCRAFT)
+                self.stats["superseded"] += 1
+            else:
+                # Private / charter flight
+                dep, arr, km = self.route(private=True)
+                departure = self.departure_time()
+                block = km / 700 * 3600 + 900
+                number = f"EJA {rng.randint(1, 999)}"
+                airline = None
+                aircraft = rng.choice(PRIVATE_AIRCRAFT)
+            flight_id = self.uid()
+            manual.append((
+                flight_id, number, airline, airport_ids[dep], airport_ids[arr],
+                departure, departure + block, None, aircraft,
+                None, None, None, None,
+                km if rng.random() < 0.7 else None,
+                f"N{rng.randint(1, 999)}QS" if rng.random() < 0.6 else None,
+                original,
+            ))
+            manual_links.append((
+                self.uid(), flight_id, self.main_user, 1,
+                self.anchor if rng.random() < 0.02 else None,
+            ))
+        conn.executemany(f"INSERT INTO ManualFlight VALUES ({', '.join('?' * 16)})", manual)
+        conn.executemany("INSERT INTO UserManualFlight VALUES (?, ?, ?, ?, ?)", manual_links)
+        self.stats["manual_flights"] = manual_count
+
+
+def generate(output, size, seed=1, anchor=None):
+    """Write a synthetic database to `output` and return a summary dict."""
+    if anchor is None:
+        # Start of the current UTC day: reruns on the same day are identical
+        anchor = datetime.now(tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if output.exists():
+        output.unlink()
+
+    conn = sqlite3.connect(output)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA)
+    generator = Generator(size, seed, anchor)
+    with conn:
+        generator.build(conn)
+        conn.executemany("INSERT INTO SyntheticMeta VALUES (?, ?)", [
+            ("size", json.dumps(size)), ("seed", json.dumps(seed)), ("anchor", json.dumps(anchor)),
+        ])
+    conn.close()
+
+    return {
+        "path": str(output),
+        "size": size,
+        "seed": seed,
+        "anchor": anchor,
+        "main_user_id": generator.main_user,
+        **generator.stats,
+    }
+
+
+def read_meta(path):
+    """The size, seed and anchor a synthetic database was generated with."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM SyntheticMeta")}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Flighty database")
+    parser.add_argument("--size", type=parse_size, default=SIZES["10k"],
+                        help="Number of flights: 1k, 10k, 100k, 1m or an integer (default: 10k)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--anchor", type=float,
+                        help="Unix timestamp treated as 'now' (default: start of today, UTC)")
+    parser.add_argument("--output", required=True, help="Path of the database to write")
+    args = parser.parse_args()
+
+    if Path(args.output).name == "MainFlightyDatabase.db":
+        print(json.dumps({"error": "Refusing to overwrite a file named like the real Flighty database"}))
+        sys.exit(1)
+
+    print(json.dumps(generate(args.output, args.size, args.seed, args.anchor), indent=2))
+
+
+if __name__ == "__main__":
+    main()
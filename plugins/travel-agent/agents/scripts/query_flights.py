@@ -10,62 +10,190 @@ Flighty stores flights in two tables:
 This script queries both tables to get the complete flight history.
 """
 
+import base64
+import difflib
+import hashlib
 import json
+import math
+import os
+import re
+import socket
 import sqlite3
+import struct
 import sys
-from datetime import datetime, timezone
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
 # Flighty database location (macOS)
 DEFAULT_DB_PATH = Path.home() / "Library/Containers/com.flightyapp.flighty/Data/Documents/MainFlightyDatabase.db"
 
+# Local cache directory for the query daemon socket and sidecar files.
+# Nothing here is ever written into the Flighty container.
+CACHE_DIR = Path.home() / ".cache/travel-agent"
+DEFAULT_SOCKET_PATH = CACHE_DIR / "query_flights.sock"
 
-def get_db_path():
-    """Get database path, checking if it exists."""
-    db_path = DEFAULT_DB_PATH
+# Derived per-user state (main user, superseded IDs). Computed once per
+# process; the serve daemon clears it whenever the database changes.
+_state_cache = {}
+
+# Timestamp every command in a batch invocation treats as "now", so they
+# agree on what is upcoming. None means read the clock.
+_pinned_now = None
+
+
+def get_db_path(db_path=None):
+    """Get database path (default Flighty location unless given), checking it exists."""
+    db_path = Path(db_path) if db_path else DEFAULT_DB_PATH
     if not db_path.exists():
         return None, f"Database not found at {db_path}"
     return db_path, None
 
 
+# ---------------------------------------------------------------------------
+# Timezone conversion
+# ---------------------------------------------------------------------------
+#
+# Every displayed time goes through local_times(), which derives the ISO,
+# display and date strings from a single conversion. ZoneInfo objects are
+# memoized per name and each zone keeps a table of UTC offsets per UTC day,
+# so converting a timestamp is normally a dict lookup plus one fixed-offset
+# fromtimestamp(). localize_column() converts a whole column zone by zone.
+
+# Display strings match strftime("%b %d, %Y %I:%M %p") in the C locale, but
+# are assembled directly since strftime dominated the per-row cost.
+MONTH_ABBREVIATIONS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+                       "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+_MISSING = object()
+
+# zone name -> {UTC day number: offset seconds, or None if the day has a transition}
+_zone_day_offsets = {}
+
+# offset seconds -> fixed-offset tzinfo
+_fixed_zones = {0: timezone.utc}
+
+
+@lru_cache(maxsize=None)
+def get_zone(tz_name):
+    """Memoized ZoneInfo lookup; None for missing or unknown zone names."""
+    if not tz_name:
+        return None
+    try:
+        return ZoneInfo(tz_name)
+    except Exception:
+        return None
+
+
+def _offset_at(ts, zone):
+    return int(datetime.fromtimestamp(ts, zone).utcoffset().total_seconds())
+
+
+def _day_offset(day, zone):
+    """Offset shared by a whole UTC day, or None if a transition falls inside it."""
+    start = _offset_at(day * 86400, zone)
+    end = _offset_at(day * 86400 + 86399, zone)
+    return start if start == end else None
+
+
+def utc_offset(ts, tz_name=None):
+    """UTC offset in seconds for a timestamp in the named zone (0 if unknown)."""
+    zone = get_zone(tz_name)
+    if zone is None:
+        return 0
+    table = _zone_day_offsets.setdefault(tz_name, {})
+    day = int(ts // 86400)
+    offset = table.get(day, _MISSING)
+    if offset is _MISSING:
+        offset = table[day] = _day_offset(day, zone)
+    if offset is None:
+        return _offset_at(ts, zone)  # DST transition day: resolve exactly
+    return offset
+
+
+def _fixed_zone(offset):
+    zone = _fixed_zones.get(offset)
+    if zone is None:
+        zone = _fixed_zones[offset] = timezone(timedelta(seconds=offset))
+    return zone
+
+
+def _format_local(ts, offset):
+    """Build the (iso, display, date) strings from one fixed-offset conversion."""
+    dt = datetime.fromtimestamp(ts, _fixed_zone(offset))
+    iso = dt.isoformat()
+    hour = dt.hour
+    display = (
+        f"{MONTH_ABBREVIATIONS[dt.month - 1]} {dt.day:02d}, {dt.year} "
+        f"{hour % 12 or 12:02d}:{dt.minute:02d} {'AM' if hour < 12 else 'PM'}"
+    )
+    return iso, display, iso[:10]
+
+
+@lru_cache(maxsize=8192)
+def local_times(ts, tz_name=None):
+    """Return (iso, display, date) strings for a Unix timestamp in a zone.
+
+    Unknown or missing zones fall back to UTC, like the original helpers.
+    """
+    if ts is None:
+        return None, None, None
+    return _format_local(ts, utc_offset(ts, tz_name))
+
+
+def localize_column(timestamps, tz_names=None):
+    """Convert a column of timestamps, batching the work per zone.
+
+    `tz_names` is a parallel column of zone names (or None for UTC). The
+    zone and its offset table are resolved once per zone rather than per
+    row. Returns a list of (iso, display, date) tuples in input order.
+    """
+    if tz_names is None:
+        tz_names = [None] * len(timestamps)
+    results = [(None, None, None)] * len(timestamps)
+    by_zone = {}
+    for i, ts in enumerate(timestamps):
+        if ts is not None:
+            by_zone.setdefault(tz_names[i], []).append(i)
+
+    for tz_name, positions in by_zone.items():
+        zone = get_zone(tz_name)
+        if zone is None:
+            for i in positions:
+                results[i] = _format_local(timestamps[i], 0)
+            continue
+        table = _zone_day_offsets.setdefault(tz_name, {})
+        for i in positions:
+            ts = timestamps[i]
+            day = int(ts // 86400)
+            offset = table.get(day, _MISSING)
+            if offset is _MISSING:
+                offset = table[day] = _day_offset(day, zone)
+            if offset is None:
+                offset = _offset_at(ts, zone)
+            results[i] = _format_local(ts, offset)
+    return results
+
+
 def convert_timestamp(ts, tz_name=None):
     """Convert Unix timestamp to ISO format in the given timezone."""
-    if ts is None:
-        return None
-    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-    if tz_name:
-        try:
-            dt = dt.astimezone(ZoneInfo(tz_name))
-        except (KeyError, Exception):
-            pass
-    return dt.isoformat()
+    return local_times(ts, tz_name)[0]
 
 
 def convert_date(ts, tz_name=None):
     """Convert Unix timestamp to date string in the given timezone."""
-    if ts is None:
-        return None
-    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-    if tz_name:
-        try:
-            dt = dt.astimezone(ZoneInfo(tz_name))
-        except (KeyError, Exception):
-            pass
-    return dt.strftime("%Y-%m-%d")
+    return local_times(ts, tz_name)[2]
 
 
 def format_datetime(ts, tz_name=None):
     """Format timestamp for display in the given timezone."""
-    if ts is None:
-        return None
-    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-    if tz_name:
-        try:
-            dt = dt.astimezone(ZoneInfo(tz_name))
-        except (KeyError, Exception):
-            pass
-    return dt.strftime("%b %d, %Y %I:%M %p")
+    return local_times(ts, tz_name)[1]
 
 
 def calculate_duration(departure, arrival):
@@ -78,17 +206,78 @@ def calculate_duration(departure, arrival):
     return f"{hours}h {minutes}m"
 
 
-def days_until(ts):
-    """Calculate days until a timestamp."""
+def current_timestamp():
+    """Current UTC timestamp, or the pinned batch time when one is set."""
+    if _pinned_now is not None:
+        return _pinned_now
+    return datetime.now(tz=timezone.utc).timestamp()
+
+
+def days_until(ts, now=None):
+    """Calculate days until a timestamp (optionally relative to `now`)."""
     if ts is None:
         return None
-    target = datetime.fromtimestamp(ts, tz=timezone.utc)
-    delta = target - datetime.now(tz=timezone.utc)
-    return delta.days
+    if now is None:
+        now = current_timestamp()
+    return int((ts - now) // 86400)
+
+
+def connect_db(db_path, read_only=False, check_same_thread=True):
+    """Open the Flighty database, optionally as a read-only URI connection."""
+    factory = ProfilingConnection if _active_profile else sqlite3.Connection
+    if read_only:
+        return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, factory=factory,
+                               check_same_thread=check_same_thread)
+    return sqlite3.connect(db_path, factory=factory, check_same_thread=check_same_thread)
+
+
+def database_fingerprint(conn, db_path):
+    """Cheap change detector for the Flighty database.
+
+    Combines PRAGMA data_version (bumped when another connection commits)
+    with the inode, size and mtime of the database and its WAL file, so
+    iCloud sync replacing the file is caught too.
+    """
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    return (data_version,) + file_fingerprint(db_path)
+
+
+def file_fingerprint(db_path):
+    """Inode, size and mtime of the database and its WAL file.
+
+    Unlike PRAGMA data_version this needs no connection and is comparable
+    across processes; the WAL size tracks its frame count.
+    """
+    stat = os.stat(db_path)
+    wal_path = Path(f"{db_path}-wal")
+    wal = wal_path.stat() if wal_path.exists() else None
+    return (
+        stat.st_ino,
+        stat.st_size,
+        stat.st_mtime_ns,
+        wal.st_size if wal else 0,
+        wal.st_mtime_ns if wal else 0,
+    )
+
+
+def cached_state(key, compute):
+    """Return a memoized piece of per-user state, computing it on first use."""
+    if key not in _state_cache:
+        _state_cache[key] = compute()
+    return _state_cache[key]
+
+
+def invalidate_state_cache():
+    """Drop memoized per-user state after the database has changed."""
+    _state_cache.clear()
 
 
 def get_main_user_id(conn):
     """Identify the main user (device owner with the most flights)."""
+    return cached_state("main_user_id", lambda: _query_main_user_id(conn))
+
+
+def _query_main_user_id(conn):
     cursor = conn.cursor()
     cursor.execute("""
         SELECT userId
@@ -109,6 +298,10 @@ def get_superseded_flight_ids(conn):
     is a corrected/richer version of the original Flight table entry.
     The Flight table entry should be excluded to avoid duplicates.
     """
+    return cached_state("superseded_ids", lambda: _query_superseded_flight_ids(conn))
+
+
+def _query_superseded_flight_ids(conn):
     cursor = conn.cursor()
     cursor.execute("""
         SELECT DISTINCT originalFlightId
@@ -118,8 +311,204 @@ def get_superseded_flight_ids(conn):
     return {row[0] for row in cursor.fetchall()}
 
 
-def query_tracked_upcoming(conn, now, main_user_id, include_friends, limit):
-    """Query tracked flights (Flight table) for upcoming flights."""
+# ---------------------------------------------------------------------------
+# Distance backfill
+# ---------------------------------------------------------------------------
+#
+# Flighty leaves distance NULL on some manual and older flights. Those are
+# filled with great-circle distances from the Airport coordinates, loaded
+# once per state, computed for all missing airport pairs in one batch
+# (NumPy when installed, a flat array loop otherwise) and memoized by pair.
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def get_airport_coordinates(conn):
+    """Airport code (IATA, else ICAO) -> (latitude, longitude) in degrees."""
+    return cached_state("airport_coordinates", lambda: {
+        code: (latitude, longitude)
+        for code, latitude, longitude in conn.execute("""
+            SELECT COALESCE(iata, icao), latitude, longitude FROM Airport
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+              AND COALESCE(iata, icao) IS NOT NULL
+        """)
+    })
+
+
+def haversine_batch(lat1, lon1, lat2, lon2):
+    """Great-circle distances in km between parallel arrays of coordinates."""
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        lat1, lon1, lat2, lon2 = (np.radians(np.frombuffer(column, dtype=np.float64))
+                                  for column in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))).tolist()
+
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    distances = array("d", bytes(8 * len(lat1)))
+    for i in range(len(lat1)):
+        p1, p2 = radians(lat1[i]), radians(lat2[i])
+        a = sin((p2 - p1) / 2) ** 2 + cos(p1) * cos(p2) * sin(radians(lon2[i] - lon1[i]) / 2) ** 2
+        distances[i] = 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+    return distances.tolist()
+
+
+def pair_distances(conn, pairs):
+    """Great-circle km for (dep_code, arr_code) pairs; None without coordinates."""
+    known = cached_state("pair_distances", dict)
+    missing = {pair for pair in pairs if pair not in known}
+    if missing:
+        coordinates = get_airport_coordinates(conn)
+        computable = [pair for pair in missing if pair[0] in coordinates and pair[1] in coordinates]
+        columns = [array("d") for _ in range(4)]
+        for dep, arr in computable:
+            for column, value in zip(columns, coordinates[dep] + coordinates[arr]):
+                column.append(value)
+        known.update(dict.fromkeys(missing))
+        known.update(zip(computable, haversine_batch(*columns)))
+    return [known[pair] for pair in pairs]
+
+
+def backfill_distances(conn, rows, dep=3, arr=6, distance=19):
+    """Return rows with missing distances filled in from airport coordinates.
+
+    Column positions default to the 25-column layout. Rows that already
+    have a distance, or lack coordinates, are returned unchanged.
+    """
+    positions = [i for i, row in enumerate(rows) if row[distance] is None]
+    if not positions:
+        return rows
+    filled = pair_distances(conn, [(rows[i][dep], rows[i][arr]) for i in positions])
+    rows = list(rows)
+    for i, km in zip(positions, filled):
+        if km is not None:
+            row = rows[i]
+            rows[i] = row[:distance] + (km,) + row[distance + 1:]
+    return rows
+
+
+# Shared SELECT list and joins producing the 25-column flight row layout
+# wrapped by FlightRecord. Tracked and manual flights map onto the
+# same columns so their rows can be merged, indexed and deduped together.
+TRACKED_DEPARTURE = "COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal)"
+
+TRACKED_FLIGHT_COLUMNS = """
+    a.iata as airline_code,
+    a.name as airline_name,
+    f.number as flight_number,
+    COALESCE(dep.iata, dep.icao) as dep_code,
+    dep.name as dep_airport,
+    dep.city as dep_city,
+    COALESCE(arr.iata, arr.icao) as arr_code,
+    arr.name as arr_airport,
+    arr.city as arr_city,
+    COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) as departure,
+    COALESCE(f.lastKnownArrivalDate, f.arrivalScheduleGateOriginal) as arrival,
+    t.pnr as confirmation,
+    t.seatNumber as seat,
+    t.cabinClass as cabin_class,
+    COALESCE(at.name, f.equipmentModelName) as aircraft,
+    f.departureTerminal as dep_terminal,
+    f.departureGate as dep_gate,
+    f.arrivalTerminal as arr_terminal,
+    f.arrivalGate as arr_gate,
+    f.distance as distance_km,
+    uf.importSource as import_source,
+    f.equipmentTailNumber as tail_number,
+    'tracked' as source,
+    f.id as flight_id,
+    dep.timeZoneIdentifier as dep_tz
+"""
+
+TRACKED_FLIGHT_JOINS = """
+    FROM Flight f
+    JOIN UserFlight uf ON f.id = uf.flightId
+    JOIN Airline a ON f.airlineId = a.id
+    JOIN Airport dep ON f.departureAirportId = dep.id
+    JOIN Airport arr ON f.scheduledArrivalAirportId = arr.id
+    LEFT JOIN AircraftType at ON f.equipmentModelId = at.id
+    LEFT JOIN Ticket t ON f.id = t.flightId AND uf.userId = t.userId
+"""
+
+MANUAL_FLIGHT_COLUMNS = """
+    a.iata as airline_code,
+    a.name as airline_name,
+    mf.number as flight_number,
+    COALESCE(dep.iata, dep.icao) as dep_code,
+    dep.name as dep_airport,
+    dep.city as dep_city,
+    COALESCE(arr.iata, arr.icao) as arr_code,
+    arr.name as arr_airport,
+    arr.city as arr_city,
+    mf.lastKnownDepartureDate as departure,
+    mf.lastKnownArrivalDate as arrival,
+    NULL as confirmation,
+    NULL as seat,
+    NULL as cabin_class,
+    COALESCE(at.name, mf.equipmentModelName) as aircraft,
+    mf.departureTerminal as dep_terminal,
+    mf.departureGate as dep_gate,
+    mf.arrivalTerminal as arr_terminal,
+    mf.arrivalGate as arr_gate,
+    mf.distance as distance_km,
+    'MANUAL' as import_source,
+    mf.equipmentTailNumber as tail_number,
+    'manual' as source,
+    mf.id as flight_id,
+    dep.timeZoneIdentifier as dep_tz
+"""
+
+MANUAL_FLIGHT_JOINS = """
+    FROM ManualFlight mf
+    JOIN UserManualFlight umf ON mf.id = umf.flightId
+    JOIN Airport dep ON mf.departureAirportId = dep.id
+    JOIN Airport arr ON mf.scheduledArrivalAirportId = arr.id
+    LEFT JOIN Airline a ON mf.airlineId = a.id
+    LEFT JOIN AircraftType at ON mf.equipmentModelId = at.id
+"""
+
+
+# Column names of the 25-column layout, for queries over derived tables.
+FLIGHT_ROW_FIELDS = (
+    "airline_code", "airline_name", "flight_number",
+    "dep_code", "dep_airport", "dep_city",
+    "arr_code", "arr_airport", "arr_city",
+    "departure", "arrival",
+    "confirmation", "seat", "cabin_class", "aircraft",
+    "dep_terminal", "dep_gate", "arr_terminal", "arr_gate",
+    "distance_km", "import_source", "tail_number", "source",
+    "flight_id", "dep_tz",
+)
+
+FLIGHT_ROW_COLUMNS = ", ".join(FLIGHT_ROW_FIELDS)
+
+
+def fetch_past_cursor(cursor, after, count):
+    """Fetch rows in keyset order until `count` of them lie past `after`.
+
+    Rows at or before the cursor (a look-back window the caller selected)
+    are kept too, so dedup still sees duplicates of earlier pages' flights.
+    """
+    rows = []
+    past = 0
+    for row in cursor:
+        rows.append(row)
+        if page_key(row) > after:
+            past += 1
+            if past == count:
+                break
+    return rows
+
+
+def query_tracked_upcoming(conn, now, main_user_id, include_friends, limit, after=None):
+    """Query tracked flights (Flight table) for upcoming flights.
+
+    `after` is a parsed keyset cursor; flights past it are returned, plus
+    those within ROUTE_KEY_WINDOW_SECONDS before it for the dedup.
+    """
     cursor = conn.cursor()
     superseded_ids = get_superseded_flight_ids(conn)
 
@@ -134,53 +523,29 @@ def query_tracked_upcoming(conn, now, main_user_id, include_friends, limit):
             AND (uf.importSource IS NULL OR uf.importSource != 'CONNECTED_FRIEND')
         """
         params = [now, main_user_id]
+    if after is not None:
+        where_clause += f" AND {TRACKED_DEPARTURE} >= ?"
+        params.append(after[0] - ROUTE_KEY_WINDOW_SECONDS)
 
+    # Fetch extra to allow for merging (past the cursor when paging)
     cursor.execute(f"""
-        SELECT
-            a.iata as airline_code,
-            a.name as airline_name,
-            f.number as flight_number,
-            COALESCE(dep.iata, dep.icao) as dep_code,
-            dep.name as dep_airport,
-            dep.city as dep_city,
-            COALESCE(arr.iata, arr.icao) as arr_code,
-            arr.name as arr_airport,
-            arr.city as arr_city,
-            COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) as departure,
-            COALESCE(f.lastKnownArrivalDate, f.arrivalScheduleGateOriginal) as arrival,
-            t.pnr as confirmation,
-            t.seatNumber as seat,
-            t.cabinClass as cabin_class,
-            COALESCE(at.name, f.equipmentModelName) as aircraft,
-            f.departureTerminal as dep_terminal,
-            f.departureGate as dep_gate,
-            f.arrivalTerminal as arr_terminal,
-            f.arrivalGate as arr_gate,
-            f.distance as distance_km,
-            uf.importSource as import_source,
-            f.equipmentTailNumber as tail_number,
-            'tracked' as source,
-            f.id as flight_id,
-            dep.timeZoneIdentifier as dep_tz
-        FROM Flight f
-        JOIN UserFlight uf ON f.id = uf.flightId
-        JOIN Airline a ON f.airlineId = a.id
-        JOIN Airport dep ON f.departureAirportId = dep.id
-        JOIN Airport arr ON f.scheduledArrivalAirportId = arr.id
-        LEFT JOIN AircraftType at ON f.equipmentModelId = at.id
-        LEFT JOIN Ticket t ON f.id = t.flightId AND uf.userId = t.userId
+        SELECT {TRACKED_FLIGHT_COLUMNS}
+        {TRACKED_FLIGHT_JOINS}
         WHERE {where_clause}
-        ORDER BY departure
+        ORDER BY departure, f.id
         LIMIT ?
-    """, params + [limit * 2])  # Fetch extra to allow for merging
+    """, params + [limit * 2 if after is None else -1])
 
     # Filter out flights superseded by ManualFlight entries
-    rows = cursor.fetchall()
+    rows = cursor.fetchall() if after is None else fetch_past_cursor(cursor, after, limit * 2)
     return [row for row in rows if row[23] not in superseded_ids]
 
 
-def query_manual_upcoming(conn, now, main_user_id, limit):
-    """Query manual flights (ManualFlight table) for upcoming flights."""
+def query_manual_upcoming(conn, now, main_user_id, limit, after=None):
+    """Query manual flights (ManualFlight table) for upcoming flights.
+
+    `after` works as in query_tracked_upcoming().
+    """
     cursor = conn.cursor()
 
     user_filter = ""
@@ -188,304 +553,601 @@ def query_manual_upcoming(conn, now, main_user_id, limit):
     if main_user_id:
         user_filter = "AND umf.userId = ?"
         params.append(main_user_id)
+    if after is not None:
+        user_filter += " AND mf.lastKnownDepartureDate >= ?"
+        params.append(after[0] - ROUTE_KEY_WINDOW_SECONDS)
 
     cursor.execute(f"""
-        SELECT
-            a.iata as airline_code,
-            a.name as airline_name,
-            mf.number as flight_number,
-            COALESCE(dep.iata, dep.icao) as dep_code,
-            dep.name as dep_airport,
-            dep.city as dep_city,
-            COALESCE(arr.iata, arr.icao) as arr_code,
-            arr.name as arr_airport,
-            arr.city as arr_city,
-            mf.lastKnownDepartureDate as departure,
-            mf.lastKnownArrivalDate as arrival,
-            NULL as confirmation,
-            NULL as seat,
-            NULL as cabin_class,
-            COALESCE(at.name, mf.equipmentModelName) as aircraft,
-            mf.departureTerminal as dep_terminal,
-            mf.departureGate as dep_gate,
-            mf.arrivalTerminal as arr_terminal,
-            mf.arrivalGate as arr_gate,
-            mf.distance as distance_km,
-            'MANUAL' as import_source,
-            mf.equipmentTailNumber as tail_number,
-            'manual' as source,
-            NULL as flight_id,
-            dep.timeZoneIdentifier as dep_tz
-        FROM ManualFlight mf
-        JOIN UserManualFlight umf ON mf.id = umf.flightId
-        JOIN Airport dep ON mf.departureAirportId = dep.id
-        JOIN Airport arr ON mf.scheduledArrivalAirportId = arr.id
-        LEFT JOIN Airline a ON mf.airlineId = a.id
-        LEFT JOIN AircraftType at ON mf.equipmentModelId = at.id
+        SELECT {MANUAL_FLIGHT_COLUMNS}
+        {MANUAL_FLIGHT_JOINS}
         WHERE umf.isMyFlight = 1
           AND umf.deleted IS NULL
           AND mf.lastKnownDepartureDate > ?
           {user_filter}
-        ORDER BY mf.lastKnownDepartureDate
+        ORDER BY mf.lastKnownDepartureDate, mf.id
         LIMIT ?
-    """, params + [limit * 2])
+    """, params + [limit * 2 if after is None else -1])
 
-    return cursor.fetchall()
+    return cursor.fetchall() if after is None else fetch_past_cursor(cursor, after, limit * 2)
 
 
-def process_flight_row(row):
-    """Process a flight row into a dictionary.
+class FlightRecord:
+    """One flight row with named fields and lazily derived values.
+
+    Wraps a row in the 25-column layout without copying it. Columns read by
+    name (record.dep_code, record.seat, ...; see FLIGHT_ROW_FIELDS) and the
+    derived values - local times, flight and cabin display strings,
+    duration, miles - are computed on first use, so rows dropped by dedup
+    or a limit never pay for them. to_dict() builds the JSON output.
 
     Row layout (indices 0-24):
       0: airline_code, 1: airline_name, 2: flight_number,
       3: dep_code, 4: dep_airport, 5: dep_city,
       6: arr_code, 7: arr_airport, 8: arr_city,
-      9: departure_ts, 10: arrival_ts,
+      9: departure, 10: arrival,
       11: confirmation, 12: seat, 13: cabin_class, 14: aircraft,
       15: dep_terminal, 16: dep_gate, 17: arr_terminal, 18: arr_gate,
       19: distance_km, 20: import_source, 21: tail_number, 22: source,
-      23: flight_id, 24: dep_tz
+      23: flight_id (Flight.id or ManualFlight.id), 24: dep_tz
     """
-    cabin_class = row[13]
-    if cabin_class:
-        cabin_display = cabin_class.replace("premiumEconomy", "Premium Economy").replace("privateJet", "Private Jet").title()
-    else:
-        cabin_display = None
 
-    departure_ts = row[9]
-    arrival_ts = row[10]
-    dep_tz = row[24] if len(row) > 24 else None
+    __slots__ = ("row", "now", "_departure_local", "_arrival_local")
 
-    source = row[22]
-    # Manual flight numbers already include the airline/operator prefix (e.g., "EJA 431")
-    # Tracked flight numbers are just the numeric part (e.g., "123") and need the IATA code prepended
-    if source == 'manual':
-        flight_display = row[2]
-    else:
-        flight_display = f"{row[0]} {row[2]}" if row[0] and row[2] else row[2]
+    def __init__(self, row, departure_local=None, arrival_local=None, now=None):
+        self.row = row
+        self.now = now
+        self._departure_local = departure_local
+        self._arrival_local = arrival_local
 
-    return {
-        "flight": flight_display,
-        "airline": row[1],
-        "flight_number": row[2],
-        "route": f"{row[3]} → {row[6]}",
-        "departure": {
-            "airport_code": row[3],
-            "airport_name": row[4],
-            "city": row[5],
-            "datetime": convert_timestamp(departure_ts, dep_tz),
-            "display": format_datetime(departure_ts, dep_tz),
-            "terminal": row[15],
-            "gate": row[16]
-        },
-        "arrival": {
-            "airport_code": row[6],
-            "airport_name": row[7],
-            "city": row[8],
-            "datetime": convert_timestamp(arrival_ts),
-            "display": format_datetime(arrival_ts),
-            "terminal": row[17],
-            "gate": row[18]
-        },
-        "confirmation": row[11],
-        "seat": row[12],
-        "cabin_class": cabin_display,
-        "aircraft": row[14],
-        "duration": calculate_duration(departure_ts, arrival_ts),
-        "distance_km": row[19],
-        "distance_miles": int(row[19] * 0.621371) if row[19] else None,
-        "days_until": days_until(departure_ts),
-        "import_source": row[20],
-        "tail_number": row[21],
-        "source": row[22],
-        "_departure_ts": departure_ts,  # For sorting
-        "_dep_tz": dep_tz  # For timezone-aware date display
-    }
+    @property
+    def departure_local(self):
+        """(iso, display, date) of the departure in the departure airport's zone."""
+        if self._departure_local is None:
+            self._departure_local = local_times(self.row[9], self.dep_tz)
+        return self._departure_local
 
+    @property
+    def arrival_local(self):
+        """(iso, display, date) of the arrival, in UTC as Flighty stores no arrival zone."""
+        if self._arrival_local is None:
+            self._arrival_local = local_times(self.row[10])
+        return self._arrival_local
 
-def list_upcoming_flights(conn, limit=20, include_friends=False):
-    """List all upcoming flights with full details from both tables."""
-    now = datetime.now().timestamp()
-    main_user_id = get_main_user_id(conn)
+    @property
+    def dep_date(self):
+        """Local departure date, used in dedup keys."""
+        return self.departure_local[2]
+
+    @property
+    def dedup_key(self):
+        """Local date + route + flight number, as deduped by `list`."""
+        row = self.row
+        return f"{self.dep_date}|{row[3]}|{row[6]}|{row[2]}"
+
+    @property
+    def flight_display(self):
+        # Manual flight numbers already include the airline/operator prefix (e.g., "EJA 431")
+        # Tracked flight numbers are just the numeric part (e.g., "123") and need the IATA code prepended
+        row = self.row
+        if row[22] == 'manual':
+            return row[2]
+        return f"{row[0]} {row[2]}" if row[0] and row[2] else row[2]
+
+    @property
+    def cabin_display(self):
+        cabin_class = self.row[13]
+        if not cabin_class:
+            return None
+        return cabin_class.replace("premiumEconomy", "Premium Economy").replace("privateJet", "Private Jet").title()
+
+    @property
+    def duration(self):
+        return calculate_duration(self.row[9], self.row[10])
+
+    @property
+    def distance_miles(self):
+        distance_km = self.row[19]
+        return int(distance_km * 0.621371) if distance_km else None
+
+    def to_dict(self):
+        """Materialize the JSON output dict (every FLIGHT_OUTPUT_FIELDS entry)."""
+        return _build_output(_OUTPUT_PLAN, self, self.row)
 
-    # Get flights from both tables
-    tracked_rows = query_tracked_upcoming(conn, now, main_user_id, include_friends, limit)
-    manual_rows = query_manual_upcoming(conn, now, main_user_id, limit)
+    def project(self, fields):
+        """Build only the requested (possibly dotted) output fields.
 
-    # Process and combine
+        Paths resolve against FLIGHT_OUTPUT_FIELDS, so derived values that
+        were not asked for are never computed; unknown paths map to None,
+        as in project_fields().
+        """
+        projected = {}
+        for path in fields:
+            getter, target = FLIGHT_OUTPUT_FIELDS, projected
+            parts = path.split(".")
+            for part in parts[:-1]:
+                getter = getter.get(part) if isinstance(getter, dict) else None
+                target = target.setdefault(part, {})
+            getter = getter.get(parts[-1]) if isinstance(getter, dict) else None
+            target[parts[-1]] = _output_value(getter, self) if getter is not None else None
+        return projected
+
+
+# The JSON output shape of a flight, in output order: each field is a row
+# index or a getter taking the FlightRecord. Both FlightRecord.to_dict()
+# and --fields projection walk it.
+FLIGHT_OUTPUT_FIELDS = {
+    "flight": lambda r: r.flight_display,
+    "airline": 1,
+    "flight_number": 2,
+    "route": lambda r: f"{r.row[3]} → {r.row[6]}",
+    "departure": {
+        "airport_code": 3,
+        "airport_name": 4,
+        "city": 5,
+        "datetime": lambda r: r.departure_local[0],
+        "display": lambda r: r.departure_local[1],
+        "terminal": 15,
+        "gate": 16,
+    },
+    "arrival": {
+        "airport_code": 6,
+        "airport_name": 7,
+        "city": 8,
+        "datetime": lambda r: r.arrival_local[0],
+        "display": lambda r: r.arrival_local[1],
+        "terminal": 17,
+        "gate": 18,
+    },
+    "confirmation": 11,
+    "seat": 12,
+    "cabin_class": lambda r: r.cabin_display,
+    "aircraft": 14,
+    "duration": lambda r: r.duration,
+    "distance_km": 19,
+    "distance_miles": lambda r: r.distance_miles,
+    "days_until": lambda r: days_until(r.row[9], r.now),
+    "import_source": 20,
+    "tail_number": 21,
+    "source": 22,
+}
+
+
+def _output_plan(fields):
+    """FLIGHT_OUTPUT_FIELDS as (name, row index, getter) triples for to_dict()."""
+    return tuple(
+        (name, getter, None) if type(getter) is int
+        else (name, None, _output_plan(getter) if isinstance(getter, dict) else getter)
+        for name, getter in fields.items()
+    )
+
+
+_OUTPUT_PLAN = _output_plan(FLIGHT_OUTPUT_FIELDS)
+
+
+def _build_output(plan, record, row):
+    output = {}
+    for name, index, getter in plan:
+        if getter is None:
+            output[name] = row[index]
+        elif type(getter) is tuple:
+            output[name] = _build_output(getter, record, row)
+        else:
+            output[name] = getter(record)
+    return output
+
+
+def _output_value(getter, record):
+    """Evaluate a FLIGHT_OUTPUT_FIELDS entry: a row index, getter or nested dict of them."""
+    if isinstance(getter, dict):
+        return {name: _output_value(get, record) for name, get in getter.items()}
+    if type(getter) is int:
+        return record.row[getter]
+    return getter(record)
+
+
+def _row_field(position):
+    return property(lambda record: record.row[position])
+
+
+for _position, _name in enumerate(FLIGHT_ROW_FIELDS):
+    setattr(FlightRecord, _name, _row_field(_position))
+
+
+def flight_records(rows, departures=None):
+    """Wrap rows as FlightRecords, reusing an already localized departure column."""
+    if departures is None:
+        return [FlightRecord(row) for row in rows]
+    return [FlightRecord(row, departure) for row, departure in zip(rows, departures)]
+
+
+def materialize_flights(records, fields=None):
+    """Output dicts for the surviving records.
+
+    Departures not yet localized and all arrivals are converted in one
+    batch per column, and every record shares one `now`. With `fields`,
+    each record builds only those fields and localizes lazily.
+    """
+    if fields:
+        now = current_timestamp()
+        flights = []
+        for record in records:
+            record.now = now
+            flights.append(record.project(fields))
+        return flights
+
+    pending = [record for record in records if record._departure_local is None]
+    if pending:
+        departures = localize_column([r.row[9] for r in pending], [r.dep_tz for r in pending])
+        for record, departure in zip(pending, departures):
+            record._departure_local = departure
+    arrivals = localize_column([record.row[10] for record in records])
+    now = current_timestamp()
     flights = []
-    seen_keys = set()
-
-    for row in tracked_rows:
-        flight = process_flight_row(row)
-        # Dedup key: date (in departure timezone) + route + flight number
-        dep_date = convert_date(flight["_departure_ts"], flight.get("_dep_tz"))
-        key = f"{dep_date}|{flight['departure']['airport_code']}|{flight['arrival']['airport_code']}|{flight['flight_number']}"
-        if key not in seen_keys:
-            seen_keys.add(key)
-            flights.append(flight)
-
-    for row in manual_rows:
-        flight = process_flight_row(row)
-        dep_date = convert_date(flight["_departure_ts"], flight.get("_dep_tz"))
-        key = f"{dep_date}|{flight['departure']['airport_code']}|{flight['arrival']['airport_code']}|{flight['flight_number']}"
-        if key not in seen_keys:
-            seen_keys.add(key)
-            flights.append(flight)
-
-    # Sort by departure time and limit
-    flights.sort(key=lambda f: f["_departure_ts"] or 0)
-    flights = flights[:limit]
-
-    # Remove internal keys
-    for f in flights:
-        del f["_departure_ts"]
-        f.pop("_dep_tz", None)
+    for record, arrival in zip(records, arrivals):
+        record._arrival_local = arrival
+        record.now = now
+        flights.append(record.to_dict())
+    return flights
+
+
+def process_flight_rows(rows, fields=None):
+    """Output dicts for 25-column rows, localizing each time column in one batch."""
+    return materialize_flights(flight_records(rows), fields)
+
+
+# Keyset pagination: --after takes the "<departure_ts>,<flight_id>" cursor
+# of the last flight on the previous page, and paged results carry
+# next_cursor while more may follow. (departure, flight_id) is a total
+# order, so each page is one indexed range scan however deep it is.
+
+def parse_field_list(value):
+    """Split a --fields value ("flight,route,departure.datetime") into paths."""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(",") if field.strip()] or None
+
+
+def parse_cursor(value):
+    """Parse an --after cursor into (departure_ts, flight_id); ValueError if malformed."""
+    departure, separator, flight_id = value.partition(",")
+    if not separator or not flight_id:
+        raise ValueError(f"Invalid cursor: {value}. Use <departure_ts>,<flight_id>")
+    return float(departure), flight_id
 
-    return {"flights": flights, "count": len(flights)}
 
+def make_cursor(row):
+    """Cursor for a 25-column row, resuming just after it."""
+    return f"{row[9]!r},{row[23]}"
 
-def get_next_flight(conn):
-    """Get the next upcoming flight."""
-    result = list_upcoming_flights(conn, limit=1)
+
+def page_key(row):
+    """Sort key of the keyset order."""
+    return (row[9] or 0, row[23] or "")
+
+
+def source_page_key(row):
+    """Keyset order listing tracked flights before manual ones (`date`)."""
+    return (row[22] == "manual",) + page_key(row)
+
+
+def paginate_rows(rows, after=None, limit=None, key=page_key):
+    """Sort rows into `key` order and cut the page after `after` (a key).
+
+    Returns (page, next_cursor); next_cursor is None on the last page.
+    """
+    rows = sorted(rows, key=key)
+    if after is not None:
+        rows = [row for row in rows if key(row) > after]
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    return rows[:limit], make_cursor(rows[limit - 1])
+
+
+def project_result(result, fields):
+    """Apply --fields to the flight lists of a result built without projection."""
+    if not fields or not isinstance(result, dict):
+        return result
+    for key in ("flights", "recent_flights", "results"):
+        if isinstance(result.get(key), list):
+            result[key] = [project_fields(flight, fields) for flight in result[key]]
+    if isinstance(result.get("next_flight"), dict):
+        result["next_flight"] = project_fields(result["next_flight"], fields)
+    for year in result.get("years") or []:
+        if "flights" in year:
+            year["flights"] = [project_fields(flight, fields) for flight in year["flights"]]
+    return result
+
+
+def register_sql_functions(conn):
+    """Expose the timezone engine and distance backfill to SQL.
+
+    local_date(ts, tz_name) is convert_date(); pair_distance(dep, arr) is
+    the great-circle km from pair_distances() (NULL without coordinates).
+    Deterministic, so SQLite may reuse results within a statement; the
+    underlying local_times() and per-pair caches make repeated calls cheap
+    anyway.
+    """
+    conn.create_function("local_date", 2, convert_date, deterministic=True)
+    conn.create_function("pair_distance", 2, lambda dep, arr: pair_distances(conn, [(dep, arr)])[0],
+                         deterministic=True)
+
+
+def query_upcoming_union(conn, now, main_user_id, include_friends, limit, after=None):
+    """Fetch the final upcoming rows in one statement.
+
+    Tracked and manual flights are combined with UNION ALL, friend and
+    superseded rows are filtered in SQL, and ROW_NUMBER() over the dedup
+    key (local date + route + flight number) keeps the tracked entry
+    first, mirroring the Python dedup. With a cursor, candidates start
+    ROUTE_KEY_WINDOW_SECONDS before it and the cursor applies after the
+    dedup, so earlier pages' duplicates stay suppressed. Ranking runs over a narrow
+    projection with ORDER BY ... LIMIT pushed into SQLite; the full
+    25-column rows are joined only for the `limit` survivors.
+    """
+    register_sql_functions(conn)
+
+    tracked_filter = ""
+    manual_filter = ""
+    params = [now]
+    manual_params = [now]
+    if not include_friends:
+        tracked_filter = """
+                AND uf.userId = ?
+                AND (uf.importSource IS NULL OR uf.importSource != 'CONNECTED_FRIEND')
+        """
+        params.append(main_user_id)
+    if main_user_id:
+        manual_filter = "AND umf.userId = ?"
+        manual_params.append(main_user_id)
+    survivor_filter = ""
+    survivor_params = []
+    if after is not None:
+        tracked_filter += f" AND {TRACKED_DEPARTURE} >= ?"
+        manual_filter += " AND mf.lastKnownDepartureDate >= ?"
+        params.append(after[0] - ROUTE_KEY_WINDOW_SECONDS)
+        manual_params.append(after[0] - ROUTE_KEY_WINDOW_SECONDS)
+        survivor_filter = "AND (departure, flight_key) > (?, ?)"
+        survivor_params = list(after)
+
+    # Only the survivors need tickets: narrow Ticket to their flights once
+    # (materialized) instead of scanning it for every survivor row.
+    survivor_joins = TRACKED_FLIGHT_JOINS.replace("LEFT JOIN Ticket t", "LEFT JOIN survivor_tickets t")
+
+    cursor = conn.execute(f"""
+        WITH candidates AS (
+            SELECT uf.rowid as link, f.id as flight_key, 0 as source_rank, f.number as flight_number,
+                   COALESCE(dep.iata, dep.icao) as dep_code,
+                   COALESCE(arr.iata, arr.icao) as arr_code,
+                   {TRACKED_DEPARTURE} as departure,
+                   dep.timeZoneIdentifier as dep_tz
+            FROM Flight f
+            JOIN UserFlight uf ON f.id = uf.flightId
+            JOIN Airline a ON f.airlineId = a.id
+            JOIN Airport dep ON f.departureAirportId = dep.id
+            JOIN Airport arr ON f.scheduledArrivalAirportId = arr.id
+            WHERE uf.isMyFlight = 1
+              AND {TRACKED_DEPARTURE} > ?
+              {tracked_filter}
+              AND f.id NOT IN (
+                  SELECT originalFlightId FROM ManualFlight
+                  WHERE originalFlightId IS NOT NULL AND originalFlightId != ''
+              )
+            UNION ALL
+            SELECT umf.rowid, mf.id, 1, mf.number,
+                   COALESCE(dep.iata, dep.icao),
+                   COALESCE(arr.iata, arr.icao),
+                   mf.lastKnownDepartureDate,
+                   dep.timeZoneIdentifier
+            FROM ManualFlight mf
+            JOIN UserManualFlight umf ON mf.id = umf.flightId
+            JOIN Airport dep ON mf.departureAirportId = dep.id
+            JOIN Airport arr ON mf.scheduledArrivalAirportId = arr.id
+            WHERE umf.isMyFlight = 1
+              AND umf.deleted IS NULL
+              AND mf.lastKnownDepartureDate > ?
+              {manual_filter}
+        ),
+        survivors AS (
+            SELECT link, flight_key, source_rank FROM (
+                SELECT link, flight_key, source_rank, departure, ROW_NUMBER() OVER (
+                    PARTITION BY local_date(departure, dep_tz), dep_code, arr_code, flight_number
+                    ORDER BY source_rank, departure, flight_key
+                ) as dup_rank
+                FROM candidates
+            )
+            WHERE dup_rank = 1 {survivor_filter}
+            ORDER BY departure, flight_key
+            LIMIT ?
+        ),
+        survivor_tickets AS MATERIALIZED (
+            SELECT * FROM Ticket
+            WHERE flightId IN (SELECT flight_key FROM survivors WHERE source_rank = 0)
+        )
+        SELECT {TRACKED_FLIGHT_COLUMNS}
+        {survivor_joins}
+        JOIN survivors s ON s.source_rank = 0 AND s.link = uf.rowid
+        UNION ALL
+        SELECT {MANUAL_FLIGHT_COLUMNS}
+        {MANUAL_FLIGHT_JOINS}
+        JOIN survivors s ON s.source_rank = 1 AND s.link = umf.rowid
+        ORDER BY departure, flight_id
+    """, params + manual_params + survivor_params + [limit])
+    return cursor.fetchall()
+
+
+def list_upcoming_flights(conn, limit=20, include_friends=False, engine="python",
+                          fields=None, after=None):
+    """List all upcoming flights with full details from both tables.
+
+    engine="union" runs the single-statement SQL path (query_upcoming_union)
+    so only the final `limit` rows are fetched and processed. `fields`
+    projects each flight; `after` is a parsed keyset cursor, and a full
+    page carries the next_cursor to continue from.
+    """
+    now = current_timestamp()
+    main_user_id = get_main_user_id(conn)
+
+    if engine == "union":
+        rows = query_upcoming_union(conn, now, main_user_id, include_friends, limit, after)
+        records = flight_records(backfill_distances(conn, rows))
+    else:
+        # Get flights from both tables
+        tracked_rows = query_tracked_upcoming(conn, now, main_user_id, include_friends, limit, after)
+        manual_rows = query_manual_upcoming(conn, now, main_user_id, limit, after)
+
+        # Combine (tracked first so they win the dedup); only the departure
+        # column is localized until the survivors are known
+        rows = backfill_distances(conn, tracked_rows + manual_rows)
+        departures = localize_column([row[9] for row in rows], [row[24] for row in rows])
+        records = []
+        seen_keys = set()
+        for record in flight_records(rows, departures):
+            key = record.dedup_key
+            if key not in seen_keys:
+                seen_keys.add(key)
+                records.append(record)
+        if after is not None:
+            # Look-back rows only served the dedup
+            records = [record for record in records if page_key(record.row) > after]
+
+        # Sort into keyset order and limit
+        records.sort(key=lambda record: page_key(record.row))
+        records = records[:limit]
+
+    flights = materialize_flights(records, fields)
+    result = {"flights": flights, "count": len(flights)}
+    if records and len(records) == limit:
+        result["next_cursor"] = make_cursor(records[-1].row)
+    return result
+
+
+def get_next_flight(conn, fields=None):
+    """Get the next upcoming flight (a single-row fetch via the union engine)."""
+    result = list_upcoming_flights(conn, limit=1, engine="union", fields=fields)
     if result["flights"]:
         return {"next_flight": result["flights"][0]}
     return {"next_flight": None, "message": "No upcoming flights found"}
 
 
-def get_flights_on_date(conn, date_str):
-    """Get flights on a specific date (YYYY-MM-DD format).
+def get_airport_zones(conn):
+    """Distinct departure-airport time zones ('' for airports without one)."""
+    return cached_state("airport_zones", lambda: [
+        tz or "" for (tz,) in conn.execute("SELECT DISTINCT timeZoneIdentifier FROM Airport")
+    ])
+
+
+def local_day_bounds(tz_names, start_date, end_date):
+    """UTC [start, end) bounds of a local date range, once per zone.
 
-    Uses a wide UTC window (target date -1 day to +1 day) then filters
-    in Python using each flight's departure airport timezone to handle
-    international flights correctly.
+    `start_date`/`end_date` are naive datetimes at local midnight; the end
+    date is inclusive. Unknown zones use UTC, matching local_times().
     """
-    cursor = conn.cursor()
-    main_user_id = get_main_user_id(conn)
+    bounds = []
+    for tz_name in tz_names:
+        zone = get_zone(tz_name or None) or timezone.utc
+        start = start_date.replace(tzinfo=zone).timestamp()
+        end = (end_date + timedelta(days=1)).replace(tzinfo=zone).timestamp()
+        bounds.append((tz_name, start, end))
+    return bounds
 
-    try:
-        target_date = datetime.strptime(date_str, "%Y-%m-%d")
-        # Use wide window to catch all timezone possibilities
-        start_ts = (target_date.replace(hour=0, minute=0, second=0)).timestamp() - 86400
-        end_ts = (target_date.replace(hour=23, minute=59, second=59)).timestamp() + 86400
-    except ValueError:
-        return {"error": f"Invalid date format: {date_str}. Use YYYY-MM-DD"}
 
-    flights = []
-    superseded_ids = get_superseded_flight_ids(conn)
+def query_flights_in_local_range(conn, start_date, end_date):
+    """Fetch 25-column rows departing within a local date range.
+
+    The range is turned into exact UTC bounds per airport time zone, which
+    SQL joins against each flight's departure airport - no per-row
+    timezone conversion and no padded window to filter afterwards (CROSS
+    JOIN keeps the bounds lookup inside the flight scan). Uses
+    the date-command filters: own, non-superseded tracked flights and
+    own, non-deleted manual flights. Rows are in departure order.
+    """
+    main_user_id = get_main_user_id(conn)
+    bounds = local_day_bounds(get_airport_zones(conn), start_date, end_date)
+    bounds_json = json.dumps(bounds)
+    lowest = min(start for _, start, _ in bounds)
+    highest = max(end for _, _, end in bounds)
 
-    # Build user filter
     user_filter = ""
-    params = [start_ts, end_ts]
+    manual_user_filter = ""
+    params = [bounds_json, lowest, highest]
+    manual_params = [lowest, highest]
     if main_user_id:
         user_filter = "AND uf.userId = ?"
+        manual_user_filter = "AND umf.userId = ?"
         params.append(main_user_id)
+        manual_params.append(main_user_id)
 
-    # Query tracked flights (exclude superseded)
-    cursor.execute(f"""
-        SELECT
-            a.iata as airline_code,
-            f.number as flight_number,
-            COALESCE(dep.iata, dep.icao) as dep_code,
-            COALESCE(arr.iata, arr.icao) as arr_code,
-            COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) as departure,
-            COALESCE(f.lastKnownArrivalDate, f.arrivalScheduleGateOriginal) as arrival,
-            t.pnr as confirmation,
-            t.seatNumber as seat,
-            t.cabinClass as cabin_class,
-            COALESCE(at.name, f.equipmentModelName) as aircraft,
-            f.equipmentTailNumber as tail_number,
-            f.id as flight_id,
-            dep.timeZoneIdentifier as dep_tz
-        FROM Flight f
-        JOIN UserFlight uf ON f.id = uf.flightId
-        JOIN Airline a ON f.airlineId = a.id
-        JOIN Airport dep ON f.departureAirportId = dep.id
-        JOIN Airport arr ON f.scheduledArrivalAirportId = arr.id
-        LEFT JOIN AircraftType at ON f.equipmentModelId = at.id
-        LEFT JOIN Ticket t ON f.id = t.flightId AND uf.userId = t.userId
-        WHERE uf.isMyFlight = 1
-          AND COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) >= ?
-          AND COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) <= ?
+    rows = conn.execute(f"""
+        WITH tz_bounds(tz, start_ts, end_ts) AS MATERIALIZED (
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]')
+            FROM json_each(?)
+        )
+        SELECT {TRACKED_FLIGHT_COLUMNS}
+        {TRACKED_FLIGHT_JOINS}
+        CROSS JOIN tz_bounds b
+        WHERE b.tz = COALESCE(dep.timeZoneIdentifier, '')
+          AND uf.isMyFlight = 1
+          AND {TRACKED_DEPARTURE} >= ? AND {TRACKED_DEPARTURE} < ?
+          AND {TRACKED_DEPARTURE} >= b.start_ts AND {TRACKED_DEPARTURE} < b.end_ts
           {user_filter}
+        UNION ALL
+        SELECT {MANUAL_FLIGHT_COLUMNS}
+        {MANUAL_FLIGHT_JOINS}
+        CROSS JOIN tz_bounds b
+        WHERE b.tz = COALESCE(dep.timeZoneIdentifier, '')
+          AND umf.isMyFlight = 1
+          AND umf.deleted IS NULL
+          AND mf.lastKnownDepartureDate >= ? AND mf.lastKnownDepartureDate < ?
+          AND mf.lastKnownDepartureDate >= b.start_ts AND mf.lastKnownDepartureDate < b.end_ts
+          {manual_user_filter}
         ORDER BY departure
-    """, params)
+    """, params + manual_params).fetchall()
 
-    for row in cursor.fetchall():
-        if row[11] in superseded_ids:
-            continue
-        dep_ts = row[4]
-        dep_tz = row[12]
-        # Filter by local date at departure airport
-        local_date = convert_date(dep_ts, dep_tz)
-        if local_date != date_str:
-            continue
-        flights.append({
-            "flight": f"{row[0]} {row[1]}" if row[0] else row[1],
-            "route": f"{row[2]} → {row[3]}",
-            "departure": format_datetime(dep_ts, dep_tz),
-            "arrival": format_datetime(row[5]),
-            "confirmation": row[6],
-            "seat": row[7],
-            "cabin_class": row[8],
-            "aircraft": row[9],
-            "tail_number": row[10],
-            "source": "tracked"
-        })
+    # Skip flights superseded by ManualFlight entries
+    superseded_ids = get_superseded_flight_ids(conn)
+    return [row for row in rows if row[23] not in superseded_ids]
 
-    # Query manual flights (filtered by user)
-    manual_user_filter = ""
-    manual_params = [start_ts, end_ts]
-    if main_user_id:
-        manual_user_filter = "AND umf.userId = ?"
-        manual_params.append(main_user_id)
 
-    cursor.execute(f"""
-        SELECT
-            a.iata as airline_code,
-            mf.number as flight_number,
-            COALESCE(dep.iata, dep.icao) as dep_code,
-            COALESCE(arr.iata, arr.icao) as arr_code,
-            mf.lastKnownDepartureDate as departure,
-            mf.lastKnownArrivalDate as arrival,
-            COALESCE(at.name, mf.equipmentModelName) as aircraft,
-            mf.equipmentTailNumber as tail_number,
-            dep.timeZoneIdentifier as dep_tz
-        FROM ManualFlight mf
-        JOIN UserManualFlight umf ON mf.id = umf.flightId
-        JOIN Airport dep ON mf.departureAirportId = dep.id
-        JOIN Airport arr ON mf.scheduledArrivalAirportId = arr.id
-        LEFT JOIN Airline a ON mf.airlineId = a.id
-        LEFT JOIN AircraftType at ON mf.equipmentModelId = at.id
-        WHERE umf.isMyFlight = 1
-          AND umf.deleted IS NULL
-          AND mf.lastKnownDepartureDate >= ?
-          AND mf.lastKnownDepartureDate <= ?
-          {manual_user_filter}
-        ORDER BY mf.lastKnownDepartureDate
-    """, manual_params)
+def get_flights_on_date(conn, date_str, after=None, limit=None):
+    """Get flights on a specific date (YYYY-MM-DD format).
 
-    for row in cursor.fetchall():
-        dep_ts = row[4]
-        dep_tz = row[8]
-        local_date = convert_date(dep_ts, dep_tz)
-        if local_date != date_str:
-            continue
-        # Manual flight numbers already include the operator prefix
-        flights.append({
-            "flight": row[1],
-            "route": f"{row[2]} → {row[3]}",
-            "departure": format_datetime(dep_ts, dep_tz),
-            "arrival": format_datetime(row[5]),
-            "confirmation": None,
-            "seat": None,
-            "cabin_class": None,
-            "aircraft": row[6],
-            "tail_number": row[7],
-            "source": "manual"
-        })
+    The date is the local date at each flight's departure airport, so
+    international flights land on the day printed on the boarding pass.
+    Tracked flights are listed before manual ones, each by departure, and
+    pages (`after` cursor or `limit`) follow the same order.
+    """
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return {"error": f"Invalid date format: {date_str}. Use YYYY-MM-DD"}
 
-    return {"date": date_str, "flights": flights, "count": len(flights)}
+    rows = query_flights_in_local_range(conn, target_date, target_date)
+    if after is not None:
+        # The cursor names a flight id; which group it resumes in comes from
+        # the table holding it, even if the flight has since been removed
+        is_manual = conn.execute("SELECT 1 FROM ManualFlight WHERE id = ?", (after[1],)).fetchone()
+        after = (is_manual is not None,) + tuple(after)
+    rows, next_cursor = paginate_rows(rows, after, limit, key=source_page_key)
+    flights = [date_flight_summary(row) for row in rows]
+    result = {"date": date_str, "flights": flights, "count": len(flights)}
+    if next_cursor:
+        result["next_cursor"] = next_cursor
+    return result
+
+
+def get_flights_in_range(conn, start_str, end_str):
+    """Get flights departing between two local dates (inclusive), in order."""
+    try:
+        start_date = datetime.strptime(start_str, "%Y-%m-%d")
+        end_date = datetime.strptime(end_str, "%Y-%m-%d")
+    except ValueError:
+        return {"error": f"Invalid date range: {start_str} {end_str}. Use YYYY-MM-DD YYYY-MM-DD"}
+    if end_date < start_date:
+        return {"error": f"Range end {end_str} is before start {start_str}"}
+
+    rows = query_flights_in_local_range(conn, start_date, end_date)
+    flights = [{"date": convert_date(row[9], row[24]), **date_flight_summary(row)} for row in rows]
+    return {"start": start_str, "end": end_str, "flights": flights, "count": len(flights)}
 
 
 def search_by_confirmation(conn, pnr):
@@ -536,7 +1198,7 @@ def search_by_confirmation(conn, pnr):
 def get_flight_stats(conn):
     """Get flight statistics from both tables (filtered by primary user)."""
     cursor = conn.cursor()
-    now = datetime.now(tz=timezone.utc).timestamp()
+    now = current_timestamp()
     main_user_id = get_main_user_id(conn)
 
     # Stats from tracked flights
@@ -579,9 +1241,42 @@ def get_flight_stats(conn):
     """, manual_params)
     manual = cursor.fetchone()
 
+    # Flights without a stored distance, counted per airport pair so each
+    # pair's great-circle distance is computed once
+    cursor.execute(f"""
+        SELECT dep_code, arr_code, COUNT(*) FROM (
+            SELECT COALESCE(dep.iata, dep.icao) as dep_code, COALESCE(arr.iata, arr.icao) as arr_code
+            FROM Flight f
+            JOIN UserFlight uf ON f.id = uf.flightId
+            JOIN Airport dep ON f.departureAirportId = dep.id
+            JOIN Airport arr ON f.scheduledArrivalAirportId = arr.id
+            WHERE uf.isMyFlight = 1
+              AND uf.deleted IS NULL
+              AND f.distance IS NULL
+              {user_filter}
+            UNION ALL
+            SELECT COALESCE(dep.iata, dep.icao), COALESCE(arr.iata, arr.icao)
+            FROM ManualFlight mf
+            JOIN UserManualFlight umf ON mf.id = umf.flightId
+            JOIN Airport dep ON mf.departureAirportId = dep.id
+            JOIN Airport arr ON mf.scheduledArrivalAirportId = arr.id
+            WHERE umf.isMyFlight = 1
+              AND umf.deleted IS NULL
+              AND mf.distance IS NULL
+              {manual_filter}
+        )
+        GROUP BY dep_code, arr_code
+    """, params[1:] + manual_params[1:])
+    missing = cursor.fetchall()
+    backfilled_km = sum(
+        count * km
+        for (_, _, count), km in zip(missing, pair_distances(conn, [(dep, arr) for dep, arr, _ in missing]))
+        if km is not None
+    )
+
     total_flights = (tracked[0] or 0) + (manual[0] or 0)
     upcoming_flights = (tracked[1] or 0) + (manual[1] or 0)
-    total_km = (tracked[2] or 0) + (manual[2] or 0)
+    total_km = (tracked[2] or 0) + (manual[2] or 0) + backfilled_km
 
     return {
         "total_flights": total_flights,
@@ -590,202 +1285,352 @@ def get_flight_stats(conn):
         "total_distance_miles": int(total_km * 0.621371),
         "earth_circumferences": round(total_km / 40075, 2),
         "tracked_flights": tracked[0] or 0,
-        "manual_flights": manual[0] or 0
+        "manual_flights": manual[0] or 0,
+        "backfilled_distance_flights": sum(count for _, _, count in missing)
     }
 
 
-def get_flights_by_year(conn, year):
-    """Get all flights in a given year from both tables.
+def query_stats_breakdown(conn, start_ts=None, end_ts=None, local_dates=None):
+    """Group the deduped history by route, airport, airline, aircraft and cabin.
 
-    Filters out cancelled flights and deduplicates codeshare/reimport entries
-    by preferring the entry with a tail number for the same route+date.
+    One statement: the history is route-deduped in SQL (same preference as
+    dedup_by_route(): tail number, then tracked, then earliest) into a
+    materialized CTE, which every GROUP BY then reads. Missing distances
+    are backfilled there (pair_distance()) before any SUM, and a
+    'backfilled' row counts them. `local_dates`, a (first, last)
+    YYYY-MM-DD pair (either may be None), further limits the history by
+    local departure date.
+    Returns rows of (dimension, key, label, count, distance_km).
     """
-    cursor = conn.cursor()
-    main_user_id = get_main_user_id(conn)
+    register_sql_functions(conn)
+    history_sql, params = history_union_sql(get_main_user_id(conn), start_ts, end_ts)
+    date_filter = ""
+    params = list(params)
+    first, last = local_dates or (None, None)
+    if first:
+        date_filter += " AND route_date >= ?"
+        params.append(first)
+    if last:
+        date_filter += " AND route_date <= ?"
+        params.append(last)
+    return conn.execute(f"""
+        WITH history AS ({history_sql}),
+        deduped AS MATERIALIZED (
+            SELECT *, COALESCE(distance_km, pair_distance(dep_code, arr_code)) AS filled_km FROM (
+                SELECT history.*, local_date(departure, dep_tz) AS route_date, ROW_NUMBER() OVER (
+                    PARTITION BY local_date(departure, dep_tz), dep_code, arr_code
+                    ORDER BY COALESCE(tail_number, '') = '', source = 'manual', departure, flight_id
+                ) AS route_rank
+                FROM history
+            )
+            WHERE route_rank = 1 {date_filter}
+        )
+        SELECT 'total', NULL, NULL, COUNT(*), SUM(filled_km) FROM deduped
+        UNION ALL
+        SELECT 'backfilled', NULL, NULL, COUNT(*), SUM(filled_km) FROM deduped WHERE distance_km IS NULL
+        UNION ALL
+        SELECT 'route', dep_code || ' → ' || arr_code, NULL, COUNT(*), SUM(filled_km)
+        FROM deduped GROUP BY dep_code, arr_code
+        UNION ALL
+        SELECT 'airport', code, MAX(name), COUNT(*), NULL FROM (
+            SELECT dep_code AS code, dep_airport AS name FROM deduped
+            UNION ALL
+            SELECT arr_code, arr_airport FROM deduped
+        ) GROUP BY code
+        UNION ALL
+        SELECT 'airline', airline_code, MAX(airline_name), COUNT(*), SUM(filled_km)
+        FROM deduped GROUP BY airline_code
+        UNION ALL
+        SELECT 'aircraft', aircraft, NULL, COUNT(*), SUM(filled_km)
+        FROM deduped GROUP BY aircraft
+        UNION ALL
+        SELECT 'cabin', cabin_class, NULL, COUNT(*), SUM(filled_km)
+        FROM deduped GROUP BY cabin_class
+    """, params).fetchall()
 
-    start_ts = datetime(year, 1, 1).timestamp()
-    end_ts = datetime(year, 12, 31, 23, 59, 59).timestamp()
 
-    flights = []
-    # route_key -> flight dict (for route-level dedup that prefers tail numbers)
-    route_map = {}
+def get_stats_breakdown(conn, db_path=None, year=None, since=None, until=None, top=10):
+    """Top routes, airports, airlines, aircraft and cabin mix.
+
+    Optional year or YYYY-MM-DD since/until bounds. Grouped rows are cached
+    per database fingerprint, so repeat queries (e.g. through the daemon)
+    skip the scan until Flighty writes again.
+    """
+    # Both kinds of bound apply to the local departure date, like `years`
+    if year is not None:
+        local_dates = (f"{year}-01-01", f"{year}-12-31")
+    else:
+        local_dates = (since, until) if since or until else None
+    start_ts, end_ts = local_date_window(*local_dates) if local_dates else (None, None)
+
+    fingerprint = database_fingerprint(conn, db_path) if db_path else None
+    grouped = cached_state(
+        ("stats_breakdown", fingerprint, start_ts, end_ts, local_dates),
+        lambda: query_stats_breakdown(conn, start_ts, end_ts, local_dates),
+    )
+
+    dimensions = {}
+    total_count, total_km, backfilled = 0, 0, 0
+    for dimension, key, label, count, distance_km in grouped:
+        if dimension == "total":
+            total_count, total_km = count, distance_km or 0
+        elif dimension == "backfilled":
+            backfilled = count
+        else:
+            dimensions.setdefault(dimension, []).append((key, label, count, distance_km or 0))
+
+    def ranked(dimension):
+        entries = sorted(dimensions.get(dimension, []), key=lambda e: (-e[2], e[0] or ""))
+        return entries[:top] if top else entries
+
+    def share(count):
+        return round(100 * count / total_count, 1) if total_count else 0
+
+    return {
+        "filters": {"year": year, "since": since, "until": until},
+        "total_flights": total_count,
+        "total_distance_km": total_km,
+        "total_distance_miles": int(total_km * 0.621371),
+        "backfilled_distance_flights": backfilled,
+        "routes": [
+            {"route": key, "count": count, "distance_km": km}
+            for key, _, count, km in ranked("route")
+        ],
+        "airports": [
+            {"code": key, "name": label, "visits": count}
+            for key, label, count, _ in ranked("airport")
+        ],
+        "airlines": [
+            {"code": key, "name": label, "count": count, "share": share(count)}
+            for key, label, count, _ in ranked("airline")
+        ],
+        "aircraft": [
+            {"aircraft": key, "count": count, "share": share(count)}
+            for key, _, count, _ in ranked("aircraft")
+        ],
+        "cabins": [
+            {"cabin_class": key, "count": count, "share": share(count)}
+            for key, _, count, _ in ranked("cabin")
+        ],
+    }
 
-    # Get Flight IDs superseded by ManualFlight entries
+
+def query_history_rows(conn, start_ts=None, end_ts=None):
+    """Fetch the main user's flight history as 25-column rows.
+
+    Applies the year-command filters: own, non-deleted flights, no
+    CONNECTED_FRIEND imports, and no tracked flights superseded by a
+    ManualFlight. Tracked rows come first, each source in departure
+    order. Optional bounds limit the departure timestamp range.
+    """
+    cursor = conn.cursor()
+    main_user_id = get_main_user_id(conn)
     superseded_ids = get_superseded_flight_ids(conn)
 
-    # Query tracked flights (exclude cancelled and superseded)
+    range_filter = ""
+    manual_range_filter = ""
+    range_params = []
+    if start_ts is not None:
+        range_filter += f" AND {TRACKED_DEPARTURE} >= ?"
+        manual_range_filter += " AND mf.lastKnownDepartureDate >= ?"
+        range_params.append(start_ts)
+    if end_ts is not None:
+        range_filter += f" AND {TRACKED_DEPARTURE} <= ?"
+        manual_range_filter += " AND mf.lastKnownDepartureDate <= ?"
+        range_params.append(end_ts)
+
+    # Query tracked flights (exclude friends and superseded)
     user_filter = ""
-    params = [start_ts, end_ts]
+    params = list(range_params)
     if main_user_id:
         user_filter = "AND uf.userId = ? AND (uf.importSource IS NULL OR uf.importSource != 'CONNECTED_FRIEND')"
-        params = [start_ts, end_ts, main_user_id]
+        params.append(main_user_id)
 
     cursor.execute(f"""
-        SELECT
-            a.iata as airline_code,
-            a.name as airline_name,
-            f.number as flight_number,
-            COALESCE(dep.iata, dep.icao) as dep_code,
-            dep.name as dep_airport,
-            dep.city as dep_city,
-            COALESCE(arr.iata, arr.icao) as arr_code,
-            arr.name as arr_airport,
-            arr.city as arr_city,
-            COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) as departure,
-            COALESCE(f.lastKnownArrivalDate, f.arrivalScheduleGateOriginal) as arrival,
-            t.pnr as confirmation,
-            t.seatNumber as seat,
-            t.cabinClass as cabin_class,
-            COALESCE(at.name, f.equipmentModelName) as aircraft,
-            f.departureTerminal as dep_terminal,
-            f.departureGate as dep_gate,
-            f.arrivalTerminal as arr_terminal,
-            f.arrivalGate as arr_gate,
-            f.distance as distance_km,
-            uf.importSource as import_source,
-            f.equipmentTailNumber as tail_number,
-            'tracked' as source,
-            f.id as flight_id,
-            dep.timeZoneIdentifier as dep_tz
-        FROM Flight f
-        JOIN UserFlight uf ON f.id = uf.flightId
-        JOIN Airline a ON f.airlineId = a.id
-        JOIN Airport dep ON f.departureAirportId = dep.id
-        JOIN Airport arr ON f.scheduledArrivalAirportId = arr.id
-        LEFT JOIN AircraftType at ON f.equipmentModelId = at.id
-        LEFT JOIN Ticket t ON f.id = t.flightId AND uf.userId = t.userId
+        SELECT {TRACKED_FLIGHT_COLUMNS}
+        {TRACKED_FLIGHT_JOINS}
         WHERE uf.isMyFlight = 1
           AND uf.deleted IS NULL
-          AND COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) >= ?
-          AND COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) <= ?
+          {range_filter}
           {user_filter}
-        ORDER BY departure
+        ORDER BY departure, f.id
     """, params)
 
-    for row in cursor.fetchall():
-        # Skip flights superseded by ManualFlight entries
-        flight_id = row[23]
-        if flight_id in superseded_ids:
-            continue
-
-        flight = process_flight_row(row)
-        dep_date = convert_date(flight["_departure_ts"], flight.get("_dep_tz"))
-
-        # Route-level dedup key: same date + same dep/arr airports
-        route_key = f"{dep_date}|{flight['departure']['airport_code']}|{flight['arrival']['airport_code']}"
-        has_tail = bool(flight.get("tail_number"))
-
-        if route_key in route_map:
-            existing = route_map[route_key]
-            existing_has_tail = bool(existing.get("tail_number"))
-            # Prefer the entry with a tail number (actually operated)
-            if has_tail and not existing_has_tail:
-                route_map[route_key] = flight
-            # If both have tails (or both don't), keep the first one
-        else:
-            route_map[route_key] = flight
+    # Skip flights superseded by ManualFlight entries
+    rows = [row for row in cursor.fetchall() if row[23] not in superseded_ids]
 
     # Query manual flights (filtered by user)
     manual_user_filter = ""
-    manual_params = [start_ts, end_ts]
+    manual_params = list(range_params)
     if main_user_id:
         manual_user_filter = "AND umf.userId = ?"
         manual_params.append(main_user_id)
 
     cursor.execute(f"""
-        SELECT
-            a.iata as airline_code,
-            a.name as airline_name,
-            mf.number as flight_number,
-            COALESCE(dep.iata, dep.icao) as dep_code,
-            dep.name as dep_airport,
-            dep.city as dep_city,
-            COALESCE(arr.iata, arr.icao) as arr_code,
-            arr.name as arr_airport,
-            arr.city as arr_city,
-            mf.lastKnownDepartureDate as departure,
-            mf.lastKnownArrivalDate as arrival,
-            NULL as confirmation,
-            NULL as seat,
-            NULL as cabin_class,
-            COALESCE(at.name, mf.equipmentModelName) as aircraft,
-            mf.departureTerminal as dep_terminal,
-            mf.departureGate as dep_gate,
-            mf.arrivalTerminal as arr_terminal,
-            mf.arrivalGate as arr_gate,
-            mf.distance as distance_km,
-            'MANUAL' as import_source,
-            mf.equipmentTailNumber as tail_number,
-            'manual' as source,
-            NULL as flight_id,
-            dep.timeZoneIdentifier as dep_tz
-        FROM ManualFlight mf
-        JOIN UserManualFlight umf ON mf.id = umf.flightId
-        JOIN Airport dep ON mf.departureAirportId = dep.id
-        JOIN Airport arr ON mf.scheduledArrivalAirportId = arr.id
-        LEFT JOIN Airline a ON mf.airlineId = a.id
-        LEFT JOIN AircraftType at ON mf.equipmentModelId = at.id
+        SELECT {MANUAL_FLIGHT_COLUMNS}
+        {MANUAL_FLIGHT_JOINS}
         WHERE umf.isMyFlight = 1
           AND umf.deleted IS NULL
-          AND mf.lastKnownDepartureDate >= ?
-          AND mf.lastKnownDepartureDate <= ?
+          {manual_range_filter}
           {manual_user_filter}
-        ORDER BY mf.lastKnownDepartureDate
+        ORDER BY mf.lastKnownDepartureDate, mf.id
     """, manual_params)
 
-    for row in cursor.fetchall():
-        flight = process_flight_row(row)
-        dep_date = convert_date(flight["_departure_ts"], flight.get("_dep_tz"))
-
-        route_key = f"{dep_date}|{flight['departure']['airport_code']}|{flight['arrival']['airport_code']}"
-        has_tail = bool(flight.get("tail_number"))
-
-        if route_key in route_map:
-            existing = route_map[route_key]
-            existing_has_tail = bool(existing.get("tail_number"))
-            if has_tail and not existing_has_tail:
-                route_map[route_key] = flight
-        else:
-            route_map[route_key] = flight
+    return backfill_distances(conn, rows + cursor.fetchall())
 
-    # Build final list from route_map
-    flights = list(route_map.values())
 
-    # Sort chronologically
-    flights.sort(key=lambda f: f["_departure_ts"] or 0)
+def dedup_by_route(rows, dep_dates):
+    """Deduplicate codeshare/reimport rows by local date + dep/arr airports.
 
-    # Compute summary stats
-    total_km = sum(f.get("distance_km") or 0 for f in flights)
+    `dep_dates` is the parallel column of local departure dates. The first
+    row per route key wins unless a later one has a tail number and the
+    kept one does not (the tail-number entry actually operated). Returns
+    surviving (row, dep_date) pairs in first-seen order.
+    """
+    route_map = {}
+    for row, dep_date in zip(rows, dep_dates):
+        route_key = f"{dep_date}|{row[3]}|{row[6]}"
+        existing = route_map.get(route_key)
+        if existing is None or (row[21] and not existing[0][21]):
+            route_map[route_key] = (row, dep_date)
+    return list(route_map.values())
 
-    # Remove internal keys
-    for f in flights:
-        del f["_departure_ts"]
-        f.pop("_dep_tz", None)
 
+def _summarize_flights(rows):
+    total_km = sum(row[19] or 0 for row in rows)
     return {
-        "year": year,
-        "flights": flights,
-        "count": len(flights),
+        "count": len(rows),
         "total_distance_km": total_km,
         "total_distance_miles": int(total_km * 0.621371) if total_km else 0
     }
 
 
-def get_recent_flights(conn, limit=20):
-    """Get recent/past flights from both tables (filtered by primary user)."""
+# Local times run at most 14 hours either side of UTC, so a day of padding
+# around the UTC year catches every departure whose local date is in it
+LOCAL_YEAR_PADDING_SECONDS = 86400
+
+
+def local_year_window(year):
+    """Padded UTC departure bounds for the flights of a local-date year.
+
+    Every year filter buckets by the local departure date at the departure
+    airport, like get_flights_by_all_years(); callers scan this window and
+    keep rows whose local date starts with the year.
+    """
+    return local_date_window(f"{year}-01-01", f"{year}-12-31")
+
+
+def local_date_window(since=None, until=None):
+    """Padded UTC departure bounds for local departure dates since..until.
+
+    Either YYYY-MM-DD bound may be None (unbounded); ValueError if one is
+    malformed. Like local_year_window(), callers scan this window and keep
+    rows whose local departure date falls within the bounds, so results do
+    not depend on the machine's timezone.
+    """
+    start_ts = end_ts = None
+    if since:
+        start = datetime.strptime(since, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        start_ts = start.timestamp() - LOCAL_YEAR_PADDING_SECONDS
+    if until:
+        end = datetime.strptime(until, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+        end_ts = end.timestamp() + LOCAL_YEAR_PADDING_SECONDS
+    return start_ts, end_ts
+
+
+def get_flights_by_year(conn, year, fields=None, after=None, limit=None):
+    """Get all flights in a given year from both tables.
+
+    Filters out cancelled flights and deduplicates codeshare/reimport entries
+    by preferring the entry with a tail number for the same route+date.
+    The year is that of the local departure date, as in `years`.
+    A paged call (`after` cursor or `limit`) returns one page in keyset
+    order, with count and distance totals covering that page.
+    """
+    start_ts, end_ts = local_year_window(year)
+    paged = after is not None or limit is not None
+
+    # Route groups span at most a day, so starting a window early lets any
+    # group straddling the cursor dedup exactly as it did on earlier pages
+    scan_start = max(start_ts, after[0] - ROUTE_KEY_WINDOW_SECONDS) if after else start_ts
+    rows = query_history_rows(conn, scan_start, end_ts)
+    departures = localize_column([row[9] for row in rows], [row[24] for row in rows])
+    prefix = f"{year}-"
+    survivors = [row for row, dep_date in dedup_by_route(rows, [d[2] for d in departures])
+                 if dep_date and dep_date.startswith(prefix)]
+
+    next_cursor = None
+    if paged:
+        survivors, next_cursor = paginate_rows(survivors, after, limit)
+    else:
+        # Sort chronologically
+        survivors.sort(key=lambda row: row[9] or 0)
+    flights = process_flight_rows(survivors, fields)
+
+    result = {"year": year, "flights": flights, **_summarize_flights(survivors)}
+    if next_cursor:
+        result["next_cursor"] = next_cursor
+    return result
+
+
+def get_flights_by_all_years(conn, summary_only=False, idx=None):
+    """Get the whole history bucketed by year in a single pass.
+
+    One scan of both tables, one batch timezone conversion, and the same
+    route-level dedup as get_flights_by_year(). Years are bucketed by the
+    local departure date at the departure airport, so a New Year's Eve
+    departure lands in the year printed on the boarding pass. With
+    summary_only, per-year flight lists are omitted. Given the sidecar
+    index `idx`, the history is read from it instead.
+    """
+    rows = indexed_history_rows(conn, idx) if idx is not None else query_history_rows(conn)
+    departures = localize_column([row[9] for row in rows], [row[24] for row in rows])
+
+    buckets = {}
+    for row, dep_date in dedup_by_route(rows, [d[2] for d in departures]):
+        if dep_date:
+            buckets.setdefault(int(dep_date[:4]), []).append(row)
+
+    years = []
+    all_rows = []
+    for year in sorted(buckets):
+        year_rows = sorted(buckets[year], key=lambda row: row[9] or 0)
+        all_rows.extend(year_rows)
+        entry = {"year": year, **_summarize_flights(year_rows)}
+        if not summary_only:
+            entry["flights"] = process_flight_rows(year_rows)
+        years.append(entry)
+
+    totals = _summarize_flights(all_rows)
+    return {
+        "years": years,
+        "year_count": len(years),
+        "total_flights": totals["count"],
+        "total_distance_km": totals["total_distance_km"],
+        "total_distance_miles": totals["total_distance_miles"]
+    }
+
+
+def get_recent_flights(conn, limit=20, after=None):
+    """Get recent/past flights from both tables (filtered by primary user).
+
+    Newest first; `after` is a parsed keyset cursor continuing into older
+    flights, and a full page carries the next_cursor.
+    """
     cursor = conn.cursor()
-    now = datetime.now(tz=timezone.utc).timestamp()
+    now = current_timestamp()
     main_user_id = get_main_user_id(conn)
     superseded_ids = get_superseded_flight_ids(conn)
 
-    flights = []
-
     # Build user filter
     user_filter = ""
     params = [now]
     if main_user_id:
         user_filter = "AND uf.userId = ?"
         params.append(main_user_id)
+    if after is not None:
+        user_filter += f" AND ({TRACKED_DEPARTURE}, f.id) < (?, ?)"
+        params.extend(after)
 
     # Query tracked flights (exclude superseded)
     cursor.execute(f"""
@@ -811,24 +1656,12 @@ def get_recent_flights(conn, limit=20):
           AND uf.deleted IS NULL
           AND COALESCE(f.lastKnownDepartureDate, f.departureScheduleGateOriginal) < ?
           {user_filter}
-        ORDER BY departure DESC
+        ORDER BY departure DESC, f.id DESC
         LIMIT ?
     """, params + [limit * 2])
 
-    for row in cursor.fetchall():
-        if row[9] in superseded_ids:
-            continue
-        dep_tz = row[10]
-        flights.append({
-            "flight": f"{row[0]} {row[1]}" if row[0] else row[1],
-            "route": f"{row[2]} → {row[3]}",
-            "date": convert_date(row[4], dep_tz),
-            "aircraft": row[5],
-            "distance_km": row[6],
-            "tail_number": row[7],
-            "source": row[8],
-            "_ts": row[4]
-        })
+    # Keep bare rows until the limit is applied; dicts are built for survivors only
+    candidates = [row for row in cursor.fetchall() if row[9] not in superseded_ids]
 
     # Query manual flights (filtered by user)
     manual_filter = ""
@@ -836,6 +1669,9 @@ def get_recent_flights(conn, limit=20):
     if main_user_id:
         manual_filter = "AND umf.userId = ?"
         manual_params.append(main_user_id)
+    if after is not None:
+        manual_filter += " AND (mf.lastKnownDepartureDate, mf.id) < (?, ?)"
+        manual_params.extend(after)
 
     cursor.execute(f"""
         SELECT
@@ -848,6 +1684,7 @@ def get_recent_flights(conn, limit=20):
             mf.distance as distance_km,
             mf.equipmentTailNumber as tail_number,
             'manual' as source,
+            mf.id as flight_id,
             dep.timeZoneIdentifier as dep_tz
         FROM ManualFlight mf
         JOIN UserManualFlight umf ON mf.id = umf.flightId
@@ -859,93 +1696,2432 @@ def get_recent_flights(conn, limit=20):
           AND umf.deleted IS NULL
           AND mf.lastKnownDepartureDate < ?
           {manual_filter}
-        ORDER BY mf.lastKnownDepartureDate DESC
+        ORDER BY mf.lastKnownDepartureDate DESC, mf.id DESC
         LIMIT ?
     """, manual_params + [limit * 2])
 
-    for row in cursor.fetchall():
-        dep_tz = row[9]
-        # Manual flight numbers already include the operator prefix
+    candidates.extend(cursor.fetchall())
+
+    # Sort newest first in keyset order and limit
+    candidates.sort(key=lambda row: (row[4] or 0, row[9] or ""), reverse=True)
+    candidates = backfill_distances(conn, candidates[:limit], dep=2, arr=3, distance=6)
+
+    # Localize the surviving rows in one batch
+    local = localize_column([row[4] for row in candidates], [row[10] for row in candidates])
+    flights = []
+    for row, (_, _, local_date) in zip(candidates, local):
         flights.append({
-            "flight": row[1],
+            # Manual flight numbers already include the operator prefix
+            "flight": row[1] if row[8] == "manual" else (f"{row[0]} {row[1]}" if row[0] else row[1]),
             "route": f"{row[2]} → {row[3]}",
-            "date": convert_date(row[4], dep_tz),
+            "date": local_date,
             "aircraft": row[5],
             "distance_km": row[6],
             "tail_number": row[7],
-            "source": row[8],
-            "_ts": row[4]
+            "source": row[8]
         })
 
-    # Sort by date descending and limit
-    flights.sort(key=lambda f: f["_ts"] or 0, reverse=True)
-    flights = flights[:limit]
+    result = {"recent_flights": flights, "count": len(flights)}
+    if candidates and len(candidates) == limit:
+        last = candidates[-1]
+        result["next_cursor"] = f"{last[4]!r},{last[9]}"
+    return result
 
-    # Remove internal sort key
-    for f in flights:
-        del f["_ts"]
 
-    return {"recent_flights": flights, "count": len(flights)}
+# ---------------------------------------------------------------------------
+# Journeys
+# ---------------------------------------------------------------------------
+#
+# `journeys` groups the deduped history into trips. Flights are sorted by
+# departure once and linked in a single pass: a gap up to the layover
+# threshold is a connection, and a longer gap continues the same trip
+# unless it is already back at its origin. A flight leaving more than the
+# maximum stay after the trip's first departure always starts a new one. Trips
+# are returned with origin, destination (the longest stay away from the
+# origin), elapsed time and segments.
 
+DEFAULT_LAYOVER_HOURS = 24
+DEFAULT_MAX_STAY_DAYS = 14
 
-def main():
-    """Main entry point."""
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "Usage: query_flights.py <command> [args]"}))
-        sys.exit(1)
+# Segment fields built for each flight of a journey
+JOURNEY_SEGMENT_FIELDS = [
+    "flight", "route", "departure.datetime", "arrival.datetime",
+    "duration", "confirmation", "seat", "aircraft",
+]
 
-    command = sys.argv[1] if not sys.argv[1].startswith("--") else "list"
 
-    # Check database
-    db_path, error = get_db_path()
-    if error:
-        print(json.dumps({"error": error}))
-        sys.exit(1)
+def format_elapsed(seconds):
+    """Format a span as "3d 4h 5m" (days omitted when zero)."""
+    if seconds is None:
+        return None
+    days, remainder = divmod(int(seconds), 86400)
+    hours, remainder = divmod(remainder, 3600)
+    text = f"{hours}h {remainder // 60}m"
+    return f"{days}d {text}" if days else text
 
-    # Execute command
-    try:
-        conn = sqlite3.connect(db_path)
-
-        if command == "list" or command == "--list":
-            limit = 20
-            include_friends = False
-            for arg in sys.argv[2:]:
-                if arg == "--include-friends":
-                    include_friends = True
-                elif arg.isdigit():
-                    limit = int(arg)
-            result = list_upcoming_flights(conn, limit, include_friends)
-        elif command == "next" or command == "--next":
-            result = get_next_flight(conn)
-        elif command == "date" or command == "--date":
-            if len(sys.argv) < 3:
-                result = {"error": "Usage: query_flights.py date YYYY-MM-DD"}
-            else:
-                result = get_flights_on_date(conn, sys.argv[2])
-        elif command == "pnr" or command == "--pnr":
-            if len(sys.argv) < 3:
-                result = {"error": "Usage: query_flights.py pnr <confirmation_code>"}
-            else:
-                result = search_by_confirmation(conn, sys.argv[2])
-        elif command == "stats" or command == "--stats":
-            result = get_flight_stats(conn)
-        elif command == "year" or command == "--year":
-            if len(sys.argv) < 3:
-                result = {"error": "Usage: query_flights.py year YYYY"}
-            else:
-                try:
-                    year = int(sys.argv[2])
-                    result = get_flights_by_year(conn, year)
-                except ValueError:
-                    result = {"error": f"Invalid year: {sys.argv[2]}. Use YYYY format"}
-        elif command == "recent" or command == "--recent":
-            limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
-            result = get_recent_flights(conn, limit)
-        else:
-            result = {"error": f"Unknown command: {command}. Use: list, next, date, year, pnr, stats, recent"}
 
-        conn.close()
-        print(json.dumps(result, indent=2))
+def link_journeys(rows, layover_seconds, max_stay_seconds):
+    """Split departure-sorted 25-column rows into journeys (lists of rows).
+
+    `max_stay_seconds` caps a journey's length: a flight departing later
+    than that after the first one starts a new journey, even when it is a
+    connection.
+    """
+    journeys = []
+    current = None
+    origin = started = last_arrival = None
+    for row in rows:
+        if row[9] is None:
+            continue
+        if current is not None:
+            gap = row[9] - last_arrival
+            if row[9] - started > max_stay_seconds or (gap > layover_seconds and current[-1][6] == origin):
+                current = None  # Away too long, or already home again
+        if current is None:
+            current = []
+            journeys.append(current)
+            origin, started = row[3], row[9]
+        current.append(row)
+        last_arrival = max(row[10] or row[9], row[9])
+    return journeys
+
+
+def summarize_journey(rows, segments, layover_seconds):
+    """Journey dict from its rows and their output segments."""
+    origin = rows[0][3]
+    final = rows[-1][6]
+    stays = []
+    for index, (previous, row) in enumerate(zip(rows, rows[1:]), start=1):
+        ground = row[9] - (previous[10] or previous[9])
+        segments[index]["ground_time"] = format_elapsed(ground)
+        if ground > layover_seconds:
+            stays.append((ground, previous[6]))
+    returned = final == origin and len(rows) > 1
+    if returned:
+        away = [stay for stay in stays if stay[1] != origin]
+        # With no long stay, the turnaround is the farthest point of the chain
+        destination = max(away)[1] if away else rows[(len(rows) - 1) // 2][6]
+    else:
+        destination = final
+
+    stops = [origin]
+    for row in rows:
+        if row[3] != stops[-1]:
+            stops.append(row[3])  # Open jaw: continued from another airport
+        stops.append(row[6])
+
+    start = rows[0][9]
+    end = max(rows[-1][10] or rows[-1][9], rows[-1][9])
+    return {
+        "origin": origin,
+        "destination": destination,
+        "round_trip": returned,
+        "departure": local_times(start, rows[0][24])[0],
+        "arrival": local_times(end)[0],
+        "elapsed": format_elapsed(end - start),
+        "elapsed_hours": round((end - start) / 3600, 1),
+        "stops": stops,
+        "segment_count": len(rows),
+        "distance_km": sum(row[19] or 0 for row in rows),
+        "segments": segments,
+    }
+
+
+def get_journeys(conn, year=None, since=None, until=None, through=None,
+                 layover_hours=DEFAULT_LAYOVER_HOURS, max_stay_days=DEFAULT_MAX_STAY_DAYS,
+                 summary_only=False, idx=None):
+    """Reconstruct trips from the deduped flight history.
+
+    Bounds (a year or YYYY-MM-DD since/until, both by local departure date
+    as in `years`) select journeys by their first departure; the scan is
+    padded by the maximum stay so trips crossing a bound stay whole. `through` keeps journeys touching an
+    airport code. O(n log n) in the number of flights. Given the sidecar
+    index `idx`, the history is read from it instead.
+    """
+    # Both kinds of bound apply to the first flight's local departure date
+    first_date, last_date = (f"{year}-01-01", f"{year}-12-31") if year is not None else (since, until)
+    start_ts, end_ts = local_date_window(first_date, last_date)
+    layover_seconds = layover_hours * 3600
+    max_stay_seconds = max(max_stay_days * 86400, layover_seconds)
+
+    scan_start = start_ts - max_stay_seconds if start_ts is not None else None
+    scan_end = end_ts + max_stay_seconds if end_ts is not None else None
+    if idx is not None:
+        rows = indexed_history_rows(conn, idx, scan_start, scan_end)
+    else:
+        rows = query_history_rows(conn, scan_start, scan_end)
+    departures = localize_column([row[9] for row in rows], [row[24] for row in rows])
+    survivors = [row for row, _ in dedup_by_route(rows, [d[2] for d in departures])]
+    survivors.sort(key=page_key)
+
+    journeys = []
+    for journey_rows in link_journeys(survivors, layover_seconds, max_stay_seconds):
+        departure_date = convert_date(journey_rows[0][9], journey_rows[0][24])
+        if first_date and departure_date < first_date:
+            continue
+        if last_date and departure_date > last_date:
+            continue
+        if through and not any(through in (row[3], row[6]) for row in journey_rows):
+            continue
+        segments = process_flight_rows(journey_rows, JOURNEY_SEGMENT_FIELDS)
+        journey = summarize_journey(journey_rows, segments, layover_seconds)
+        if summary_only:
+            del journey["segments"]
+        journeys.append(journey)
+
+    return {
+        "filters": {"year": year, "since": since, "until": until, "through": through,
+                    "layover_hours": layover_hours, "max_stay_days": max_stay_days},
+        "journeys": journeys,
+        "count": len(journeys),
+        "round_trips": sum(1 for journey in journeys if journey["round_trip"]),
+        "segment_count": sum(journey["segment_count"] for journey in journeys),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Streaming export
+# ---------------------------------------------------------------------------
+
+EXPORT_BATCH_SIZE = 500
+
+# Rows sharing a route key share a local date at the same departure
+# airport, so they depart within a day of each other. Once the stream is
+# this far past a key's first departure, the key can no longer change.
+ROUTE_KEY_WINDOW_SECONDS = 86400
+
+
+def history_union_sql(main_user_id, start_ts=None, end_ts=None):
+    """Build the history row set as one UNION ALL statement.
+
+    Same filters as query_history_rows(), with the superseded check done in
+    SQL. Returns (sql, params); the caller adds any ORDER BY.
+    """
+    range_filter = ""
+    manual_range_filter = ""
+    range_params = []
+    if start_ts is not None:
+        range_filter += f" AND {TRACKED_DEPARTURE} >= ?"
+        manual_range_filter += " AND mf.lastKnownDepartureDate >= ?"
+        range_params.append(start_ts)
+    if end_ts is not None:
+        range_filter += f" AND {TRACKED_DEPARTURE} <= ?"
+        manual_range_filter += " AND mf.lastKnownDepartureDate <= ?"
+        range_params.append(end_ts)
+
+    user_filter = ""
+    manual_user_filter = ""
+    params = list(range_params)
+    manual_params = list(range_params)
+    if main_user_id:
+        user_filter = "AND uf.userId = ? AND (uf.importSource IS NULL OR uf.importSource != 'CONNECTED_FRIEND')"
+        manual_user_filter = "AND umf.userId = ?"
+        params.append(main_user_id)
+        manual_params.append(main_user_id)
+
+    sql = f"""
+        SELECT {TRACKED_FLIGHT_COLUMNS}
+        {TRACKED_FLIGHT_JOINS}
+        WHERE uf.isMyFlight = 1
+          AND uf.deleted IS NULL
+          {range_filter}
+          {user_filter}
+          AND f.id NOT IN (
+              SELECT originalFlightId FROM ManualFlight
+              WHERE originalFlightId IS NOT NULL AND originalFlightId != ''
+          )
+        UNION ALL
+        SELECT {MANUAL_FLIGHT_COLUMNS}
+        {MANUAL_FLIGHT_JOINS}
+        WHERE umf.isMyFlight = 1
+          AND umf.deleted IS NULL
+          {manual_range_filter}
+          {manual_user_filter}
+    """
+    return sql, params + manual_params
+
+
+def iter_history_rows(conn, start_ts=None, end_ts=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield batches of history rows from one statement ordered by departure.
+
+    Streamed with fetchmany() so memory stays bounded.
+    """
+    sql, params = history_union_sql(get_main_user_id(conn), start_ts, end_ts)
+    cursor = conn.execute(f"{sql} ORDER BY departure, flight_id", params)
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield backfill_distances(conn, rows)
+
+
+def _route_rank(row):
+    # Tail number first (actually operated), then tracked, then earliest,
+    # then flight id so codeshares departing together settle the same way
+    return (not row[21], row[22] == "manual", row[9] or 0, row[23] or "")
+
+
+def iter_deduped_history(conn, start_ts=None, end_ts=None, batch_size=EXPORT_BATCH_SIZE,
+                         local_dates=None):
+    """Yield batches of route-deduped history rows in bounded memory.
+
+    Applies the dedup_by_route() preference over a sliding window: a route
+    key is settled and emitted once the stream has moved
+    ROUTE_KEY_WINDOW_SECONDS past its first departure. Rows without a
+    departure time are held until the end. `local_dates`, a (first, last)
+    YYYY-MM-DD pair (either may be None), keeps only flights whose local
+    departure date is within it.
+    """
+    pending = {}  # route key -> [first departure, best row], in departure order
+    undated = {}
+    ready = []
+    first, last = local_dates or (None, None)
+
+    def in_dates(route_key):
+        dep_date = route_key.partition("|")[0]
+        return (not first or dep_date >= first) and (not last or dep_date <= last)
+
+    for rows in iter_history_rows(conn, start_ts, end_ts, batch_size):
+        departures = localize_column([row[9] for row in rows], [row[24] for row in rows])
+        for row, (_, _, dep_date) in zip(rows, departures):
+            route_key = f"{dep_date}|{row[3]}|{row[6]}"
+            bucket = pending if row[9] is not None else undated
+            entry = bucket.get(route_key)
+            if entry is None:
+                bucket[route_key] = [row[9], row]
+            elif _route_rank(row) < _route_rank(entry[1]):
+                entry[1] = row
+
+            if row[9] is not None:
+                while pending:
+                    oldest_key = next(iter(pending))
+                    first_departure, best = pending[oldest_key]
+                    if row[9] - first_departure <= ROUTE_KEY_WINDOW_SECONDS:
+                        break
+                    del pending[oldest_key]
+                    if in_dates(oldest_key):
+                        ready.append(best)
+
+        if len(ready) >= batch_size:
+            yield ready
+            ready = []
+
+    for bucket in (undated, pending):
+        ready.extend(best for route_key, (_, best) in bucket.items() if in_dates(route_key))
+    if ready:
+        yield ready
+
+
+def project_fields(flight, fields):
+    """Keep only the requested (possibly dotted) fields, preserving nesting."""
+    if not fields:
+        return flight
+    projected = {}
+    for path in fields:
+        source, target = flight, projected
+        parts = path.split(".")
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+            target = target.setdefault(part, {})
+        target[parts[-1]] = source.get(parts[-1]) if isinstance(source, dict) else None
+    return projected
+
+
+def iter_flight_export(conn, since=None, until=None, fields=None):
+    """Yield one NDJSON line per deduped flight departing (local date) since..until."""
+    for rows in iter_local_history(conn, since, until):
+        for flight in process_flight_rows(rows):
+            yield json.dumps(project_fields(flight, fields), ensure_ascii=False) + "\n"
+
+
+def iter_local_history(conn, since=None, until=None):
+    """iter_deduped_history() bounded by local departure dates (YYYY-MM-DD or None)."""
+    start_ts, end_ts = local_date_window(since, until)
+    return iter_deduped_history(conn, start_ts, end_ts, local_dates=(since, until))
+
+
+def export_flights(conn, args, out=sys.stdout):
+    """Export the deduped history.
+
+    Options: --format ndjson|arrow|parquet|columnar (default ndjson),
+    --output PATH (required for binary formats), --fields a,b.c (ndjson
+    projection), --since/--until YYYY-MM-DD (local departure dates).
+    NDJSON is streamed to `out` and None is returned; binary formats return
+    a summary dict. Errors are returned as {"error": ...}.
+    """
+    export_format = pop_option(args, "--format", "ndjson")
+    output = pop_option(args, "--output")
+    fields = pop_option(args, "--fields")
+    since = pop_option(args, "--since")
+    until = pop_option(args, "--until")
+    try:
+        local_date_window(since, until)
+    except ValueError:
+        return {"error": "Invalid --since/--until date. Use YYYY-MM-DD"}
+
+    if export_format != "ndjson":
+        if export_format not in ("arrow", "parquet", "columnar"):
+            return {"error": f"Unknown export format: {export_format}. Use: ndjson, arrow, parquet, columnar"}
+        if not output:
+            return {"error": f"--output PATH is required for --format {export_format}"}
+        return write_columnar_export(conn, output, export_format, since, until)
+
+    fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    for line in iter_flight_export(conn, since, until, fields):
+        out.write(line)
+    out.flush()
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Columnar export
+# ---------------------------------------------------------------------------
+#
+# Writes the deduped history straight from row tuples into typed columns,
+# one record batch per fetchmany() batch. Timestamps and distance stay
+# numeric. Arrow IPC and Parquet need pyarrow; --format columnar writes a
+# small array-backed format readable with read_columnar_export() without it.
+
+# (name, row index, kind) - kind is "timestamp", "float" or "string"
+COLUMNAR_SCHEMA = (
+    ("departure", 9, "timestamp"),
+    ("arrival", 10, "timestamp"),
+    ("departure_date", None, "string"),  # Local date at the departure airport
+    ("airline_code", 0, "string"),
+    ("flight_number", 2, "string"),
+    ("dep_code", 3, "string"),
+    ("arr_code", 6, "string"),
+    ("dep_tz", 24, "string"),
+    ("distance_km", 19, "float"),
+    ("cabin_class", 13, "string"),
+    ("aircraft", 14, "string"),
+    ("tail_number", 21, "string"),
+    ("source", 22, "string"),
+)
+
+COLUMNAR_MAGIC = b"FLTCOL1\n"
+
+
+def iter_columnar_batches(conn, since=None, until=None):
+    """Yield (row_count, {column: list}) batches of the deduped history."""
+    for rows in iter_local_history(conn, since, until):
+        dep_dates = [local[2] for local in localize_column(
+            [row[9] for row in rows], [row[24] for row in rows])]
+        columns = {}
+        for name, index, _ in COLUMNAR_SCHEMA:
+            columns[name] = dep_dates if index is None else [row[index] for row in rows]
+        yield len(rows), columns
+
+
+def _write_arrow(batches, output, export_format, pa):
+    fields = []
+    for name, _, kind in COLUMNAR_SCHEMA:
+        if kind == "timestamp":
+            fields.append(pa.field(name, pa.timestamp("us", tz="UTC")))
+        elif kind == "float":
+            fields.append(pa.field(name, pa.float64()))
+        else:
+            # Plain strings: the IPC file format allows one dictionary per
+            # field, and each batch would otherwise bring its own (Parquet
+            # dictionary-encodes on its own)
+            fields.append(pa.field(name, pa.string()))
+    schema = pa.schema(fields)
+
+    if export_format == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(output, schema)
+    else:
+        writer = pa.ipc.new_file(output, schema)
+    write = writer.write_batch
+
+    rows_written = 0
+    try:
+        for count, columns in batches:
+            arrays = []
+            for (name, _, kind), field in zip(COLUMNAR_SCHEMA, fields):
+                values = columns[name]
+                if kind == "timestamp":
+                    values = [None if v is None else int(round(v * 1_000_000)) for v in values]
+                    arrays.append(pa.array(values, type=field.type))
+                elif kind == "float":
+                    arrays.append(pa.array(values, type=pa.float64()))
+                else:
+                    arrays.append(pa.array(values, type=pa.string()))
+            write(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows_written += count
+    finally:
+        writer.close()
+    return rows_written
+
+
+def _write_fallback(batches, output):
+    """Write the array-backed format.
+
+    Layout: magic, then per batch a uint32 row count followed by each column
+    as a packed array - float64 ("d", NaN for NULL) for timestamps and
+    distance, int32 dictionary codes ("i", -1 for NULL) for strings. A JSON
+    footer holds the schema, dictionaries and batch sizes, followed by its
+    uint32 length and the magic again.
+    """
+    dictionaries = {name: {} for name, _, kind in COLUMNAR_SCHEMA if kind == "string"}
+    batch_sizes = []
+    nan = float("nan")
+    with open(output, "wb") as f:
+        f.write(COLUMNAR_MAGIC)
+        for count, columns in batches:
+            f.write(struct.pack("<I", count))
+            for name, _, kind in COLUMNAR_SCHEMA:
+                values = columns[name]
+                if kind == "string":
+                    codes = dictionaries[name]
+                    packed = array("i", (
+                        -1 if v is None else codes.setdefault(v, len(codes)) for v in values))
+                else:
+                    packed = array("d", (nan if v is None else v for v in values))
+                packed.tofile(f)
+            batch_sizes.append(count)
+
+        footer = json.dumps({
+            "schema": [{"name": name, "type": kind} for name, _, kind in COLUMNAR_SCHEMA],
+            "dictionaries": {name: list(codes) for name, codes in dictionaries.items()},
+            "batches": batch_sizes,
+            "byteorder": sys.byteorder,
+        }).encode()
+        f.write(footer)
+        f.write(struct.pack("<I", len(footer)))
+        f.write(COLUMNAR_MAGIC)
+    return sum(batch_sizes)
+
+
+def read_columnar_export(path):
+    """Read a fallback-format export into {column: array or list}.
+
+    Numeric columns come back as array("d") (NaN for NULL); string columns
+    are decoded from their dictionaries (None for NULL).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(COLUMNAR_MAGIC) or not data.endswith(COLUMNAR_MAGIC):
+        raise ValueError(f"{path} is not a columnar flight export")
+
+    magic_len = len(COLUMNAR_MAGIC)
+    footer_end = len(data) - magic_len
+    (footer_len,) = struct.unpack("<I", data[footer_end - 4:footer_end])
+    footer = json.loads(data[footer_end - 4 - footer_len:footer_end - 4])
+    swap = footer["byteorder"] != sys.byteorder
+
+    columns = {column["name"]: array("i" if column["type"] == "string" else "d")
+               for column in footer["schema"]}
+    offset = magic_len
+    for count in footer["batches"]:
+        offset += 4  # Row count, already known from the footer
+        for column in footer["schema"]:
+            target = columns[column["name"]]
+            chunk = array(target.typecode)
+            size = count * chunk.itemsize
+            chunk.frombytes(data[offset:offset + size])
+            if swap:
+                chunk.byteswap()
+            target.extend(chunk)
+            offset += size
+
+    for name, values in footer["dictionaries"].items():
+        columns[name] = [None if code < 0 else values[code] for code in columns[name]]
+    return columns
+
+
+def write_columnar_export(conn, output, export_format="arrow", since=None, until=None):
+    """Write the deduped history as Arrow IPC/Parquet (pyarrow) or the array format."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+
+    if pa is None and export_format != "columnar":
+        return {"error": f"--format {export_format} needs pyarrow (pip install pyarrow); "
+                         "use --format columnar for the built-in array-backed format"}
+
+    batches = iter_columnar_batches(conn, since, until)
+    errors = (OSError, pa.ArrowException) if pa is not None else OSError
+    try:
+        if export_format == "columnar":
+            rows = _write_fallback(batches, output)
+        else:
+            rows = _write_arrow(batches, output, export_format, pa)
+    except errors as e:
+        # Don't leave a truncated file behind
+        if os.path.exists(output):
+            os.remove(output)
+        return {"error": f"Export to {output} failed: {e}"}
+
+    return {
+        "path": str(output),
+        "format": export_format,
+        "rows": rows,
+        "columns": [name for name, _, _ in COLUMNAR_SCHEMA],
+        "bytes": os.path.getsize(output),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Shadow snapshot
+# ---------------------------------------------------------------------------
+#
+# With --snapshot, commands read a private copy of the Flighty database made
+# with the SQLite online backup API instead of the live file. The copy gets
+# indexes matching this script's access patterns (the Flighty schema has few)
+# and is only re-made when the source fingerprint changes. Reading the copy
+# also never holds locks on the file Flighty's iCloud sync is writing.
+
+DEFAULT_SNAPSHOT_PATH = CACHE_DIR / "flighty_snapshot.db"
+
+# Expression index matches TRACKED_DEPARTURE (SQLite ignores the table alias
+# when matching expressions); the rest cover the joins and filters used by
+# the tracked/manual queries and the main-user and superseded lookups.
+SNAPSHOT_INDEXES = """
+    CREATE INDEX IF NOT EXISTS snapshot_flight_departure
+        ON Flight(COALESCE(lastKnownDepartureDate, departureScheduleGateOriginal));
+    CREATE INDEX IF NOT EXISTS snapshot_userflight_user
+        ON UserFlight(userId, deleted, isMyFlight, flightId, importSource);
+    CREATE INDEX IF NOT EXISTS snapshot_userflight_flight
+        ON UserFlight(flightId, userId, isMyFlight, deleted, importSource);
+    CREATE INDEX IF NOT EXISTS snapshot_ticket_flight
+        ON Ticket(flightId, userId, pnr, seatNumber, cabinClass);
+    CREATE INDEX IF NOT EXISTS snapshot_manualflight_original
+        ON ManualFlight(originalFlightId);
+    CREATE INDEX IF NOT EXISTS snapshot_manualflight_departure
+        ON ManualFlight(lastKnownDepartureDate);
+    CREATE INDEX IF NOT EXISTS snapshot_usermanualflight_flight
+        ON UserManualFlight(flightId, userId, isMyFlight, deleted);
+    CREATE TABLE IF NOT EXISTS travel_agent_snapshot (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+"""
+
+
+def snapshot_source_fingerprint(snapshot_path):
+    """Source fingerprint recorded in a snapshot, or None if absent/unreadable."""
+    if not Path(snapshot_path).exists():
+        return None
+    try:
+        snap = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+        try:
+            row = snap.execute(
+                "SELECT value FROM travel_agent_snapshot WHERE key = 'source_fingerprint'"
+            ).fetchone()
+        finally:
+            snap.close()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def refresh_snapshot(db_path, snapshot_path=DEFAULT_SNAPSHOT_PATH, force=False):
+    """Bring the shadow snapshot up to date with the Flighty database.
+
+    A no-op (one stat plus one small read) while the source fingerprint is
+    unchanged. Otherwise the database is copied with the online backup API
+    into a temporary file, indexed and analyzed there, and atomically
+    renamed over the previous snapshot so readers never see a partial copy.
+    """
+    snapshot_path = Path(snapshot_path)
+    if snapshot_path.resolve() == Path(db_path).resolve():
+        raise ValueError("Refusing to use the Flighty database as the snapshot file")
+
+    # Taken before copying: a write during the backup leaves the snapshot
+    # marked stale, so the next call copies again.
+    source = json.dumps(file_fingerprint(db_path))
+    if not force and snapshot_source_fingerprint(snapshot_path) == source:
+        return {"snapshot": str(snapshot_path), "refreshed": False}
+
+    started = time.perf_counter()
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = snapshot_path.with_name(snapshot_path.name + ".tmp")
+    for stale in (tmp_path, Path(f"{tmp_path}-journal")):
+        if stale.exists():
+            stale.unlink()
+
+    src = connect_db(db_path, read_only=True)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dst)
+        # The copy inherits WAL mode from the source; a private read-mostly
+        # file needs no WAL or shm files next to it.
+        dst.execute("PRAGMA journal_mode = DELETE")
+        dst.executescript(SNAPSHOT_INDEXES)
+        dst.execute("ANALYZE")
+        dst.executemany(
+            "INSERT OR REPLACE INTO travel_agent_snapshot (key, value) VALUES (?, ?)",
+            [("source_fingerprint", source),
+             ("source_path", str(db_path)),
+             ("created", str(time.time()))],
+        )
+        dst.commit()
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp_path, snapshot_path)
+
+    return {
+        "snapshot": str(snapshot_path),
+        "refreshed": True,
+        "bytes": snapshot_path.stat().st_size,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Sidecar flight index
+# ---------------------------------------------------------------------------
+#
+# A local SQLite file (never the Flighty database itself) holding one
+# unified_flight row per UserFlight/UserManualFlight link, already in the
+# 25-column row layout plus the derived local departure date and dedup keys.
+# Commands run with --index read from it with a single indexed range scan.
+
+DEFAULT_INDEX_PATH = CACHE_DIR / "flighty_index.db"
+
+INDEX_SCHEMA_VERSION = "6"
+
+# Flighty's tables carry no modification timestamp to watermark on, so each
+# refresh checksums every index input (link, flight, ticket and airport
+# columns) per source and departure bucket, and re-syncs only the buckets
+# whose row count or checksum changed. Edits to old flights, isMyFlight
+# flips and ticket changes land in the bucket of the flight's departure.
+INDEX_BUCKET_SECONDS = 30 * 86400
+
+# Text columns of unified_flight mirrored into the flight_search FTS5 table
+# by triggers, so every index refresh keeps full-text search current.
+SEARCH_FIELDS = (
+    "confirmation", "airline_code", "airline_name", "flight_number",
+    "dep_code", "dep_airport", "dep_city", "arr_code", "arr_airport", "arr_city",
+    "tail_number", "aircraft",
+)
+
+INDEX_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS index_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS unified_flight (
+        uid TEXT PRIMARY KEY,
+        user_id TEXT,
+        is_my_flight INTEGER,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        is_friend INTEGER NOT NULL DEFAULT 0,
+        superseded INTEGER NOT NULL DEFAULT 0,
+        manual_id TEXT,
+        local_date TEXT,
+        dedup_key TEXT,
+        route_key TEXT,
+        missing_distance INTEGER NOT NULL DEFAULT 0,
+        {", ".join(FLIGHT_ROW_FIELDS)}
+    );
+    CREATE INDEX IF NOT EXISTS idx_unified_user_departure ON unified_flight(user_id, departure);
+    CREATE INDEX IF NOT EXISTS idx_unified_departure ON unified_flight(departure);
+    CREATE INDEX IF NOT EXISTS idx_unified_user_date ON unified_flight(user_id, local_date);
+    CREATE INDEX IF NOT EXISTS idx_unified_flight_id ON unified_flight(flight_id);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS flight_search USING fts5(
+        {", ".join(SEARCH_FIELDS)},
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS flight_search_vocab USING fts5vocab(flight_search, 'row');
+    CREATE TRIGGER IF NOT EXISTS unified_flight_search_insert AFTER INSERT ON unified_flight BEGIN
+        INSERT INTO flight_search (rowid, {", ".join(SEARCH_FIELDS)})
+        VALUES (new.rowid, {", ".join("new." + field for field in SEARCH_FIELDS)});
+    END;
+    CREATE TRIGGER IF NOT EXISTS unified_flight_search_delete AFTER DELETE ON unified_flight BEGIN
+        DELETE FROM flight_search WHERE rowid = old.rowid;
+    END;
+"""
+
+
+def _index_meta(idx):
+    return dict(idx.execute("SELECT key, value FROM index_meta").fetchall())
+
+
+def _link_signature(conn):
+    """Row counts, soft-delete counts and max rowids of the two link tables."""
+    tracked = conn.execute(
+        "SELECT COUNT(*), SUM(deleted IS NOT NULL), MAX(rowid) FROM UserFlight"
+    ).fetchone()
+    manual = conn.execute(
+        "SELECT COUNT(*), SUM(deleted IS NOT NULL), MAX(rowid) FROM UserManualFlight"
+    ).fetchone()
+    return [value or 0 for value in tracked + manual]
+
+
+def _bucket_sql(departure):
+    """SQL for the INDEX_BUCKET_SECONDS bucket of a departure (-1 when NULL)."""
+    return f"COALESCE(CAST({departure} / {INDEX_BUCKET_SECONDS} AS INTEGER), -1)"
+
+
+def _row_checksum(*values):
+    return zlib.crc32(repr(values).encode())
+
+
+def _index_checksums(conn):
+    """{"source:bucket": [rows, checksum]} over every column an index row derives from."""
+    conn.create_function("row_checksum", -1, _row_checksum, deterministic=True)
+    checksums = {}
+    for source, link, columns, joins in (
+        ("tracked", "uf.rowid, uf.userId, uf.isMyFlight, uf.deleted",
+         TRACKED_FLIGHT_COLUMNS, TRACKED_FLIGHT_JOINS),
+        ("manual", "umf.rowid, umf.userId, umf.isMyFlight, umf.deleted",
+         MANUAL_FLIGHT_COLUMNS, MANUAL_FLIGHT_JOINS),
+    ):
+        for bucket, rows, checksum in conn.execute(f"""
+            SELECT {_bucket_sql("departure")} AS bucket, COUNT(*),
+                   SUM(row_checksum(link_rowid, link_user, link_mine, link_deleted, {FLIGHT_ROW_COLUMNS}))
+            FROM (
+                SELECT {", ".join(f"{column} AS link_{name}" for column, name in zip(
+                    link.split(", "), ("rowid", "user", "mine", "deleted")))},
+                       {columns}
+                {joins}
+            )
+            GROUP BY bucket
+        """):
+            checksums[f"{source}:{bucket}"] = [rows, checksum]
+    return checksums
+
+
+def _index_rows(conn, where, params):
+    """Yield unified_flight rows for tracked and manual flights matching `where`.
+
+    `where` is a pair of SQL conditions (tracked, manual).
+    """
+    tracked_where, manual_where = where
+    tracked_params, manual_params = params
+    # Distances are backfilled per batch (shifted past the 6 link columns)
+    for sql, sql_params in ((f"""
+        SELECT 't:' || uf.rowid, uf.userId, uf.isMyFlight, uf.deleted IS NOT NULL,
+               NULL, f.distance IS NULL, {TRACKED_FLIGHT_COLUMNS}
+        {TRACKED_FLIGHT_JOINS}
+        WHERE {tracked_where}
+    """, tracked_params), (f"""
+        SELECT 'm:' || umf.rowid, umf.userId, umf.isMyFlight, umf.deleted IS NOT NULL,
+               mf.id, mf.distance IS NULL, {MANUAL_FLIGHT_COLUMNS}
+        {MANUAL_FLIGHT_JOINS}
+        WHERE {manual_where}
+    """, manual_params)):
+        cursor = conn.execute(sql, sql_params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield from backfill_distances(conn, rows, dep=9, arr=12, distance=25)
+
+
+def _index_record(row, superseded_ids):
+    """Derive the precomputed columns for one unified_flight row."""
+    uid, user_id, is_my_flight, deleted, manual_id, missing_distance = row[:6]
+    flight = row[6:]
+    local_date = convert_date(flight[9], flight[24])
+    route_key = f"{local_date}|{flight[3]}|{flight[6]}"
+    is_friend = flight[20] == "CONNECTED_FRIEND"
+    superseded = flight[22] == "tracked" and flight[23] in superseded_ids
+    return (
+        uid, user_id, is_my_flight, int(bool(deleted)), int(is_friend), int(superseded), manual_id,
+        local_date, f"{route_key}|{flight[2]}", route_key, int(bool(missing_distance)),
+    ) + tuple(flight)
+
+
+def _write_index_rows(idx, rows, superseded_ids):
+    placeholders = ", ".join("?" * (11 + len(FLIGHT_ROW_FIELDS)))
+    idx.executemany(
+        f"INSERT OR REPLACE INTO unified_flight VALUES ({placeholders})",
+        (_index_record(row, superseded_ids) for row in rows),
+    )
+
+
+def refresh_flight_index(conn, db_path, idx, force=False):
+    """Bring the sidecar index up to date with the Flighty database.
+
+    Fast path: nothing to do when the database fingerprint is unchanged.
+    Otherwise only the departure buckets whose checksum changed are
+    re-synced (see INDEX_BUCKET_SECONDS), and superseded flags are
+    rewritten only for flights whose superseded state changed. A new
+    schema or a different source file triggers a full rebuild.
+    """
+    idx.executescript(INDEX_SCHEMA)
+    meta = _index_meta(idx)
+    fingerprint = json.dumps(database_fingerprint(conn, db_path))
+    if (not force and meta.get("fingerprint") == fingerprint
+            and meta.get("schema_version") == INDEX_SCHEMA_VERSION):
+        return {"refreshed": False}
+
+    checksums = _index_checksums(conn)
+    previous = json.loads(meta.get("checksums", "null"))
+    rebuild = (
+        force
+        or meta.get("schema_version") != INDEX_SCHEMA_VERSION
+        or meta.get("source_path") != str(db_path)
+        or previous is None
+    )
+
+    now = datetime.now(tz=timezone.utc).timestamp()
+    superseded_ids = get_superseded_flight_ids(conn)
+    resynced = 0
+    with idx:
+        if rebuild:
+            idx.execute("DELETE FROM unified_flight")
+            idx.execute("DELETE FROM flight_search")
+            _write_index_rows(idx, _index_rows(conn, ("1", "1"), ([], [])), superseded_ids)
+        else:
+            changed = {"tracked": [], "manual": []}
+            for key in checksums.keys() | previous.keys():
+                if checksums.get(key) != previous.get(key):
+                    source, bucket = key.split(":")
+                    changed[source].append(int(bucket))
+            resynced = len(changed["tracked"]) + len(changed["manual"])
+            for source, buckets in changed.items():
+                if buckets:
+                    idx.execute(
+                        f"DELETE FROM unified_flight WHERE source = ? "
+                        f"AND {_bucket_sql('departure')} IN (SELECT value FROM json_each(?))",
+                        (source, json.dumps(buckets)))
+            _write_index_rows(idx, _index_rows(
+                conn,
+                (f"{_bucket_sql(TRACKED_DEPARTURE)} IN (SELECT value FROM json_each(?))",
+                 f"{_bucket_sql('mf.lastKnownDepartureDate')} IN (SELECT value FROM json_each(?))"),
+                ([json.dumps(changed["tracked"])], [json.dumps(changed["manual"])]),
+            ), superseded_ids)
+
+            # Rows just written carry the current flag; the rest only need
+            # touching where a flight's superseded state flipped
+            changed = superseded_ids.symmetric_difference(json.loads(meta.get("superseded", "[]")))
+            if changed:
+                idx.execute(
+                    "UPDATE unified_flight SET superseded = (source = 'tracked' "
+                    "AND flight_id IN (SELECT value FROM json_each(?))) "
+                    "WHERE flight_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(sorted(superseded_ids)), json.dumps(sorted(changed))),
+                )
+        idx.executemany("INSERT OR REPLACE INTO index_meta VALUES (?, ?)", [
+            ("schema_version", INDEX_SCHEMA_VERSION),
+            ("superseded", json.dumps(sorted(superseded_ids))),
+            ("source_path", str(db_path)),
+            ("fingerprint", fingerprint),
+            ("checksums", json.dumps(checksums)),
+            ("refreshed_at", str(now)),
+        ])
+
+    result = {"refreshed": True, "rebuilt": rebuild}
+    if not rebuild:
+        result["resynced_buckets"] = resynced
+    return result
+
+
+def open_flight_index(conn, db_path, index_path=DEFAULT_INDEX_PATH, refresh=True):
+    """Open (creating or refreshing as needed) the sidecar flight index."""
+    index_path = Path(index_path)
+    if index_path.resolve() == Path(db_path).resolve():
+        raise ValueError("Refusing to use the Flighty database as the index file")
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    idx = sqlite3.connect(index_path, factory=ProfilingConnection if _active_profile else sqlite3.Connection)
+    # INSERT OR REPLACE only fires the delete trigger with recursive triggers on
+    idx.execute("PRAGMA recursive_triggers = ON")
+    if refresh:
+        refresh_flight_index(conn, db_path, idx)
+    return idx
+
+
+def _index_filter(main_user_id, friends=True, deleted=True, superseded=True,
+                  any_tracked_user=False):
+    """Build a WHERE clause mirroring a live command's tracked/manual filters.
+
+    Manual rows always require umf.deleted IS NULL; the flags control which
+    of the tracked-side filters apply, so each index query returns exactly
+    what its live counterpart would.
+    """
+    clauses = [
+        "is_my_flight = 1",
+        "deleted = 0" if deleted else "(source = 'tracked' OR deleted = 0)",
+    ]
+    params = []
+    if superseded:
+        clauses.append("superseded = 0")
+    if main_user_id:
+        if any_tracked_user:
+            clauses.append("(source = 'tracked' OR user_id = ?)")
+        else:
+            clauses.append("user_id = ?")
+        params.append(main_user_id)
+        if not friends:
+            clauses.append("is_friend = 0")
+    return " AND ".join(clauses), params
+
+
+def query_flight_index(idx, where, params, order="departure", limit=None,
+                       dedup=None, prefer=""):
+    """Run one indexed scan over unified_flight, returning 25-column rows.
+
+    When `dedup` names a key column, only the first row per key survives,
+    ranked tracked-before-manual (plus any `prefer` terms) then by
+    departure and flight id — the same precedence the live Python dedup
+    uses.
+    """
+    limit_clause = "LIMIT ?" if limit is not None else ""
+    limit_params = [limit] if limit is not None else []
+    if dedup:
+        sql = f"""
+            SELECT {FLIGHT_ROW_COLUMNS} FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY {dedup}
+                    ORDER BY {prefer}source = 'manual', departure, flight_id
+                ) AS dup_rank
+                FROM unified_flight
+                WHERE {where}
+            )
+            WHERE dup_rank = 1
+            ORDER BY {order}, source = 'manual', flight_id
+            {limit_clause}
+        """
+    else:
+        sql = f"""
+            SELECT {FLIGHT_ROW_COLUMNS} FROM unified_flight
+            WHERE {where}
+            ORDER BY {order}, source = 'manual', flight_id
+            {limit_clause}
+        """
+    return idx.execute(sql, params + limit_params).fetchall()
+
+
+def date_flight_summary(row):
+    """Compact per-flight dict used by the `date` command."""
+    dep_tz = row[24]
+    is_manual = row[22] == "manual"
+    return {
+        "flight": row[2] if is_manual else (f"{row[0]} {row[2]}" if row[0] else row[2]),
+        "route": f"{row[3]} → {row[6]}",
+        "departure": format_datetime(row[9], dep_tz),
+        "arrival": format_datetime(row[10]),
+        "confirmation": row[11],
+        "seat": row[12],
+        "cabin_class": row[13],
+        "aircraft": row[14],
+        "tail_number": row[21],
+        "source": row[22]
+    }
+
+
+def recent_flight_summary(row):
+    """Compact per-flight dict used by the `recent` command."""
+    is_manual = row[22] == "manual"
+    return {
+        "flight": row[2] if is_manual else (f"{row[0]} {row[2]}" if row[0] else row[2]),
+        "route": f"{row[3]} → {row[6]}",
+        "date": convert_date(row[9], row[24]),
+        "aircraft": row[14],
+        "distance_km": row[19],
+        "tail_number": row[21],
+        "source": row[22]
+    }
+
+
+def indexed_upcoming_flights(conn, idx, limit=20, include_friends=False):
+    """`list` answered from the sidecar index."""
+    now = current_timestamp()
+    where, params = _index_filter(get_main_user_id(conn), deleted=False,
+                                  friends=include_friends, any_tracked_user=include_friends)
+    rows = query_flight_index(idx, f"{where} AND departure > ?", params + [now],
+                              limit=limit, dedup="dedup_key")
+    flights = process_flight_rows(rows)
+    return {"flights": flights, "count": len(flights)}
+
+
+def indexed_flights_on_date(conn, idx, date_str):
+    """`date` answered from the sidecar index using the stored local date."""
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return {"error": f"Invalid date format: {date_str}. Use YYYY-MM-DD"}
+    where, params = _index_filter(get_main_user_id(conn), deleted=False)
+    rows = query_flight_index(idx, f"{where} AND local_date = ?", params + [date_str],
+                              order="source = 'manual', departure, flight_id")
+    flights = [date_flight_summary(row) for row in rows]
+    return {"date": date_str, "flights": flights, "count": len(flights)}
+
+
+def indexed_flights_in_range(conn, idx, start_str, end_str):
+    """`range` answered from the sidecar index with one local_date range scan."""
+    try:
+        start_date = datetime.strptime(start_str, "%Y-%m-%d")
+        end_date = datetime.strptime(end_str, "%Y-%m-%d")
+    except ValueError:
+        return {"error": f"Invalid date range: {start_str} {end_str}. Use YYYY-MM-DD YYYY-MM-DD"}
+    if end_date < start_date:
+        return {"error": f"Range end {end_str} is before start {start_str}"}
+    where, params = _index_filter(get_main_user_id(conn), deleted=False)
+    rows = query_flight_index(idx, f"{where} AND local_date BETWEEN ? AND ?",
+                              params + [start_str, end_str], order="departure")
+    flights = [{"date": convert_date(row[9], row[24]), **date_flight_summary(row)} for row in rows]
+    return {"start": start_str, "end": end_str, "flights": flights, "count": len(flights)}
+
+
+def indexed_flights_by_year(conn, idx, year):
+    """`year` answered from the sidecar index with route-level dedup."""
+    where, params = _index_filter(get_main_user_id(conn), friends=False)
+    rows = query_flight_index(
+        idx, f"{where} AND local_date BETWEEN ? AND ?", params + [f"{year}-01-01", f"{year}-12-31"],
+        dedup="route_key", prefer="COALESCE(tail_number, '') = '', ",
+    )
+    flights = process_flight_rows(rows)
+    total_km = sum(f.get("distance_km") or 0 for f in flights)
+    return {
+        "year": year,
+        "flights": flights,
+        "count": len(flights),
+        "total_distance_km": total_km,
+        "total_distance_miles": int(total_km * 0.621371) if total_km else 0
+    }
+
+
+def indexed_recent_flights(conn, idx, limit=20, after=None):
+    """`recent` answered from the sidecar index, paged like the live command."""
+    now = current_timestamp()
+    where, params = _index_filter(get_main_user_id(conn))
+    where += " AND departure < ?"
+    params.append(now)
+    if after is not None:
+        where += " AND (departure, flight_id) < (?, ?)"
+        params.extend(after)
+    rows = query_flight_index(idx, where, params, order="departure DESC, flight_id DESC", limit=limit)
+    flights = [recent_flight_summary(row) for row in rows]
+    result = {"recent_flights": flights, "count": len(flights)}
+    if rows and len(rows) == limit:
+        result["next_cursor"] = make_cursor(rows[-1])
+    return result
+
+
+def indexed_flight_stats(conn, idx):
+    """`stats` answered from the sidecar index."""
+    now = current_timestamp()
+    where, params = _index_filter(get_main_user_id(conn), superseded=False)
+    totals = dict.fromkeys(("tracked", "manual"), (0, 0, 0, 0))
+    for source, count, upcoming, km, backfilled in idx.execute(f"""
+        SELECT source, COUNT(*), SUM(departure > ?), SUM(distance_km), SUM(missing_distance)
+        FROM unified_flight
+        WHERE {where}
+        GROUP BY source
+    """, [now] + params):
+        totals[source] = (count or 0, upcoming or 0, km or 0, backfilled or 0)
+
+    tracked, manual = totals["tracked"], totals["manual"]
+    total_km = tracked[2] + manual[2]
+    return {
+        "total_flights": tracked[0] + manual[0],
+        "upcoming_flights": tracked[1] + manual[1],
+        "total_distance_km": total_km,
+        "total_distance_miles": int(total_km * 0.621371),
+        "earth_circumferences": round(total_km / 40075, 2),
+        "tracked_flights": tracked[0],
+        "manual_flights": manual[0],
+        "backfilled_distance_flights": tracked[3] + manual[3]
+    }
+
+
+def indexed_history_rows(conn, idx, start_ts=None, end_ts=None):
+    """query_history_rows() answered from the sidecar index.
+
+    Same filters and the same order (tracked first, each source by
+    departure), so route dedup keeps the same row of each group.
+    """
+    where, params = _index_filter(get_main_user_id(conn), friends=False)
+    if start_ts is not None:
+        where += " AND departure >= ?"
+        params.append(start_ts)
+    if end_ts is not None:
+        where += " AND departure <= ?"
+        params.append(end_ts)
+    return query_flight_index(idx, where, params, order="source = 'manual', departure, flight_id")
+
+
+# BM25 column weights, in SEARCH_FIELDS order: confirmation codes and flight
+# numbers are the most specific, free-text names the least.
+SEARCH_WEIGHTS = (10.0, 4.0, 2.0, 6.0, 4.0, 1.5, 2.0, 4.0, 1.5, 2.0, 6.0, 1.0)
+
+FUZZY_CUTOFF = 0.75
+
+
+def _search_vocab(idx):
+    return cached_state(
+        ("search_vocab", idx.execute("PRAGMA data_version").fetchone()[0]),
+        lambda: [term for (term,) in idx.execute("SELECT term FROM flight_search_vocab")],
+    )
+
+
+def _has_prefix(idx, term):
+    return idx.execute(
+        "SELECT 1 FROM flight_search_vocab WHERE term >= ? AND term < ? LIMIT 1",
+        (term, term + "\U0010ffff"),
+    ).fetchone() is not None
+
+
+def build_search_expression(idx, query):
+    """Translate free text into an FTS5 MATCH expression.
+
+    Each word becomes a prefix query. Words like "LH400" also match the
+    split form ("LH" and "400*"). Words with no prefix match in the index
+    vocabulary are replaced by their closest vocabulary terms (fuzzy
+    matching via difflib), and dropped if nothing is close. Alternatives
+    are ORed, so BM25 ranks flights matching more words first.
+    """
+    alternatives = []
+    for word in re.findall(r"\w+", query.lower()):
+        if _has_prefix(idx, word):
+            options = [f'"{word}"*']
+            parts = re.findall(r"[^\W\d_]+|\d+", word)
+            if len(parts) > 1:
+                options.append("(" + " AND ".join(f'"{part}"*' for part in parts) + ")")
+        else:
+            parts = re.findall(r"[^\W\d_]+|\d+", word)
+            if len(parts) > 1 and all(_has_prefix(idx, part) for part in parts):
+                options = ["(" + " AND ".join(f'"{part}"*' for part in parts) + ")"]
+            else:
+                matches = difflib.get_close_matches(word, _search_vocab(idx), n=3, cutoff=FUZZY_CUTOFF)
+                options = [f'"{match}"' for match in matches]
+        alternatives.extend(options)
+    return " OR ".join(alternatives)
+
+
+def search_flights(conn, idx, query, limit=10):
+    """Full-text search over the sidecar index, ranked by BM25 and recency.
+
+    Searches confirmation codes, flight numbers, airlines, airports, cities,
+    tail numbers and aircraft of the main user's own flights. A flight
+    departing near today scores up to twice as well as an equally relevant
+    one years away. Codeshare duplicates are collapsed.
+    """
+    expression = build_search_expression(idx, query)
+    if not expression:
+        return {"query": query, "results": [], "count": 0}
+
+    now = current_timestamp()
+    where, params = _index_filter(get_main_user_id(conn), friends=False)
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    cursor = idx.execute(f"""
+        WITH hits AS (
+            SELECT rowid AS hit_rowid, bm25(flight_search, {weights}) AS relevance
+            FROM flight_search
+            WHERE flight_search MATCH ?
+        )
+        SELECT relevance * (1.0 + 1.0 / (1.0 + ABS(COALESCE(departure, 0) - ?) / 31536000.0)) AS score,
+               dedup_key, {FLIGHT_ROW_COLUMNS}
+        FROM hits
+        JOIN unified_flight ON unified_flight.rowid = hit_rowid
+        WHERE {where}
+        ORDER BY score
+    """, [expression, now] + params)
+
+    rows, scores, seen = [], [], set()
+    for score, dedup_key, *row in cursor:
+        if dedup_key in seen:
+            continue
+        seen.add(dedup_key)
+        rows.append(tuple(row))
+        scores.append(round(-score, 3))
+        if len(rows) >= limit:
+            break
+
+    results = process_flight_rows(rows)
+    for flight, score in zip(results, scores):
+        flight["score"] = score
+    return {"query": query, "match": expression, "results": results, "count": len(results)}
+
+
+# ---------------------------------------------------------------------------
+# Change feed
+# ---------------------------------------------------------------------------
+#
+# `changes --since TOKEN` reports only the flights that were booked, changed
+# or cancelled since TOKEN was issued. A small local store keeps a
+# fingerprint of the watched fields per upcoming flight plus a log of
+# changes per generation. A poll where the database fingerprint is
+# unchanged reads nothing from Flighty; otherwise only link rows past the
+# rowid watermarks (new bookings) and flights still in the live window are
+# rescanned. Tokens are opaque: a store id and a generation.
+
+DEFAULT_CHANGES_PATH = CACHE_DIR / "flighty_changes.db"
+
+# Flights are watched until this long after departure (delays, arrival gates)
+CHANGES_WINDOW_SECONDS = 86400
+
+# Generations of change log kept; older tokens get a full reset
+CHANGE_LOG_GENERATIONS = 1000
+
+# Watched output field -> 25-column row position
+WATCHED_FIELDS = {
+    "departure.datetime": 9,
+    "arrival.datetime": 10,
+    "seat": 12,
+    "departure.terminal": 15,
+    "departure.gate": 16,
+    "arrival.terminal": 17,
+    "arrival.gate": 18,
+}
+
+CHANGES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS feed_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS flight_state (
+        uid TEXT PRIMARY KEY,
+        departure REAL,
+        fingerprint TEXT,
+        watched TEXT,
+        flight TEXT
+    );
+    CREATE TABLE IF NOT EXISTS change_log (
+        generation INTEGER,
+        entry TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_change_log_generation ON change_log(generation);
+"""
+
+
+def encode_change_token(store_id, generation):
+    return base64.urlsafe_b64encode(f"{store_id}:{generation}".encode()).decode().rstrip("=")
+
+
+def decode_change_token(token):
+    """(store_id, generation) from a token, or None if it is malformed."""
+    try:
+        text = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        store_id, generation = text.rsplit(":", 1)
+        return store_id, int(generation)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _watched_values(row, deleted):
+    values = {field: row[position] for field, position in WATCHED_FIELDS.items()}
+    values["cancelled"] = bool(deleted)
+    return values
+
+
+def _change_entry(kind, record, changes=None):
+    entry = {
+        "kind": kind,
+        "flight": record.flight_display,
+        "route": f"{record.dep_code} → {record.arr_code}",
+        "departure": record.departure_local[0],
+        "confirmation": record.confirmation,
+    }
+    if changes:
+        entry["changes"] = changes
+    return entry
+
+
+def _display_watched(field, value, row):
+    # Times are stored raw and shown localized like the rest of the output
+    if field == "departure.datetime":
+        return local_times(value, row[24])[0]
+    if field == "arrival.datetime":
+        return local_times(value)[0]
+    return value
+
+
+def _scan_changes(conn, store, meta, generation):
+    """Diff Flighty against the stored fingerprints, logging entries at `generation`."""
+    now = current_timestamp()
+    main_user_id = get_main_user_id(conn)
+    superseded_ids = get_superseded_flight_ids(conn)
+    signature = _link_signature(conn)
+    watermarks = json.loads(meta.get("watermarks", "[0, 0]"))
+    window_start = now - CHANGES_WINDOW_SECONDS
+
+    previous = {uid: (departure, fingerprint, watched)
+                for uid, departure, fingerprint, watched in store.execute(
+                    "SELECT uid, departure, fingerprint, watched FROM flight_state")}
+    baseline = not previous and "generation" not in meta
+
+    entries, seen, updates = [], set(), []
+    for uid, user_id, is_my_flight, deleted, _, _, *row in _index_rows(
+        conn,
+        (f"uf.rowid > ? OR {TRACKED_DEPARTURE} >= ?",
+         "umf.rowid > ? OR mf.lastKnownDepartureDate >= ?"),
+        ([watermarks[0], window_start], [watermarks[1], window_start]),
+    ):
+        if (not is_my_flight or (main_user_id and user_id != main_user_id)
+                or row[20] == "CONNECTED_FRIEND" or row[23] in superseded_ids):
+            continue
+        if row[9] is None or row[9] < window_start:
+            continue
+        seen.add(uid)
+        watched = _watched_values(row, deleted)
+        fingerprint = hashlib.sha1(json.dumps(watched).encode()).hexdigest()
+        old = previous.get(uid)
+        if old is not None and old[1] == fingerprint:
+            continue
+
+        record = FlightRecord(tuple(row))
+        updates.append((uid, row[9], fingerprint, json.dumps(watched),
+                        json.dumps(_change_entry("snapshot", record))))
+        if baseline:
+            continue
+        if old is None:
+            if not deleted:
+                entries.append(_change_entry("new", record))
+            continue
+        before = json.loads(old[2])
+        if watched["cancelled"] and not before["cancelled"]:
+            entries.append(_change_entry("cancelled", record))
+            continue
+        changes = {
+            field: {"from": _display_watched(field, before.get(field), row),
+                    "to": _display_watched(field, value, row)}
+            for field, value in watched.items()
+            if before.get(field) != value
+        }
+        entries.append(_change_entry("changed", record, changes))
+
+    # Upcoming flights whose link rows disappeared outright
+    for uid, (departure, _, watched) in previous.items():
+        if uid in seen or departure is None or departure < window_start:
+            continue
+        exists = conn.execute(
+            "SELECT 1 FROM UserFlight WHERE rowid = ?" if uid.startswith("t:")
+            else "SELECT 1 FROM UserManualFlight WHERE rowid = ?",
+            (int(uid[2:]),),
+        ).fetchone()
+        if exists is None and not json.loads(watched)["cancelled"]:
+            snapshot = json.loads(store.execute(
+                "SELECT flight FROM flight_state WHERE uid = ?", (uid,)).fetchone()[0])
+            snapshot["kind"] = "cancelled"
+            entries.append(snapshot)
+            store.execute("DELETE FROM flight_state WHERE uid = ?", (uid,))
+
+    store.executemany("INSERT OR REPLACE INTO flight_state VALUES (?, ?, ?, ?, ?)", updates)
+    store.execute("DELETE FROM flight_state WHERE departure < ?", (window_start,))
+    store.executemany("INSERT INTO change_log VALUES (?, ?)",
+                      [(generation, json.dumps(entry)) for entry in entries])
+    store.executemany("INSERT OR REPLACE INTO feed_meta VALUES (?, ?)", [
+        ("watermarks", json.dumps([max(watermarks[0], signature[2]), max(watermarks[1], signature[5])])),
+    ])
+    return len(seen)
+
+
+def get_changes(conn, db_path, since=None, store_path=DEFAULT_CHANGES_PATH):
+    """New, changed and cancelled upcoming flights since a change token.
+
+    Without `since` (or with a token this store cannot answer) every
+    watched flight is returned as a "snapshot" entry with reset=true, to
+    resynchronize the caller. The returned token is passed to the next
+    call.
+    """
+    store_path = Path(store_path)
+    if store_path.resolve() == Path(db_path).resolve():
+        raise ValueError("Refusing to use the Flighty database as the change store")
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    store = sqlite3.connect(store_path)
+    try:
+        store.executescript(CHANGES_SCHEMA)
+        with store:
+            meta = dict(store.execute("SELECT key, value FROM feed_meta"))
+            if meta.get("source_path") not in (None, str(db_path)):
+                # A different database: start over
+                store.execute("DELETE FROM flight_state")
+                store.execute("DELETE FROM change_log")
+                store.execute("DELETE FROM feed_meta")
+                meta = {}
+            store_id = meta.get("store_id") or os.urandom(6).hex()
+            generation = int(meta.get("generation", 0))
+
+            fingerprint = json.dumps(database_fingerprint(conn, db_path))
+            scanned = None
+            if meta.get("fingerprint") != fingerprint or "generation" not in meta:
+                generation += 1
+                scanned = _scan_changes(conn, store, meta, generation)
+                store.execute("DELETE FROM change_log WHERE generation <= ?",
+                              (generation - CHANGE_LOG_GENERATIONS,))
+                store.executemany("INSERT OR REPLACE INTO feed_meta VALUES (?, ?)", [
+                    ("store_id", store_id),
+                    ("source_path", str(db_path)),
+                    ("fingerprint", fingerprint),
+                    ("generation", str(generation)),
+                ])
+
+        result = {"token": encode_change_token(store_id, generation)}
+        decoded = decode_change_token(since) if since else None
+        if (decoded is None or decoded[0] != store_id or decoded[1] > generation
+                or decoded[1] < generation - CHANGE_LOG_GENERATIONS):
+            changes = [json.loads(flight) for (flight,) in store.execute(
+                "SELECT flight FROM flight_state WHERE json_extract(watched, '$.cancelled') = 0 "
+                "ORDER BY departure")]
+            result["reset"] = True
+        else:
+            changes = [json.loads(entry) for (entry,) in store.execute(
+                "SELECT entry FROM change_log WHERE generation > ? ORDER BY rowid",
+                (decoded[1],))]
+        result["changes"] = changes
+        result["count"] = len(changes)
+        if scanned is not None:
+            result["scanned_flights"] = scanned
+        return result
+    finally:
+        store.close()
+
+
+COMMANDS = "list, next, date, range, year, years, journeys, pnr, search, stats, recent, changes, export, index, snapshot, batch, cache-stats, serve, stop"
+
+
+def run_command(conn, command, args, db_path=None, idx=None):
+    """Dispatch a single command against an open connection.
+
+    Shared by the one-shot CLI and the serve daemon so both answer
+    identically. When `idx` (an open sidecar index) is given, the commands
+    it covers read from it instead of the Flighty tables. Returns the
+    JSON-serializable result dict.
+
+    --fields projects flight lists; --after CURSOR (and --limit N for year
+    and date) pages list, recent, year and date. Paged requests always
+    read the Flighty tables, whose keyset scans make every page cheap.
+    """
+    command = command.lstrip("-")
+    fields = parse_field_list(pop_option(args, "--fields"))
+    page_limit = pop_option(args, "--limit") if command in ("year", "date") else None
+    cursor = pop_option(args, "--after")
+    try:
+        after = parse_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return {"error": str(e)}
+    if page_limit is not None:
+        if not page_limit.isdigit() or int(page_limit) < 1:
+            return {"error": f"Invalid --limit: {page_limit}. Use a positive integer"}
+        page_limit = int(page_limit)
+    paged = after is not None or page_limit is not None
+
+    if command == "index":
+        own_idx = idx is None
+        if own_idx:
+            idx = open_flight_index(conn, db_path, refresh=False)
+        try:
+            result = refresh_flight_index(conn, db_path, idx, force="--rebuild" in args)
+            result["rows"] = idx.execute("SELECT COUNT(*) FROM unified_flight").fetchone()[0]
+            result["path"] = idx.execute("PRAGMA database_list").fetchone()[2]
+            return result
+        finally:
+            if own_idx:
+                idx.close()
+
+    if command == "search":
+        limit = int(pop_option(args, "--limit", "10"))
+        if not args:
+            return {"error": "Usage: query_flights.py search <text> [--limit N]"}
+        own_idx = idx is None
+        if own_idx:
+            idx = open_flight_index(conn, db_path)
+        try:
+            return project_result(search_flights(conn, idx, " ".join(args), limit), fields)
+        finally:
+            if own_idx:
+                idx.close()
+
+    if command == "stats" and "--breakdown" in args:
+        args = [arg for arg in args if arg != "--breakdown"]
+        year = pop_option(args, "--year")
+        since = pop_option(args, "--since")
+        until = pop_option(args, "--until")
+        top = pop_option(args, "--top", "10")
+        try:
+            return get_stats_breakdown(conn, db_path, int(year) if year else None,
+                                       since, until, int(top))
+        except ValueError:
+            return {"error": "Usage: query_flights.py stats --breakdown [--year YYYY] "
+                             "[--since YYYY-MM-DD] [--until YYYY-MM-DD] [--top N]"}
+
+    if idx is not None and command == "recent":
+        result = indexed_recent_flights(conn, idx, int(args[0]) if args else 20, after)
+        return project_result(result, fields)
+
+    if idx is not None and not paged:
+        result = None
+        if command == "list":
+            limit = int(next((a for a in args if a.isdigit()), 20))
+            result = indexed_upcoming_flights(conn, idx, limit, "--include-friends" in args)
+        elif command == "next":
+            result = indexed_upcoming_flights(conn, idx, limit=1)
+            if result["flights"]:
+                result = {"next_flight": result["flights"][0]}
+            else:
+                result = {"next_flight": None, "message": "No upcoming flights found"}
+        elif command == "date" and args:
+            result = indexed_flights_on_date(conn, idx, args[0])
+        elif command == "range" and len(args) >= 2:
+            result = indexed_flights_in_range(conn, idx, args[0], args[1])
+        elif command == "year" and args and args[0].isdigit():
+            result = indexed_flights_by_year(conn, idx, int(args[0]))
+        elif command == "stats":
+            result = indexed_flight_stats(conn, idx)
+        if result is not None:
+            return project_result(result, fields)
+
+    if command == "list":
+        limit = 20
+        include_friends = False
+        engine = pop_option(args, "--engine", "python")
+        for arg in args:
+            if arg == "--include-friends":
+                include_friends = True
+            elif arg.isdigit():
+                limit = int(arg)
+        return list_upcoming_flights(conn, limit, include_friends, engine, fields, after)
+    if command == "next":
+        return get_next_flight(conn, fields)
+    if command == "date":
+        if not args:
+            return {"error": "Usage: query_flights.py date YYYY-MM-DD [--after CURSOR] [--limit N]"}
+        return project_result(get_flights_on_date(conn, args[0], after, page_limit), fields)
+    if command == "range":
+        if len(args) < 2:
+            return {"error": "Usage: query_flights.py range YYYY-MM-DD YYYY-MM-DD"}
+        return project_result(get_flights_in_range(conn, args[0], args[1]), fields)
+    if command == "pnr":
+        if not args:
+            return {"error": "Usage: query_flights.py pnr <confirmation_code>"}
+        return project_result(search_by_confirmation(conn, args[0]), fields)
+    if command == "stats":
+        return get_flight_stats(conn)
+    if command == "year":
+        if not args:
+            return {"error": "Usage: query_flights.py year YYYY [--after CURSOR] [--limit N]"}
+        try:
+            year = int(args[0])
+        except ValueError:
+            return {"error": f"Invalid year: {args[0]}. Use YYYY format"}
+        return get_flights_by_year(conn, year, fields, after, page_limit)
+    if command == "journeys":
+        year = pop_option(args, "--year")
+        since = pop_option(args, "--since")
+        until = pop_option(args, "--until")
+        through = pop_option(args, "--through")
+        layover = pop_option(args, "--layover-hours", str(DEFAULT_LAYOVER_HOURS))
+        max_stay = pop_option(args, "--max-stay-days", str(DEFAULT_MAX_STAY_DAYS))
+        try:
+            return get_journeys(conn, int(year) if year else None, since, until,
+                                through.upper() if through else None, float(layover),
+                                float(max_stay), summary_only="--summary" in args, idx=idx)
+        except ValueError:
+            return {"error": "Usage: query_flights.py journeys [--year YYYY] [--since YYYY-MM-DD] "
+                             "[--until YYYY-MM-DD] [--through AIRPORT] [--layover-hours H] "
+                             "[--max-stay-days D] [--summary]"}
+    if command == "changes":
+        return get_changes(conn, db_path, pop_option(args, "--since"))
+    if command == "years":
+        return project_result(get_flights_by_all_years(conn, summary_only="--summary" in args, idx=idx), fields)
+    if command == "recent":
+        limit = int(args[0]) if args else 20
+        return project_result(get_recent_flights(conn, limit, after), fields)
+    if command == "export":
+        return {"error": "export streams NDJSON and is not available through the daemon"}
+    return {"error": f"Unknown command: {command}. Use: {COMMANDS}"}
+
+
+# ---------------------------------------------------------------------------
+# Profiling
+# ---------------------------------------------------------------------------
+#
+# --profile swaps in a connection class whose cursors time every statement
+# (execute plus fetches) and count rows, wraps the row-processing helpers
+# with timers, and reports the lot - with EXPLAIN QUERY PLAN for each
+# query - as a separate JSON document on stderr or in a file.
+
+# The QueryProfile collecting timings while --profile is on
+_active_profile = None
+
+PROFILED_FUNCTIONS = (
+    "process_flight_rows", "flight_records", "materialize_flights", "localize_column",
+    "local_times", "dedup_by_route", "date_flight_summary", "recent_flight_summary",
+)
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that charges execute and fetch time to its statement."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._stat = _active_profile.statement(self.connection, sql, parameters,
+                                                   time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._stat = _active_profile.statement(self.connection, sql, None,
+                                                   time.perf_counter() - start)
+
+    def _charge(self, start, rows):
+        stat = getattr(self, "_stat", None)
+        if stat is not None:
+            stat["seconds"] += time.perf_counter() - start
+            stat["rows"] += rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._charge(start, row is not None)
+        return row
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args)
+        self._charge(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._charge(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._charge(start, 0)
+            raise
+        self._charge(start, 1)
+        return row
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose cursors are ProfilingCursors.
+
+    The trace hook also sees statements no cursor runs directly
+    (executescript bodies, trigger programs), which are counted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.label = str(args[0] if args else kwargs.get("database"))
+        self.set_trace_callback(lambda sql: _active_profile.traced(self.label, sql))
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() builds its cursor internally, bypassing cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class QueryProfile:
+    """Statement, function and serialization timings for one command."""
+
+    def __init__(self):
+        self.statements = {}
+        self.traced_count = 0
+        self.nested = {}
+        self.functions = {}
+        self.phases = {}
+
+    def statement(self, conn, sql, parameters, seconds):
+        key = (conn.label, " ".join(sql.split()))
+        stat = self.statements.get(key)
+        if stat is None:
+            stat = self.statements[key] = {
+                "conn": conn, "sql": key[1], "parameters": parameters,
+                "calls": 0, "seconds": 0.0, "rows": 0,
+            }
+        stat["calls"] += 1
+        stat["seconds"] += seconds
+        return stat
+
+    def traced(self, label, sql):
+        self.traced_count += 1
+        if sql.startswith("--"):  # Trigger sub-statement
+            key = " ".join(sql.split())
+            self.nested[key] = self.nested.get(key, 0) + 1
+
+    def wrap(self, name, func):
+        totals = self.functions.setdefault(name, [0, 0.0])
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                totals[0] += 1
+                totals[1] += time.perf_counter() - start
+
+        return timed
+
+    def phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def report(self, command, args, total_seconds):
+        statements = []
+        full_scans = []
+        for stat in sorted(self.statements.values(), key=lambda s: -s["seconds"]):
+            entry = {
+                "database": stat["conn"].label,
+                "sql": stat["sql"],
+                "calls": stat["calls"],
+                "ms": round(stat["seconds"] * 1000, 3),
+                "rows": stat["rows"],
+            }
+            if stat["sql"].upper().startswith(("SELECT", "WITH")) and stat["parameters"] is not None:
+                entry["plan"] = explain_query_plan(stat["conn"], stat["sql"], stat["parameters"])
+                scans = [step for step in entry["plan"] if is_full_scan(step)]
+                if scans:
+                    entry["full_scans"] = scans
+                    full_scans.extend(f"{entry['database']}: {step}" for step in scans)
+            statements.append(entry)
+
+        sql_seconds = sum(stat["seconds"] for stat in self.statements.values())
+        return {
+            "command": command,
+            "args": args,
+            "total_ms": round(total_seconds * 1000, 3),
+            "sql_ms": round(sql_seconds * 1000, 3),
+            "statement_count": self.traced_count,
+            "statements": statements,
+            "trigger_statements": self.nested,
+            "full_scans": full_scans,
+            "functions": {
+                name: {"calls": calls, "ms": round(seconds * 1000, 3)}
+                for name, (calls, seconds) in sorted(self.functions.items(), key=lambda f: -f[1][1])
+                if calls
+            },
+            **{f"{name}_ms": round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+        }
+
+
+def explain_query_plan(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN details for a statement, or the error text."""
+    try:
+        cursor = conn.cursor(sqlite3.Cursor)  # Plain cursor: not profiled itself
+        return [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+    except sqlite3.Error as e:
+        return [f"unavailable: {e}"]
+
+
+def is_full_scan(step):
+    """True for plan steps that read a whole table without an index."""
+    return (step.startswith("SCAN ") and "INDEX" not in step
+            and "VIRTUAL TABLE" not in step and "CONSTANT ROW" not in step)
+
+
+def start_profile():
+    """Install the profiler: profiled connections and timed helpers."""
+    global _active_profile
+    _active_profile = QueryProfile()
+    module = globals()
+    for name in PROFILED_FUNCTIONS:
+        module[name] = _active_profile.wrap(name, module[name])
+    return _active_profile
+
+
+# ---------------------------------------------------------------------------
+# Persistent result cache
+# ---------------------------------------------------------------------------
+#
+# One-shot invocations store their JSON result in a small SQLite file keyed
+# by command, arguments, the Flighty file fingerprint and a coarse "now"
+# bucket, so repeated questions skip the database entirely until Flighty
+# writes again. Entries are evicted least-recently-used past a size cap.
+
+RESULT_CACHE_PATH = CACHE_DIR / "result_cache.db"
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+CACHEABLE_COMMANDS = {"list", "next", "date", "range", "year", "years", "journeys", "pnr", "search", "stats", "recent"}
+
+# Commands whose result set depends on the current time get a short bucket;
+# the rest only carry days_until values, so an hour of drift is acceptable.
+NOW_BUCKET_SECONDS = {"list": 300, "next": 300, "recent": 300, "stats": 300}
+DEFAULT_NOW_BUCKET_SECONDS = 3600
+
+RESULT_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result (
+    key TEXT PRIMARY KEY,
+    command TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_last_used ON result (last_used);
+CREATE TABLE IF NOT EXISTS counter (
+    command TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def open_result_cache(cache_path=RESULT_CACHE_PATH):
+    """Open (creating if needed) the result cache database."""
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache = sqlite3.connect(cache_path, timeout=2)
+    cache.executescript(RESULT_CACHE_SCHEMA)
+    return cache
+
+
+def result_cache_key(command, args, db_path, now=None):
+    """Hash command, arguments, file fingerprint and the current now bucket."""
+    now = now if now is not None else datetime.now(tz=timezone.utc).timestamp()
+    bucket = int(now // NOW_BUCKET_SECONDS.get(command, DEFAULT_NOW_BUCKET_SECONDS))
+    material = json.dumps([command, args, file_fingerprint(db_path), bucket])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _count(cache, command, column):
+    cache.execute(f"""
+        INSERT INTO counter (command, {column}) VALUES (?, 1)
+        ON CONFLICT(command) DO UPDATE SET {column} = {column} + 1
+    """, (command,))
+
+
+def result_cache_get(cache, key, command):
+    """Return the cached result for key (and count a hit or miss)."""
+    row = cache.execute("SELECT value FROM result WHERE key = ?", (key,)).fetchone()
+    with cache:
+        if row is None:
+            _count(cache, command, "misses")
+            return None
+        _count(cache, command, "hits")
+        cache.execute("UPDATE result SET last_used = ? WHERE key = ?",
+                      (datetime.now(tz=timezone.utc).timestamp(), key))
+    return json.loads(row[0])
+
+
+def result_cache_put(cache, key, command, result, max_bytes=RESULT_CACHE_MAX_BYTES):
+    """Store a result, then evict least-recently-used entries past max_bytes."""
+    value = json.dumps(result)
+    now = datetime.now(tz=timezone.utc).timestamp()
+    with cache:
+        cache.execute(
+            "INSERT OR REPLACE INTO result VALUES (?, ?, ?, ?, ?, ?)",
+            (key, command, value, len(value), now, now),
+        )
+        total = cache.execute("SELECT COALESCE(SUM(size), 0) FROM result").fetchone()[0]
+        if total > max_bytes:
+            evict = []
+            for old_key, size in cache.execute("SELECT key, size FROM result ORDER BY last_used"):
+                if total <= max_bytes:
+                    break
+                evict.append((old_key,))
+                total -= size
+            cache.executemany("DELETE FROM result WHERE key = ?", evict)
+
+
+def result_cache_stats(cache, clear=False):
+    """Entry count, size and per-command hit/miss counters."""
+    if clear:
+        with cache:
+            cache.execute("DELETE FROM result")
+            cache.execute("DELETE FROM counter")
+    entries, size = cache.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM result").fetchone()
+    by_command = {}
+    hits = misses = 0
+    for command, command_hits, command_misses in cache.execute(
+            "SELECT command, hits, misses FROM counter ORDER BY command"):
+        by_command[command] = {"hits": command_hits, "misses": command_misses}
+        hits += command_hits
+        misses += command_misses
+    return {
+        "path": str(RESULT_CACHE_PATH),
+        "entries": entries,
+        "bytes": size,
+        "max_bytes": RESULT_CACHE_MAX_BYTES,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        "by_command": by_command,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Query daemon
+# ---------------------------------------------------------------------------
+#
+# `serve` keeps one warm read-only connection plus the per-user state in
+# memory and answers commands over a Unix domain socket. The protocol is
+# newline-delimited JSON: each request line is {"command": ..., "args": [...]}
+# and each response line is the command's result object. Clients also send
+# the "source" they want answered from (database path and snapshot flag);
+# a daemon serving anything else declines, and the client runs in-process.
+
+def daemon_source(db_path, snapshot=False):
+    """The {"db", "snapshot"} source a request is answered from."""
+    return {"db": str(Path(db_path).resolve()), "snapshot": bool(snapshot)}
+
+
+def _open_daemon_connection(db_path):
+    conn = connect_db(db_path, read_only=True)
+    invalidate_state_cache()
+    return conn, database_fingerprint(conn, db_path)
+
+
+def serve(db_path, socket_path=DEFAULT_SOCKET_PATH, idle_timeout=None, snapshot_source=None):
+    """Run the query daemon until a shutdown request or idle timeout.
+
+    With `snapshot_source`, `db_path` is the shadow snapshot of that
+    database and is refreshed before each request.
+    """
+    socket_path = Path(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if socket_path.exists():
+        if query_daemon("ping", [], socket_path) is not None:
+            return {"error": f"Daemon already running on {socket_path}"}
+        socket_path.unlink()  # Stale socket from a crashed daemon
+
+    conn, fingerprint = _open_daemon_connection(db_path)
+    served_source = daemon_source(snapshot_source or db_path, snapshot_source is not None)
+    idx = None
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(socket_path))
+    os.chmod(socket_path, 0o600)
+    server.listen(8)
+    server.settimeout(idle_timeout)
+
+    requests_served = 0
+    running = True
+    try:
+        while running:
+            try:
+                client, _ = server.accept()
+            except socket.timeout:
+                break  # Idle for too long
+
+            try:
+                with client, client.makefile("rwb") as stream:
+                    for line in stream:
+                        if not line.strip():
+                            continue
+                        try:
+                            request = json.loads(line)
+                            command = request.get("command", "list")
+                            args = [str(arg) for arg in request.get("args", [])]
+                            source = request.get("source")
+                        except (ValueError, AttributeError):
+                            command, args, source = None, [], None
+
+                        if command is None:
+                            result = {"error": "Invalid request: expected a JSON object per line"}
+                        elif source is not None and source != served_source:
+                            result = {"error": "Daemon serves a different database", "source_mismatch": True,
+                                      "served": served_source}
+                        elif command == "ping":
+                            result = {"ok": True, "pid": os.getpid(), "requests_served": requests_served}
+                        elif command == "shutdown":
+                            result = {"ok": True, "requests_served": requests_served}
+                            running = False
+                        else:
+                            # Drop cached user state if Flighty wrote since the last
+                            # request; reopen entirely if the file was replaced
+                            # (which is how a snapshot refresh lands).
+                            try:
+                                if snapshot_source is not None:
+                                    refresh_snapshot(snapshot_source, db_path)
+                                current = database_fingerprint(conn, db_path)
+                            except (OSError, sqlite3.Error) as e:
+                                current = None
+                                result = {"error": str(e)}
+                            if current is not None:
+                                if current[1] != fingerprint[1]:
+                                    conn.close()
+                                    conn, current = _open_daemon_connection(db_path)
+                                elif current != fingerprint:
+                                    invalidate_state_cache()
+                                fingerprint = current
+                                try:
+                                    if pop_flag(args, "--index"):
+                                        if idx is None:
+                                            idx = open_flight_index(conn, db_path)
+                                        else:
+                                            refresh_flight_index(conn, db_path, idx)
+                                        result = run_command(conn, command, args, db_path, idx)
+                                    else:
+                                        result = run_command(conn, command, args, db_path)
+                                except Exception as e:
+                                    result = {"error": str(e)}
+                            requests_served += 1
+
+                        stream.write(json.dumps(result).encode() + b"\n")
+                        stream.flush()
+                        if not running:
+                            break
+            except (BrokenPipeError, ConnectionResetError):
+                continue  # Client hung up mid-batch; keep serving others
+    finally:
+        server.close()
+        conn.close()
+        if idx is not None:
+            idx.close()
+        if socket_path.exists():
+            socket_path.unlink()
+
+    return {"stopped": True, "requests_served": requests_served}
+
+
+def query_daemon(command, args, socket_path=DEFAULT_SOCKET_PATH, timeout=30, source=None):
+    """Send one command to a running daemon.
+
+    Returns None when no daemon is listening, or it serves a different
+    `source`, so the caller can fall back to in-process execution.
+    """
+    results = query_daemon_many([(command, args)], socket_path, timeout, source)
+    return results[0] if results else None
+
+
+def query_daemon_many(requests, socket_path=DEFAULT_SOCKET_PATH, timeout=30, source=None):
+    """Send (command, args) pairs to a running daemon over one connection.
+
+    Returns the results in order, or None when no daemon is listening,
+    it serves a different `source` (see daemon_source()), or it stops
+    answering part way through.
+    """
+    socket_path = Path(socket_path)
+    if not socket_path.exists():
+        return None
+    results = []
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(str(socket_path))
+            with client.makefile("rwb") as stream:
+                for command, args in requests:
+                    request = {"command": command, "args": args}
+                    if source is not None:
+                        request["source"] = source
+                    stream.write(json.dumps(request).encode() + b"\n")
+                stream.flush()
+                for _ in requests:
+                    line = stream.readline()
+                    if not line:
+                        return None
+                    result = json.loads(line)
+                    if isinstance(result, dict) and result.get("source_mismatch"):
+                        return None
+                    results.append(result)
+    except OSError:
+        return None
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Batch mode
+# ---------------------------------------------------------------------------
+#
+# `batch` reads many commands from stdin and answers them in one process:
+# one connection, one lookup of the main user and superseded IDs, and one
+# pinned "now" shared by every command. Input is a JSON array or JSON lines
+# of daemon-protocol requests ({"command": ..., "args": [...]}) or plain
+# command strings such as "recent 5"; output is the array of results.
+
+# Commands that only read the Flighty tables and may run on worker threads.
+# index/search and --index requests write the sidecar and stay serial.
+BATCH_PARALLEL_COMMANDS = {"list", "next", "date", "range", "year", "years", "journeys", "pnr", "stats", "recent"}
+
+
+def parse_batch_requests(text):
+    """Parse batch input into (command, args) pairs; raises ValueError if malformed."""
+    text = text.strip()
+    if not text:
+        return []
+    if text.startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    requests = []
+    for item in items:
+        if isinstance(item, str) and item.split():
+            parts = item.split()
+            requests.append((parts[0], parts[1:]))
+        elif isinstance(item, dict) and item.get("command"):
+            args = item.get("args", [])
+            if not isinstance(args, list):
+                raise ValueError(f"Invalid args in batch request: {item!r}")
+            requests.append((str(item["command"]), [str(arg) for arg in args]))
+        else:
+            raise ValueError(f"Invalid batch request: {item!r}")
+    return requests
+
+
+def run_batch(db_path, requests, workers=1):
+    """Run (command, args) pairs against one database and return results in order.
+
+    With workers > 1, read-only commands fan out over a thread pool, each
+    thread on its own read-only connection; the rest run on the shared
+    connection in the calling thread. Per-request failures become
+    {"error": ...} entries rather than aborting the batch.
+    """
+    global _pinned_now
+    _pinned_now = current_timestamp()
+    conn = connect_db(db_path, read_only=True)
+    idx = None
+    results = [None] * len(requests)
+
+    def run_one(connection, command, args):
+        try:
+            return run_command(connection, command, args, db_path)
+        except Exception as e:
+            return {"error": str(e)}
+
+    try:
+        # Warm the shared per-user state before any worker needs it
+        get_main_user_id(conn)
+        get_superseded_flight_ids(conn)
+
+        parallel = []
+        serial = []
+        for position, (command, args) in enumerate(requests):
+            args = list(args)
+            if (workers > 1 and command.lstrip("-") in BATCH_PARALLEL_COMMANDS
+                    and "--index" not in args):
+                parallel.append((position, command, args))
+            else:
+                serial.append((position, command, args))
+
+        local = threading.local()
+        worker_connections = []
+        connections_lock = threading.Lock()
+
+        def run_on_worker(command, args):
+            if not hasattr(local, "conn"):
+                local.conn = connect_db(db_path, read_only=True, check_same_thread=False)
+                with connections_lock:
+                    worker_connections.append(local.conn)
+            return run_one(local.conn, command, args)
+
+        pool = ThreadPoolExecutor(max_workers=workers) if parallel else None
+        try:
+            futures = [(position, pool.submit(run_on_worker, command, args))
+                       for position, command, args in parallel]
+
+            for position, command, args in serial:
+                if pop_flag(args, "--index"):
+                    try:
+                        if idx is None:
+                            idx = open_flight_index(conn, db_path)
+                        results[position] = run_command(conn, command, args, db_path, idx)
+                    except Exception as e:
+                        results[position] = {"error": str(e)}
+                else:
+                    results[position] = run_one(conn, command, args)
+
+            for position, future in futures:
+                results[position] = future.result()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            for worker_conn in worker_connections:
+                worker_conn.close()
+    finally:
+        _pinned_now = None
+        if idx is not None:
+            idx.close()
+        conn.close()
+
+    return results
+
+
+def pop_option(args, name, default=None):
+    """Remove `name VALUE` from args and return VALUE (or default)."""
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            value = args[index + 1]
+            del args[index:index + 2]
+            return value
+        del args[index]
+    return default
+
+
+def pop_flag(args, name):
+    """Remove a boolean flag from args, returning whether it was present."""
+    if name in args:
+        args.remove(name)
+        return True
+    return False
+
+
+def format_result(result, compact=False):
+    """Serialize a result: indented by default, minimal with --compact."""
+    if compact:
+        return json.dumps(result, separators=(",", ":"), ensure_ascii=False)
+    return json.dumps(result, indent=2)
+
+
+def main():
+    """Main entry point."""
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "Usage: query_flights.py <command> [args]"}))
+        sys.exit(1)
+
+    command = sys.argv[1] if not sys.argv[1].startswith("--") else "list"
+    args = sys.argv[2:]
+    socket_path = Path(pop_option(args, "--socket", DEFAULT_SOCKET_PATH))
+    no_daemon = pop_flag(args, "--no-daemon")
+    no_cache = pop_flag(args, "--no-cache")
+    db_override = pop_option(args, "--db")
+    use_snapshot = pop_flag(args, "--snapshot")
+    # A daemon only answers when it serves exactly this database and mode
+    source = daemon_source(db_override or DEFAULT_DB_PATH, use_snapshot)
+    compact = pop_flag(args, "--compact")
+    profile = pop_flag(args, "--profile")
+    profile_file = pop_option(args, "--profile-file")
+    if profile or profile_file:
+        # Profile this process's own work: no daemon, no cached answers
+        no_daemon = no_cache = True
+        profile = start_profile()
+        profile_started = time.perf_counter()
+        profile_args = list(args)
+
+    if command == "stop":
+        result = query_daemon("shutdown", [], socket_path)
+        print(json.dumps(result or {"error": f"No daemon running on {socket_path}"}, indent=2))
+        return
+
+    if command == "cache-stats":
+        cache = open_result_cache()
+        result = result_cache_stats(cache, clear=pop_flag(args, "--clear"))
+        cache.close()
+        print(json.dumps(result, indent=2))
+        return
+
+    if command == "batch":
+        try:
+            workers = int(pop_option(args, "--workers", "1"))
+            batch_requests = parse_batch_requests(sys.stdin.read())
+        except ValueError as e:
+            print(json.dumps({"error": f"Invalid batch input: {e}"}))
+            sys.exit(1)
+
+    # Thin client: answer from a warm daemon when one is running
+    if command not in ("serve", "export", "snapshot") and not no_daemon:
+        if command == "batch":
+            # Worker threads need their own connections, so only serial
+            # batches go to the daemon (over a single socket connection)
+            result = query_daemon_many(batch_requests, socket_path, source=source) if workers <= 1 else None
+        else:
+            result = query_daemon(command, args, socket_path, source=source)
+        if result is not None:
+            print(format_result(result, compact))
+            return
+
+    # Check database
+    db_path, error = get_db_path(db_override)
+    if error:
+        print(json.dumps({"error": error}))
+        sys.exit(1)
+
+    if command == "snapshot":
+        try:
+            result = refresh_snapshot(db_path, force=pop_flag(args, "--force"))
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(json.dumps({"error": str(e)}))
+            sys.exit(1)
+        print(json.dumps(result, indent=2))
+        return
+
+    # Read the shadow snapshot in place of the live file from here on
+    source_path = None
+    if use_snapshot:
+        try:
+            refresh_snapshot(db_path)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(json.dumps({"error": f"Snapshot refresh failed: {e}"}))
+            sys.exit(1)
+        source_path, db_path = db_path, DEFAULT_SNAPSHOT_PATH
+
+    if command == "serve":
+        idle_timeout = pop_option(args, "--idle-timeout")
+        result = serve(db_path, socket_path, float(idle_timeout) if idle_timeout else None,
+                       snapshot_source=source_path)
+        print(json.dumps(result, indent=2))
+        return
+
+    if command == "batch":
+        try:
+            result = run_batch(db_path, batch_requests, workers)
+        except sqlite3.Error as e:
+            print(json.dumps({"error": str(e)}))
+            sys.exit(1)
+        print(format_result(result, compact))
+        if profile:
+            report = profile.report(command, profile_args, time.perf_counter() - profile_started)
+            if profile_file:
+                Path(profile_file).write_text(json.dumps({"profile": report}, indent=2))
+            else:
+                print(json.dumps({"profile": report}, indent=2), file=sys.stderr)
+        return
+
+    if command == "export":
+        conn = connect_db(db_path)
+        try:
+            result = export_flights(conn, args)
+        except BrokenPipeError:
+            # Downstream consumer (e.g. head) closed the pipe early
+            sys.stderr.close()
+            result = None
+        conn.close()
+        if result:
+            print(json.dumps(result, indent=2))
+            if "error" in result:
+                sys.exit(1)
+        return
+
+    # Persistent result cache; any cache failure just means running the query
+    cache = cache_key = None
+    if command.lstrip("-") in CACHEABLE_COMMANDS and not no_cache:
+        try:
+            cache = open_result_cache()
+            cache_key = result_cache_key(command.lstrip("-"), args, db_path)
+            result = result_cache_get(cache, cache_key, command.lstrip("-"))
+            if result is not None:
+                cache.close()
+                print(format_result(result, compact))
+                return
+        except (sqlite3.Error, OSError):
+            cache = None
+
+    # Execute command
+    try:
+        conn = connect_db(db_path)
+        idx = open_flight_index(conn, db_path) if pop_flag(args, "--index") else None
+        result = run_command(conn, command, args, db_path, idx)
+        if profile:
+            start = time.perf_counter()
+            output = format_result(result, compact)
+            profile.phase("serialization", time.perf_counter() - start)
+            report = profile.report(command, profile_args, time.perf_counter() - profile_started)
+            print(output)
+            if profile_file:
+                Path(profile_file).write_text(json.dumps({"profile": report}, indent=2))
+            else:
+                print(json.dumps({"profile": report}, indent=2), file=sys.stderr)
+            if idx is not None:
+                idx.close()
+            conn.close()
+            return
+        if idx is not None:
+            idx.close()
+        conn.close()
+        if cache is not None:
+            if "error" not in result:
+                try:
+                    result_cache_put(cache, cache_key, command.lstrip("-"), result)
+                except sqlite3.Error:
+                    pass
+            cache.close()
+        print(format_result(result, compact))
 
     except Exception as e:
         print(json.dumps({"error": str(e)}))
@@ -4,15 +4,23 @@ Query Tripsy database for trip information.
 Outputs structured JSON for easy parsing by Claude.
 """
 
+import bisect
+import hashlib
+import importlib.util
 import json
+import re
 import sqlite3
 import sys
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 # Tripsy database location (macOS)
 DEFAULT_DB_PATH = Path.home() / "Library/Group Containers/group.app.tripsy.ios/Tripsy.sqlite"
 
+# Local cache directory for sidecar files (never the Tripsy database itself)
+CACHE_DIR = Path.home() / ".cache/travel-agent"
+
 # Core Data epoch offset (Jan 1, 2001 vs Jan 1, 1970)
 CORE_DATA_OFFSET = 978307200
 
@@ -85,39 +93,65 @@ def list_upcoming_trips(conn, limit=20):
     return {"trips": trips, "count": len(trips)}
 
 
-def get_trip_details(conn, trip_name):
-    """Get full details for a specific trip including flights, hotels, activities."""
-    cursor = conn.cursor()
-    now_core_data = datetime.now().timestamp() - CORE_DATA_OFFSET
+TRIP_COLUMNS = "ZINTERNALIDENTIFIER, ZNAME, ZSTARTS, ZENDS, ZNOTES"
 
-    # Find the trip
-    cursor.execute("""
-        SELECT ZINTERNALIDENTIFIER, ZNAME, ZSTARTS, ZENDS, ZNOTES
-        FROM ZTRIP
-        WHERE ZNAME LIKE ? AND ZENDS > ?
-        ORDER BY ZSTARTS
-        LIMIT 1
-    """, (f"%{trip_name}%", now_core_data))
 
-    trip_row = cursor.fetchone()
-    if not trip_row:
-        return {"error": f"No upcoming trip found matching '{trip_name}'"}
+def trip_from_row(row):
+    """Trip summary dict from a TRIP_COLUMNS row."""
+    return {
+        "id": row[0],
+        "name": row[1],
+        "starts": convert_date(row[2]),
+        "ends": convert_date(row[3]),
+        "days_until": days_until(row[2]),
+        "notes": row[4]
+    }
+
 
-    trip = {
-        "id": trip_row[0],
-        "name": trip_row[1],
-        "starts": convert_date(trip_row[2]),
-        "ends": convert_date(trip_row[3]),
-        "days_until": days_until(trip_row[2]),
-        "notes": trip_row[4]
+def flight_from_row(row):
+    """Flight dict from a ZTRANSPORTATION segment row."""
+    return {
+        "airline": row[0],
+        "flight_number": row[1],
+        "departure": convert_timestamp(row[2]),
+        "arrival": convert_timestamp(row[3]),
+        "from": row[4],
+        "to": row[5],
+        "confirmation": row[6],
+        "type": row[7]
     }
 
-    trip_start = trip_row[2]
-    trip_end = trip_row[3]
 
-    # Get flights (with 1 day buffer)
-    cursor.execute("""
-        SELECT
+def hotel_from_row(row):
+    """Hotel dict from a ZHOSTING segment row."""
+    return {
+        "name": row[0],
+        "address": row[1],
+        "checkin": convert_timestamp(row[2]),
+        "checkout": convert_timestamp(row[3]),
+        "confirmation": row[4],
+        "room_type": row[5],
+        "phone": row[6]
+    }
+
+
+def activity_from_row(row):
+    """Activity dict from a ZACTIVITY segment row."""
+    return {
+        "name": row[0],
+        "datetime": convert_timestamp(row[1]),
+        "location": row[2],
+        "confirmation": row[3],
+        "type": row[4],
+        "notes": row[5]
+    }
+
+
+# Segments attached to a trip by time: (result key, table, time column,
+# seconds of slack either side of the trip, columns, row converter).
+# Flights and hotels get a day of slack for red-eyes and early check-ins.
+TRIP_SEGMENTS = (
+    ("flights", "ZTRANSPORTATION", "ZDEPARTURE", 86400, """
             ZCOMPANY as airline,
             ZTRANSPORTNUMBER as flight_number,
             ZDEPARTURE as departure,
@@ -125,83 +159,412 @@ def get_trip_details(conn, trip_name):
             ZDEPARTUREADDRESS as from_location,
             ZARRIVALADDRESS as to_location,
             ZRESERVATIONCODE as confirmation,
-            ZINTERNALTYPE as type
-        FROM ZTRANSPORTATION
-        WHERE ZDEPARTURE >= ? - 86400 AND ZDEPARTURE <= ? + 86400
-        ORDER BY ZDEPARTURE
-    """, (trip_start, trip_end))
-
-    flights = []
-    for row in cursor.fetchall():
-        flights.append({
-            "airline": row[0],
-            "flight_number": row[1],
-            "departure": convert_timestamp(row[2]),
-            "arrival": convert_timestamp(row[3]),
-            "from": row[4],
-            "to": row[5],
-            "confirmation": row[6],
-            "type": row[7]
-        })
-
-    # Get hotels
-    cursor.execute("""
-        SELECT
+            ZINTERNALTYPE as type""", flight_from_row),
+    ("hotels", "ZHOSTING", "ZSTARTS", 86400, """
             ZNAME as name,
             ZADDRESS as address,
             ZSTARTS as checkin,
             ZENDS as checkout,
             ZRESERVATIONCODE as confirmation,
             ZROOMTYPE as room_type,
-            ZPHONE as phone
-        FROM ZHOSTING
-        WHERE ZSTARTS >= ? - 86400 AND ZSTARTS <= ? + 86400
-        ORDER BY ZSTARTS
-    """, (trip_start, trip_end))
-
-    hotels = []
-    for row in cursor.fetchall():
-        hotels.append({
-            "name": row[0],
-            "address": row[1],
-            "checkin": convert_timestamp(row[2]),
-            "checkout": convert_timestamp(row[3]),
-            "confirmation": row[4],
-            "room_type": row[5],
-            "phone": row[6]
-        })
-
-    # Get activities
-    cursor.execute("""
-        SELECT
+            ZPHONE as phone""", hotel_from_row),
+    ("activities", "ZACTIVITY", "ZSTARTS", 0, """
             ZNAME as name,
             ZSTARTS as datetime,
             ZADDRESS as location,
             ZRESERVATIONCODE as confirmation,
             ZINTERNALTYPE as type,
-            ZNOTES as notes
-        FROM ZACTIVITY
-        WHERE ZSTARTS >= ? AND ZSTARTS <= ?
+            ZNOTES as notes""", activity_from_row),
+)
+
+
+def segment_range_query(table, column, columns):
+    """SELECT for one segment table over [lo, hi], time column first."""
+    return f"""
+        SELECT {column},{columns}
+        FROM {table}
+        WHERE {column} >= ? AND {column} <= ?
+        ORDER BY {column}
+    """
+
+
+class TripIndex:
+    """Which trips own a segment time, by bisect over trip boundaries.
+
+    Built once per invocation from every dated ZTRIP row, each trip
+    widened by `slack` seconds either side. The sorted window boundaries
+    cut the timeline into elementary intervals; each boundary records the
+    trips covering it and the trips covering the gap up to the next
+    boundary, so a lookup is a single bisect however the trips overlap.
+    """
+
+    def __init__(self, trips, slack):
+        self.trips = trips  # (id, name, starts, ends), ordered by start
+        self.slack = slack
+        self.positions = {trip[0]: position for position, trip in enumerate(trips)}
+        windows = [(start - slack, end + slack, position)
+                   for position, (_, _, start, end) in enumerate(trips)]
+        by_start = sorted(windows)
+        by_end = sorted(windows, key=lambda window: window[1])
+        self.points = sorted({point for lo, hi, _ in windows for point in (lo, hi)})
+        self.at = []
+        self.after = []
+        active = set()
+        opened = closed = 0
+        for point in self.points:
+            while opened < len(by_start) and by_start[opened][0] <= point:
+                active.add(by_start[opened][2])
+                opened += 1
+            self.at.append(tuple(sorted(active)))
+            while closed < len(by_end) and by_end[closed][1] <= point:
+                active.discard(by_end[closed][2])
+                closed += 1
+            self.after.append(tuple(sorted(active)))
+
+    def covering(self, at):
+        """Positions of the trips whose widened window contains `at`."""
+        position = bisect.bisect_right(self.points, at) - 1
+        if position < 0:
+            return ()
+        if self.points[position] == at:
+            return self.at[position]
+        return self.after[position]
+
+    def owners(self, at):
+        """Positions of the trips owning a segment at `at`.
+
+        A trip whose own dates contain the segment wins over one that only
+        reaches it through slack. More than one owner is a conflict.
+        """
+        candidates = self.covering(at)
+        if len(candidates) > 1:
+            inside = tuple(position for position in candidates
+                           if self.trips[position][2] <= at <= self.trips[position][3])
+            if inside:
+                return inside
+        return candidates
+
+    def describe(self, owners):
+        """Trip ids and names for a tuple of positions."""
+        return [{"id": self.trips[position][0], "name": self.trips[position][1]}
+                for position in owners]
+
+
+def load_trip_indexes(conn):
+    """A TripIndex per TRIP_SEGMENTS slack, from one ZTRIP scan."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ZINTERNALIDENTIFIER, ZNAME, ZSTARTS, ZENDS
+        FROM ZTRIP
+        WHERE ZSTARTS IS NOT NULL AND ZENDS IS NOT NULL
         ORDER BY ZSTARTS
-    """, (trip_start, trip_end))
+    """)
+    trips = cursor.fetchall()
+    return {slack: TripIndex(trips, slack) for slack in {segment[3] for segment in TRIP_SEGMENTS}}
 
-    activities = []
-    for row in cursor.fetchall():
-        activities.append({
-            "name": row[0],
-            "datetime": convert_timestamp(row[1]),
-            "location": row[2],
-            "confirmation": row[3],
-            "type": row[4],
-            "notes": row[5]
-        })
 
-    return {
-        "trip": trip,
-        "flights": flights,
-        "hotels": hotels,
-        "activities": activities
-    }
+def segment_conflict(key, segment, index, owners):
+    """Conflict entry for a segment owned by several overlapping trips."""
+    return {"type": key, "segment": segment, "trips": index.describe(owners)}
+
+
+# ---------------------------------------------------------------------------
+# Trip search
+# ---------------------------------------------------------------------------
+#
+# A sidecar SQLite file holding the trigrams of every trip's name and notes
+# and of the hotels and activities it owns. `trip <name>` ranks trips by the
+# share of the query's trigrams each one contains, so partial names and
+# typos ("Tokio") still match. The file is rebuilt only when the Tripsy
+# database's fingerprint changes.
+
+DEFAULT_SEARCH_PATH = CACHE_DIR / "tripsy_search.db"
+
+SEARCH_SCHEMA_VERSION = "1"
+
+# A hit in the trip's own name outranks one in its hotels, activities or notes
+SEARCH_FIELD_WEIGHTS = {"name": 1.0, "hotel": 0.9, "activity": 0.9, "notes": 0.8}
+
+# Least weighted share of the query's trigrams a trip must contain
+MIN_SEARCH_SCORE = 0.4
+
+# Runner-up trips returned next to the best match
+SEARCH_ALTERNATES = 5
+
+SEARCH_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS search_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS search_doc (
+        doc_id INTEGER PRIMARY KEY,
+        trip_id TEXT,
+        field TEXT,
+        text TEXT,
+        gram_count INTEGER,
+        starts REAL,
+        ends REAL
+    );
+    CREATE TABLE IF NOT EXISTS search_gram (
+        gram TEXT,
+        doc_id INTEGER,
+        PRIMARY KEY (gram, doc_id)
+    ) WITHOUT ROWID;
+"""
+
+
+def trigrams(text):
+    """Padded per-word trigrams of `text`, lowercased (pg_trgm style).
+
+    Padding each word with two leading spaces and one trailing space gives
+    short words and word starts their own trigrams.
+    """
+    grams = set()
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def search_documents(conn):
+    """(trip id, field, text, starts, ends) for every searchable text.
+
+    Hotels and activities are attributed to their owning trip(s) through
+    the trip indexes, the same way trip details assign them.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ZINTERNALIDENTIFIER, ZNAME, ZNOTES, ZSTARTS, ZENDS
+        FROM ZTRIP
+    """)
+    trips = {}
+    for trip_id, name, notes, starts, ends in cursor.fetchall():
+        trips[trip_id] = (starts, ends)
+        for field, text in (("name", name), ("notes", notes)):
+            if text:
+                yield trip_id, field, text, starts, ends
+
+    indexes = load_trip_indexes(conn)
+    for field, table in (("hotel", "ZHOSTING"), ("activity", "ZACTIVITY")):
+        index = indexes[next(slack for key, tbl, _, slack, _, _ in TRIP_SEGMENTS if tbl == table)]
+        cursor.execute(f"""
+            SELECT ZSTARTS, ZNAME
+            FROM {table}
+            WHERE ZSTARTS IS NOT NULL AND ZNAME IS NOT NULL
+        """)
+        for at, text in cursor.fetchall():
+            for trip in index.describe(index.owners(at)):
+                yield (trip["id"], field, text) + trips[trip["id"]]
+
+
+def rebuild_search_index(conn, search):
+    """Replace the sidecar's documents and trigrams from the Tripsy database."""
+    with search:
+        search.execute("DELETE FROM search_gram")
+        search.execute("DELETE FROM search_doc")
+        for trip_id, field, text, starts, ends in search_documents(conn):
+            grams = trigrams(text)
+            if not grams:
+                continue
+            doc_id = search.execute(
+                "INSERT INTO search_doc (trip_id, field, text, gram_count, starts, ends)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (trip_id, field, text, len(grams), starts, ends),
+            ).lastrowid
+            search.executemany("INSERT INTO search_gram VALUES (?, ?)",
+                               ((gram, doc_id) for gram in grams))
+
+
+def open_search_index(conn, db_path, search_path=DEFAULT_SEARCH_PATH):
+    """Open the trip search sidecar, rebuilding it if Tripsy has changed."""
+    search_path = Path(search_path)
+    if search_path.resolve() == Path(db_path).resolve():
+        raise ValueError("Refusing to use the Tripsy database as the search index")
+    search_path.parent.mkdir(parents=True, exist_ok=True)
+    search = sqlite3.connect(search_path, factory=_connection_class)
+    search.executescript(SEARCH_SCHEMA)
+    meta = dict(search.execute("SELECT key, value FROM search_meta").fetchall())
+    # Same inode/size/mtime fingerprint query_flights.py keys its caches on
+    fingerprint = json.dumps(load_flighty_module().file_fingerprint(db_path))
+    if (meta.get("schema_version") != SEARCH_SCHEMA_VERSION or meta.get("fingerprint") != fingerprint
+            or meta.get("source") != str(db_path)):
+        rebuild_search_index(conn, search)
+        with search:
+            search.executemany("INSERT OR REPLACE INTO search_meta VALUES (?, ?)", (
+                ("schema_version", SEARCH_SCHEMA_VERSION),
+                ("fingerprint", fingerprint),
+                ("source", str(db_path)),
+            ))
+    return search
+
+
+def search_trips(search, query, after=None):
+    """Rank trips against `query`, best first.
+
+    Each document scores the share of the query's trigrams it contains,
+    weighted by field; a trip keeps its best document. Ties prefer the
+    closer overall match, then the earlier trip. Only trips ending after
+    `after` (a Core Data timestamp) are considered when it is given.
+    Returns [(trip id, score, field, text)].
+    """
+    grams = trigrams(query)
+    if not grams:
+        return []
+    placeholders = ",".join("?" * len(grams))
+    end_clause = "AND d.ends > ?" if after is not None else ""
+    rows = search.execute(f"""
+        SELECT d.trip_id, d.field, d.text, d.gram_count, d.starts, COUNT(*) AS shared
+        FROM search_gram g
+        JOIN search_doc d ON d.doc_id = g.doc_id
+        WHERE g.gram IN ({placeholders}) {end_clause}
+        GROUP BY g.doc_id
+    """, list(grams) + ([after] if after is not None else [])).fetchall()
+
+    best = {}
+    for trip_id, field, text, gram_count, starts, shared in rows:
+        score = SEARCH_FIELD_WEIGHTS[field] * shared / len(grams)
+        closeness = shared / (len(grams) + gram_count - shared)
+        rank = (-score, -closeness, starts if starts is not None else float("inf"))
+        if score >= MIN_SEARCH_SCORE and (trip_id not in best or rank < best[trip_id][0]):
+            best[trip_id] = (rank, field, text)
+    ranked = sorted(best.items(), key=lambda item: item[1][0])
+    return [(trip_id, round(-rank[0], 3), field, text) for trip_id, (rank, field, text) in ranked]
+
+
+def get_trip_details(conn, trip_name, db_path=DEFAULT_DB_PATH):
+    """Get full details for a specific trip including flights, hotels, activities.
+
+    The trip is the best fuzzy match among upcoming trips; runners-up are
+    listed under "alternates".
+    """
+    cursor = conn.cursor()
+    now_core_data = datetime.now().timestamp() - CORE_DATA_OFFSET
+
+    # Find the trip
+    search = open_search_index(conn, db_path)
+    try:
+        matches = search_trips(search, trip_name, after=now_core_data)[:SEARCH_ALTERNATES + 1]
+    finally:
+        search.close()
+    if not matches:
+        return {"error": f"No upcoming trip found matching '{trip_name}'"}
+
+    placeholders = ",".join("?" * len(matches))
+    cursor.execute(f"""
+        SELECT {TRIP_COLUMNS}
+        FROM ZTRIP
+        WHERE ZINTERNALIDENTIFIER IN ({placeholders})
+    """, [match[0] for match in matches])
+    trip_rows = {row[0]: row for row in cursor.fetchall()}
+    matches = [match for match in matches if match[0] in trip_rows]
+    if not matches:
+        return {"error": f"No upcoming trip found matching '{trip_name}'"}
+
+    trip_id, score, field, text = matches[0]
+    trip_row = trip_rows[trip_id]
+    result = {"trip": trip_from_row(trip_row)}
+    result["match"] = {"score": score, "field": field, "text": text}
+    trip_start = trip_row[2]
+    trip_end = trip_row[3]
+    indexes = load_trip_indexes(conn)
+    conflicts = []
+
+    for key, table, column, slack, columns, convert in TRIP_SEGMENTS:
+        index = indexes[slack]
+        position = index.positions.get(trip_row[0])
+        cursor.execute(segment_range_query(table, column, columns),
+                       (trip_start - slack, trip_end + slack))
+        segments = result[key] = []
+        for row in cursor.fetchall():
+            owners = index.owners(row[0])
+            if position not in owners:
+                continue
+            segment = convert(row[1:])
+            segments.append(segment)
+            if len(owners) > 1:
+                conflicts.append(segment_conflict(key, segment, index, owners))
+
+    if conflicts:
+        result["conflicts"] = conflicts
+    result["alternates"] = [
+        {**trip_from_row(trip_rows[trip_id]), "score": score, "field": field, "text": text}
+        for trip_id, score, field, text in matches[1:]
+    ]
+    return result
+
+
+def get_trip_itineraries(conn, limit=10):
+    """Full itineraries (flights, hotels, activities) for upcoming trips.
+
+    One range query per segment table covers every trip window at once,
+    and the trip indexes hand each segment to the trip(s) owning it.
+    """
+    cursor = conn.cursor()
+    now_core_data = datetime.now().timestamp() - CORE_DATA_OFFSET
+
+    cursor.execute(f"""
+        SELECT {TRIP_COLUMNS}
+        FROM ZTRIP
+        WHERE ZENDS > ?
+        ORDER BY ZSTARTS
+        LIMIT ?
+    """, (now_core_data, limit))
+    trip_rows = cursor.fetchall()
+    dated = [row for row in trip_rows if row[2] is not None]
+
+    indexes = load_trip_indexes(conn)
+    itineraries = [{"trip": trip_from_row(row)} for row in trip_rows]
+    conflicts = []
+    for key, table, column, slack, columns, convert in TRIP_SEGMENTS:
+        index = indexes[slack]
+        selected = {index.positions[row[0]]: itinerary
+                    for row, itinerary in zip(trip_rows, itineraries) if row[2] is not None}
+        for itinerary in itineraries:
+            itinerary[key] = []
+        if not dated:
+            continue
+        cursor.execute(segment_range_query(table, column, columns),
+                       (min(row[2] for row in dated) - slack, max(row[3] for row in dated) + slack))
+        for row in cursor.fetchall():
+            owners = index.owners(row[0])
+            wanted = [selected[position] for position in owners if position in selected]
+            if not wanted:
+                continue
+            segment = convert(row[1:])
+            for itinerary in wanted:
+                itinerary[key].append(segment)
+            if len(owners) > 1:
+                conflicts.append(segment_conflict(key, segment, index, owners))
+
+    result = {"trips": itineraries, "count": len(itineraries)}
+    if conflicts:
+        result["conflicts"] = conflicts
+    return result
+
+
+def get_segment_conflicts(conn):
+    """Segments owned by several overlapping trips, and unowned segment counts."""
+    cursor = conn.cursor()
+    indexes = load_trip_indexes(conn)
+    conflicts = []
+    unassigned = {}
+    for key, table, column, slack, columns, convert in TRIP_SEGMENTS:
+        index = indexes[slack]
+        cursor.execute(f"""
+            SELECT {column},{columns}
+            FROM {table}
+            WHERE {column} IS NOT NULL
+            ORDER BY {column}
+        """)
+        unassigned[key] = 0
+        for row in cursor.fetchall():
+            owners = index.owners(row[0])
+            if not owners:
+                unassigned[key] += 1
+            elif len(owners) > 1:
+                conflicts.append(segment_conflict(key, convert(row[1:]), index, owners))
+
+    return {"conflicts": conflicts, "count": len(conflicts), "unassigned": unassigned}
 
 
 def get_next_flights(conn, limit=10):
@@ -275,8 +638,620 @@ def get_next_hotels(conn, limit=5):
     return {"hotels": hotels, "count": len(hotels)}
 
 
+# ---------------------------------------------------------------------------
+# Reconciliation with Flighty
+# ---------------------------------------------------------------------------
+#
+# `reconcile` loads Tripsy's flights and Flighty's history for the same
+# window, normalizes both to (flight number, local date) and (departure,
+# arrival, local date) keys, and hash-joins them in one pass over Tripsy
+# with +/-1 day tolerance. Flighty rows for the same local date and route
+# (codeshares, re-imports) form one segment carrying all their numbers.
+
+FLIGHTY_SCRIPT = Path(__file__).resolve().parent / "query_flights.py"
+
+# Tripsy seat columns by app version; the first one present is compared
+TRIPSY_SEAT_COLUMNS = ("ZSEATNUMBER", "ZSEAT")
+
+# Departure/arrival differences within this many seconds are not mismatches
+RECONCILE_TIME_TOLERANCE = 300
+
+# Airline designator (IATA two-character or ICAO three-letter) plus number
+FLIGHT_NUMBER_PATTERN = re.compile(r"([A-Z]{3}|[A-Z][A-Z0-9]|[0-9][A-Z])?0*(\d{1,4})[A-Z]?")
+
+AIRPORT_IN_PARENS = re.compile(r"\(([A-Z]{3})\)")
+AIRPORT_WORD = re.compile(r"\b[A-Z]{3}\b")
+
+
+# query_flights.py, once imported
+_flighty_module = None
+
+
+def load_flighty_module():
+    """Import the sibling query_flights.py as a module (once per process).
+
+    Sharing one module keeps its caches, and an installed profiler, in
+    effect for every caller.
+    """
+    global _flighty_module
+    if _flighty_module is None:
+        spec = importlib.util.spec_from_file_location("query_flights", FLIGHTY_SCRIPT)
+        _flighty_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_flighty_module)
+    return _flighty_module
+
+
+def normalize_flight_number(text):
+    """'AS 0449' / 'as449' / '449' -> ('AS', '449') / (None, '449'), or None."""
+    if not text:
+        return None
+    match = FLIGHT_NUMBER_PATTERN.fullmatch(re.sub(r"[^A-Z0-9]", "", text.upper()))
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+
+def parse_airport_code(address, known_codes):
+    """IATA code from a Tripsy address: "(SEA)" first, else a known bare code."""
+    if not address:
+        return None
+    match = AIRPORT_IN_PARENS.search(address)
+    if match:
+        return match.group(1)
+    for word in AIRPORT_WORD.findall(address):
+        if word in known_codes:
+            return word
+    return None
+
+
+def shift_date(date_str, days):
+    """YYYY-MM-DD moved by a number of days."""
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def load_flighty_segments(query_flights, conn, start_ts, end_ts):
+    """Flighty history in the window as segments keyed by local date and route.
+
+    Each segment keeps the row the route dedup would keep (a tail number
+    wins) and the normalized numbers of every row folded into it.
+    """
+    segments = {}
+    for row in query_flights.query_history_rows(conn, start_ts, end_ts):
+        date = query_flights.convert_date(row[9], row[24])
+        key = (date, row[3], row[6])
+        segment = segments.get(key)
+        if segment is None:
+            segment = segments[key] = {"row": row, "date": date, "numbers": set()}
+        elif row[21] and not segment["row"][21]:
+            segment["row"] = row
+        number = normalize_flight_number(f"{row[0] or ''}{row[2] or ''}")
+        if number:
+            segment["numbers"].add(number[1])
+    return list(segments.values())
+
+
+def table_columns(conn, table):
+    """Column names of a Tripsy table (they vary between app versions)."""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def tripsy_seat_column(conn):
+    """The ZTRANSPORTATION seat column in this Tripsy version, or None."""
+    columns = table_columns(conn, "ZTRANSPORTATION")
+    return next((column for column in TRIPSY_SEAT_COLUMNS if column in columns), None)
+
+
+def reconcile_mismatches(query_flights, flight, segment, zones):
+    """Field-level differences between a Tripsy flight and its Flighty segment."""
+    row = segment["row"]
+    mismatches = {}
+    for field, tripsy_ts, flighty_ts, code in (
+        ("departure", flight["departure_ts"], row[9], row[3]),
+        ("arrival", flight["arrival_ts"], row[10], row[6]),
+    ):
+        if (tripsy_ts is not None and flighty_ts is not None
+                and abs(tripsy_ts - flighty_ts) > RECONCILE_TIME_TOLERANCE):
+            zone = zones.get(code)
+            mismatches[field] = {
+                "tripsy": query_flights.convert_timestamp(tripsy_ts, zone),
+                "flighty": query_flights.convert_timestamp(flighty_ts, zone),
+            }
+    for field, tripsy_value, flighty_value in (
+        ("confirmation", flight["confirmation"], row[11]),
+        ("seat", flight["seat"], row[12]),
+    ):
+        if (tripsy_value and flighty_value
+                and tripsy_value.strip().upper() != flighty_value.strip().upper()):
+            mismatches[field] = {"tripsy": tripsy_value, "flighty": flighty_value}
+    if flight["number"] and flight["number"][1] not in segment["numbers"]:
+        mismatches["flight_number"] = {
+            "tripsy": flight["flight"],
+            "flighty": f"{row[0] or ''} {row[2] or ''}".strip(),
+        }
+    return mismatches
+
+
+def flighty_summary(segment):
+    """Compact description of a Flighty segment."""
+    row = segment["row"]
+    return {
+        "flight": f"{row[0] or ''} {row[2] or ''}".strip(),
+        "date": segment["date"],
+        "route": f"{row[3]} → {row[6]}",
+        "confirmation": row[11],
+    }
+
+
+def reconcile_flights(conn, since=None, until=None, flighty_db=None):
+    """Match Tripsy flights against Flighty's history.
+
+    Defaults to flights from today on. Returns matched pairs (with any
+    field mismatches), Tripsy-only and Flighty-only flights, and counts.
+    """
+    query_flights = load_flighty_module()
+    flighty_path, error = query_flights.get_db_path(flighty_db)
+    if error:
+        return {"error": error}
+
+    start = datetime.strptime(since, "%Y-%m-%d") if since else datetime.now().replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    end = datetime.strptime(until, "%Y-%m-%d") + timedelta(days=1) if until else None
+    start_ts = start.timestamp()
+    end_ts = end.timestamp() - 1 if end else None
+
+    # Both sides load a day beyond the window so edge flights still match
+    flighty_conn = query_flights.connect_db(flighty_path, read_only=True)
+    try:
+        zones = dict(flighty_conn.execute(
+            "SELECT iata, timeZoneIdentifier FROM Airport WHERE iata IS NOT NULL").fetchall())
+        segments = load_flighty_segments(
+            query_flights, flighty_conn, start_ts - 86400, end_ts + 86400 if end_ts else None)
+    finally:
+        flighty_conn.close()
+
+    by_number = {}
+    by_route = {}
+    for segment in segments:
+        row = segment["row"]
+        for number in segment["numbers"]:
+            by_number.setdefault((number, segment["date"]), []).append(segment)
+        by_route.setdefault((row[3], row[6], segment["date"]), []).append(segment)
+
+    seat_column = tripsy_seat_column(conn)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT
+            ZTRANSPORTNUMBER as flight_number,
+            ZDEPARTURE as departure,
+            ZARRIVAL as arrival,
+            ZDEPARTUREADDRESS as from_location,
+            ZARRIVALADDRESS as to_location,
+            ZRESERVATIONCODE as confirmation,
+            {seat_column or "NULL"} as seat
+        FROM ZTRANSPORTATION
+        WHERE ZINTERNALTYPE = 'airplane'
+          AND ZDEPARTURE >= ? {"AND ZDEPARTURE <= ?" if end_ts else ""}
+        ORDER BY ZDEPARTURE
+    """, [start_ts - 86400 - CORE_DATA_OFFSET]
+        + ([end_ts + 86400 - CORE_DATA_OFFSET] if end_ts else []))
+
+    # A segment matches once per folded flight number (Tripsy may list
+    # codeshares separately), and once by route if no number applies
+    matched = []
+    tripsy_only = []
+    matched_ids = set()
+    matched_numbers = set()
+    for number, departure, arrival, from_location, to_location, confirmation, seat in cursor.fetchall():
+        dep_code = parse_airport_code(from_location, zones)
+        arr_code = parse_airport_code(to_location, zones)
+        departure_ts = departure + CORE_DATA_OFFSET
+        flight = {
+            "flight": number,
+            "number": normalize_flight_number(number),
+            "date": query_flights.convert_date(departure_ts, zones.get(dep_code)),
+            "departure_ts": departure_ts,
+            "arrival_ts": arrival + CORE_DATA_OFFSET if arrival is not None else None,
+            "confirmation": confirmation,
+            "seat": seat,
+        }
+
+        found = None
+        for offset in (0, -1, 1):
+            date = shift_date(flight["date"], offset)
+            if flight["number"]:
+                for segment in by_number.get((flight["number"][1], date), ()):
+                    row = segment["row"]
+                    if (id(segment), flight["number"][1]) not in matched_numbers and (
+                            dep_code in (None, row[3]) and arr_code in (None, row[6])):
+                        found = (segment, "flight_number", offset)
+                        break
+            if not found and dep_code and arr_code:
+                for segment in by_route.get((dep_code, arr_code, date), ()):
+                    if id(segment) not in matched_ids:
+                        found = (segment, "route", offset)
+                        break
+            if found:
+                break
+
+        in_window = departure_ts >= start_ts and (end_ts is None or departure_ts <= end_ts)
+        if not found:
+            if in_window:
+                tripsy_only.append({
+                    "flight": number,
+                    "date": flight["date"],
+                    "route": f"{dep_code or from_location} → {arr_code or to_location}",
+                    "confirmation": confirmation,
+                })
+            continue
+
+        # A buffer-day match still consumes its segment, so neither side
+        # reports it, but only pairs inside the window are listed
+        segment, matched_on, offset = found
+        matched_ids.add(id(segment))
+        if matched_on == "flight_number":
+            matched_numbers.add((id(segment), flight["number"][1]))
+        if not in_window:
+            continue
+        entry = {**flighty_summary(segment), "tripsy_flight": number, "matched_on": matched_on}
+        if offset:
+            entry["date_offset_days"] = offset
+        mismatches = reconcile_mismatches(query_flights, flight, segment, zones)
+        if mismatches:
+            entry["mismatches"] = mismatches
+        matched.append(entry)
+
+    flighty_only = [
+        flighty_summary(segment) for segment in segments
+        if id(segment) not in matched_ids
+        and segment["row"][9] >= start_ts and (end_ts is None or segment["row"][9] <= end_ts)
+    ]
+    return {
+        "since": start.strftime("%Y-%m-%d"),
+        "until": until,
+        "matched": matched,
+        "tripsy_only": tripsy_only,
+        "flighty_only": flighty_only,
+        "counts": {
+            "matched": len(matched),
+            "with_mismatches": sum(1 for entry in matched if "mismatches" in entry),
+            "tripsy_only": len(tripsy_only),
+            "flighty_only": len(flighty_only),
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Calendar export
+# ---------------------------------------------------------------------------
+#
+# `ics` streams trips (all-day events), flights and other transport, hotel
+# stays and activities as an RFC 5545 calendar, one table at a time in
+# fetchmany() batches. UIDs derive from Tripsy identifiers so re-imports
+# update events instead of duplicating them. A sidecar store records a hash
+# and change time per UID on every export; `--since` emits only the events
+# changed since then, plus cancellations for items deleted from Tripsy.
+
+DEFAULT_ICS_STORE_PATH = CACHE_DIR / "tripsy_ics.db"
+
+ICS_BATCH_SIZE = 500
+
+# RFC 5545 content lines are folded at 75 octets
+ICS_LINE_OCTETS = 75
+
+# Activities without an end time are shown as an hour long
+DEFAULT_ACTIVITY_SECONDS = 3600
+
+ICS_STORE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ics_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS ics_item (
+        uid TEXT PRIMARY KEY,
+        hash TEXT,
+        sequence INTEGER,
+        changed_at REAL,
+        seen INTEGER,
+        removed INTEGER NOT NULL DEFAULT 0,
+        dtstart TEXT,
+        summary TEXT
+    );
+"""
+
+
+def ics_escape(text):
+    """Escape a TEXT property value."""
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def ics_fold(line):
+    """Fold a content line at 75 octets without splitting UTF-8 sequences."""
+    data = line.encode()
+    if len(data) <= ICS_LINE_OCTETS:
+        return line
+    parts = []
+    start = 0
+    limit = ICS_LINE_OCTETS
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start = end
+        limit = ICS_LINE_OCTETS - 1  # continuation lines start with a space
+    return "\r\n ".join(parts)
+
+
+def ics_datetime(unix_ts):
+    """UTC DATE-TIME value for a Unix timestamp."""
+    return datetime.fromtimestamp(unix_ts, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def ics_date(ts, days=0):
+    """DATE value for a Core Data timestamp's local date, shifted by days."""
+    return (datetime.fromtimestamp(ts + CORE_DATA_OFFSET) + timedelta(days=days)).strftime("%Y%m%d")
+
+
+def identifier_sql(columns):
+    """SQL for a row's stable identifier: ZINTERNALIDENTIFIER, else its Z_PK."""
+    if "ZINTERNALIDENTIFIER" in columns:
+        return "COALESCE(ZINTERNALIDENTIFIER, 'pk' || Z_PK)"
+    return "'pk' || Z_PK"
+
+
+def describe_lines(*pairs):
+    """DESCRIPTION text from (label, value) pairs, skipping empty values."""
+    return "\n".join(f"{label}: {value}" for label, value in pairs if value)
+
+
+def trip_event(row):
+    identifier, name, starts, ends, notes = row
+    return f"trip-{identifier}", [
+        ("DTSTART;VALUE=DATE", ics_date(starts)),
+        ("DTEND;VALUE=DATE", ics_date(ends if ends is not None else starts, days=1)),
+        ("SUMMARY", ics_escape(name or "Trip")),
+        ("DESCRIPTION", ics_escape(notes or "")),
+        ("TRANSP", "TRANSPARENT"),
+    ]
+
+
+def transport_event(row):
+    identifier, company, number, departure, arrival, from_location, to_location, confirmation, kind = row
+    dep_code = parse_airport_code(from_location, ())
+    arr_code = parse_airport_code(to_location, ())
+    label = "Flight" if kind == "airplane" else (kind or "Transport").capitalize()
+    route = f"{dep_code or from_location or '?'} → {arr_code or to_location or '?'}"
+    title = " ".join(part for part in (label, number or company) if part)
+    return f"transport-{identifier}", [
+        ("DTSTART", ics_datetime(departure + CORE_DATA_OFFSET)),
+        ("DTEND", ics_datetime((arrival if arrival is not None else departure) + CORE_DATA_OFFSET)),
+        ("SUMMARY", ics_escape(f"{title}: {route}")),
+        ("LOCATION", ics_escape(from_location or "")),
+        ("DESCRIPTION", ics_escape(describe_lines(
+            ("Carrier", company), ("From", from_location), ("To", to_location),
+            ("Confirmation", confirmation)))),
+    ]
+
+
+def hotel_event(row):
+    identifier, name, address, checkin, checkout, confirmation, room_type, phone = row
+    return f"hotel-{identifier}", [
+        ("DTSTART", ics_datetime(checkin + CORE_DATA_OFFSET)),
+        ("DTEND", ics_datetime((checkout if checkout is not None else checkin) + CORE_DATA_OFFSET)),
+        ("SUMMARY", ics_escape(f"Hotel: {name or 'Stay'}")),
+        ("LOCATION", ics_escape(address or "")),
+        ("DESCRIPTION", ics_escape(describe_lines(
+            ("Confirmation", confirmation), ("Room", room_type), ("Phone", phone)))),
+        ("TRANSP", "TRANSPARENT"),
+    ]
+
+
+def activity_event(row):
+    identifier, name, starts, ends, location, confirmation, notes = row
+    ends = ends if ends is not None else starts + DEFAULT_ACTIVITY_SECONDS
+    return f"activity-{identifier}", [
+        ("DTSTART", ics_datetime(starts + CORE_DATA_OFFSET)),
+        ("DTEND", ics_datetime(ends + CORE_DATA_OFFSET)),
+        ("SUMMARY", ics_escape(name or "Activity")),
+        ("LOCATION", ics_escape(location or "")),
+        ("DESCRIPTION", ics_escape(describe_lines(("Confirmation", confirmation), ("Notes", notes)))),
+    ]
+
+
+def calendar_queries(conn):
+    """(SQL, event builder) per Tripsy table, adapted to its columns."""
+    activity_columns = table_columns(conn, "ZACTIVITY")
+    return (
+        (f"""
+            SELECT {identifier_sql(table_columns(conn, "ZTRIP"))}, ZNAME, ZSTARTS, ZENDS, ZNOTES
+            FROM ZTRIP WHERE ZSTARTS IS NOT NULL ORDER BY ZSTARTS
+        """, trip_event),
+        (f"""
+            SELECT {identifier_sql(table_columns(conn, "ZTRANSPORTATION"))}, ZCOMPANY, ZTRANSPORTNUMBER,
+                   ZDEPARTURE, ZARRIVAL, ZDEPARTUREADDRESS, ZARRIVALADDRESS, ZRESERVATIONCODE, ZINTERNALTYPE
+            FROM ZTRANSPORTATION WHERE ZDEPARTURE IS NOT NULL ORDER BY ZDEPARTURE
+        """, transport_event),
+        (f"""
+            SELECT {identifier_sql(table_columns(conn, "ZHOSTING"))}, ZNAME, ZADDRESS, ZSTARTS, ZENDS,
+                   ZRESERVATIONCODE, ZROOMTYPE, ZPHONE
+            FROM ZHOSTING WHERE ZSTARTS IS NOT NULL ORDER BY ZSTARTS
+        """, hotel_event),
+        (f"""
+            SELECT {identifier_sql(activity_columns)}, ZNAME, ZSTARTS,
+                   {"ZENDS" if "ZENDS" in activity_columns else "NULL"},
+                   ZADDRESS, ZRESERVATIONCODE, ZNOTES
+            FROM ZACTIVITY WHERE ZSTARTS IS NOT NULL ORDER BY ZSTARTS
+        """, activity_event),
+    )
+
+
+def iter_calendar_events(conn):
+    """Yield (uid, properties) for every trip and segment, batch by batch."""
+    for sql, build in calendar_queries(conn):
+        cursor = conn.execute(sql)
+        while True:
+            rows = cursor.fetchmany(ICS_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                key, properties = build(row)
+                yield f"{key}@tripsy", [(name, value) for name, value in properties if value]
+
+
+def event_lines(uid, properties, sequence, changed_at, status=None):
+    """Folded VEVENT content lines."""
+    yield "BEGIN:VEVENT"
+    yield ics_fold(f"UID:{uid}")
+    yield f"DTSTAMP:{ics_datetime(changed_at)}"
+    yield f"SEQUENCE:{sequence}"
+    if status:
+        yield f"STATUS:{status}"
+    for name, value in properties:
+        yield ics_fold(f"{name}:{value}")
+    yield "END:VEVENT"
+
+
+def iter_calendar(conn, since=None, store_path=DEFAULT_ICS_STORE_PATH, stats=None):
+    """Yield the calendar's folded content lines.
+
+    Every run refreshes the change store: a new or altered event gets a new
+    hash, a bumped SEQUENCE and changed_at = now, and items no longer in
+    Tripsy are marked removed. With `since` (a Unix timestamp) only events
+    changed at or after it are emitted, plus STATUS:CANCELLED events for
+    removed items. The store commits once the last line has been yielded.
+    """
+    store_path = Path(store_path)
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    store = sqlite3.connect(store_path, factory=_connection_class)
+    stats = stats if stats is not None else {}
+    stats.update(events=0, changed=0, cancelled=0)
+    try:
+        store.executescript(ICS_STORE_SCHEMA)
+        row = store.execute("SELECT value FROM ics_meta WHERE key = 'generation'").fetchone()
+        generation = int(row[0]) + 1 if row else 1
+        now = time.time()
+
+        yield "BEGIN:VCALENDAR"
+        yield "VERSION:2.0"
+        yield "PRODID:-//travel-agent//Tripsy export//EN"
+        yield "CALSCALE:GREGORIAN"
+        yield "X-WR-CALNAME:Tripsy"
+
+        for uid, properties in iter_calendar_events(conn):
+            digest = hashlib.sha1(repr(properties).encode()).hexdigest()
+            known = store.execute(
+                "SELECT hash, sequence, changed_at, removed FROM ics_item WHERE uid = ?", (uid,)).fetchone()
+            if known is None or known[0] != digest or known[3]:
+                sequence = known[1] + 1 if known else 0
+                changed_at = now
+                stats["changed"] += 1
+            else:
+                sequence, changed_at = known[1], known[2]
+            summary = next((value for name, value in properties if name == "SUMMARY"), "")
+            dtstart = next((f"{name}:{value}" for name, value in properties if name.startswith("DTSTART")), "")
+            store.execute("INSERT OR REPLACE INTO ics_item VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+                          (uid, digest, sequence, changed_at, generation, dtstart, summary))
+            if since is None or changed_at >= since:
+                stats["events"] += 1
+                yield from event_lines(uid, properties, sequence, changed_at)
+
+        store.execute("""
+            UPDATE ics_item SET removed = 1, sequence = sequence + 1, changed_at = ?
+            WHERE seen < ? AND removed = 0
+        """, (now, generation))
+        if since is not None:
+            for uid, sequence, changed_at, dtstart, summary in store.execute("""
+                SELECT uid, sequence, changed_at, dtstart, summary FROM ics_item
+                WHERE removed = 1 AND changed_at >= ?
+            """, (since,)).fetchall():
+                name, _, value = dtstart.partition(":")
+                stats["cancelled"] += 1
+                yield from event_lines(uid, [(name, value), ("SUMMARY", summary)],
+                                       sequence, changed_at, status="CANCELLED")
+
+        yield "END:VCALENDAR"
+        store.execute("INSERT OR REPLACE INTO ics_meta VALUES ('generation', ?)", (str(generation),))
+        store.commit()
+    finally:
+        store.close()
+
+
+def parse_since(value):
+    """Unix timestamp for a YYYY-MM-DD or ISO 8601 --since value (local time if naive)."""
+    return datetime.fromisoformat(value).timestamp()
+
+
+def write_calendar(conn, out, since=None):
+    """Stream the calendar to a text file object with CRLF line endings."""
+    stats = {}
+    for line in iter_calendar(conn, since, stats=stats):
+        out.write(line + "\r\n")
+    return stats
+
+
+def option_value(args, name):
+    """Value following `name` in args, or None."""
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Profiling
+# ---------------------------------------------------------------------------
+#
+# --profile (stderr) or --profile-file PATH: per-statement timings and row
+# counts, EXPLAIN QUERY PLAN with full-table scans flagged, and time spent
+# in the conversion helpers and JSON serialization. Uses the profiler in
+# query_flights.py, with this script's helpers wrapped as well.
+
+PROFILED_FUNCTIONS = ("convert_timestamp", "convert_date", "days_until")
+
+# Connection class for every database this script opens; profiled while
+# --profile is on
+_connection_class = sqlite3.Connection
+
+
+def start_profile():
+    """Install the profiler: profiled connections and timed helpers."""
+    global _connection_class
+    query_flights = load_flighty_module()
+    profile = query_flights.start_profile()
+    _connection_class = query_flights.ProfilingConnection
+    module = globals()
+    for name in PROFILED_FUNCTIONS:
+        module[name] = profile.wrap(name, module[name])
+    return profile
+
+
+def pop_profile_options(argv):
+    """Remove --profile / --profile-file PATH from argv.
+
+    Returns (enabled, path or None).
+    """
+    enabled = "--profile" in argv
+    if enabled:
+        argv.remove("--profile")
+    path = None
+    if "--profile-file" in argv:
+        index = argv.index("--profile-file")
+        path = argv[index + 1] if index + 1 < len(argv) else None
+        del argv[index:index + 2]
+        enabled = True
+    return enabled, path
+
+
 def main():
     """Main entry point."""
+    profile, profile_file = pop_profile_options(sys.argv)
+    if profile:
+        profile = start_profile()
+        profile_started = time.perf_counter()
+        profile_args = sys.argv[2:]
+
     # Parse command
     if len(sys.argv) < 2:
         print(json.dumps({"error": "Usage: query_trips.py <command> [args]"}))
@@ -292,7 +1267,7 @@ def main():
 
     # Execute command
     try:
-        conn = sqlite3.connect(db_path)
+        conn = sqlite3.connect(db_path, factory=_connection_class)
 
         if command == "list" or command == "--list":
             limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
@@ -302,7 +1277,29 @@ def main():
                 result = {"error": "Usage: query_trips.py trip <trip_name>"}
             else:
                 trip_name = " ".join(sys.argv[2:])
-                result = get_trip_details(conn, trip_name)
+                result = get_trip_details(conn, trip_name, db_path)
+        elif command == "trips":
+            full = "--full" in sys.argv
+            args = [arg for arg in sys.argv[2:] if arg != "--full"]
+            limit = int(args[0]) if args else 10
+            result = get_trip_itineraries(conn, limit) if full else list_upcoming_trips(conn, limit)
+        elif command == "conflicts":
+            result = get_segment_conflicts(conn)
+        elif command == "reconcile":
+            args = sys.argv[2:]
+            result = reconcile_flights(conn, option_value(args, "--since"), option_value(args, "--until"),
+                                       option_value(args, "--flighty-db"))
+        elif command == "ics":
+            args = sys.argv[2:]
+            since = option_value(args, "--since")
+            since = parse_since(since) if since else None
+            output = option_value(args, "--output")
+            if not output:
+                write_calendar(conn, sys.stdout, since)
+                result = None  # The calendar itself was the output
+            else:
+                with open(output, "w", newline="") as out:
+                    result = {"output": output, **write_calendar(conn, out, since)}
         elif command == "flights" or command == "--flights":
             limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10
             result = get_next_flights(conn, limit)
@@ -310,10 +1307,25 @@ def main():
             limit = int(sys.argv[2]) if len(sys.argv) > 2 else 5
             result = get_next_hotels(conn, limit)
         else:
-            result = {"error": f"Unknown command: {command}. Use: list, trip, flights, hotels"}
+            result = {"error": f"Unknown command: {command}. Use: list, trip, trips, conflicts, reconcile, ics, flights, hotels"}
+
+        if profile:
+            start = time.perf_counter()
+            output = json.dumps(result, indent=2) if result is not None else None
+            profile.phase("serialization", time.perf_counter() - start)
+            report = profile.report(command, profile_args, time.perf_counter() - profile_started)
+            conn.close()
+            if output is not None:
+                print(output)
+            if profile_file:
+                Path(profile_file).write_text(json.dumps({"profile": report}, indent=2))
+            else:
+                print(json.dumps({"profile": report}, indent=2), file=sys.stderr)
+            return
 
         conn.close()
-        print(json.dumps(result, indent=2))
+        if result is not None:
+            print(json.dumps(result, indent=2))
 
     except Exception as e:
         print(json.dumps({"error": str(e)}))
@@ -0,0 +1,125 @@
+"""
+Shared fixtures for the travel-agent script tests.
+
+The scripts are standalone files, so they are imported from the parent
+directory the same way benchmark_flights.py loads them. HOME points at a
+temporary directory before any import, keeping the sidecar caches
+(~/.cache/travel-agent) away from the real ones.
+"""
+
+import importlib.util
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+SCRIPT_DIR = Path(__file__).resolve().parent.parent
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="travel-agent-tests-")
+
+# Fixed generator inputs, so every run tests the same database
+SEED = 1
+SIZE = 3000
+ANCHOR = 1767225600.0  # 2026-01-01T00:00:00Z
+
+# The Tripsy (Core Data) tables query_trips.py reads; timestamps are seconds
+# since 2001-01-01
+TRIPSY_SCHEMA = """
+CREATE TABLE ZTRIP (
+    Z_PK INTEGER PRIMARY KEY, ZINTERNALIDENTIFIER VARCHAR, ZNAME VARCHAR,
+    ZSTARTS TIMESTAMP, ZENDS TIMESTAMP, ZNOTES VARCHAR
+);
+CREATE TABLE ZTRANSPORTATION (
+    Z_PK INTEGER PRIMARY KEY, ZTRIP INTEGER, ZINTERNALIDENTIFIER VARCHAR, ZCOMPANY VARCHAR,
+    ZTRANSPORTNUMBER VARCHAR, ZDEPARTURE TIMESTAMP, ZARRIVAL TIMESTAMP,
+    ZDEPARTUREADDRESS VARCHAR, ZARRIVALADDRESS VARCHAR, ZRESERVATIONCODE VARCHAR,
+    ZINTERNALTYPE VARCHAR, ZSEATNUMBER VARCHAR
+);
+CREATE TABLE ZHOSTING (
+    Z_PK INTEGER PRIMARY KEY, ZTRIP INTEGER, ZINTERNALIDENTIFIER VARCHAR, ZNAME VARCHAR,
+    ZADDRESS VARCHAR, ZSTARTS TIMESTAMP, ZENDS TIMESTAMP, ZRESERVATIONCODE VARCHAR,
+    ZROOMTYPE VARCHAR, ZPHONE VARCHAR
+);
+CREATE TABLE ZACTIVITY (
+    Z_PK INTEGER PRIMARY KEY, ZTRIP INTEGER, ZINTERNALIDENTIFIER VARCHAR, ZNAME VARCHAR,
+    ZSTARTS TIMESTAMP, ZENDS TIMESTAMP, ZADDRESS VARCHAR, ZRESERVATIONCODE VARCHAR,
+    ZINTERNALTYPE VARCHAR, ZNOTES VARCHAR
+);
+"""
+
+
+def load_script(name):
+    """Import a sibling script as a module."""
+    spec = importlib.util.spec_from_file_location(name, SCRIPT_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def query_flights():
+    return load_script("query_flights")
+
+
+@pytest.fixture(scope="session")
+def query_trips():
+    return load_script("query_trips")
+
+
+@pytest.fixture(scope="session")
+def flighty_db(tmp_path_factory):
+    """Path of a synthetic Flighty database (generate_flighty_db.py)."""
+    path = tmp_path_factory.mktemp("flighty") / "flighty.db"
+    load_script("generate_flighty_db").generate(path, SIZE, SEED, ANCHOR)
+    return path
+
+
+@pytest.fixture
+def flighty_conn(query_flights, flighty_db):
+    """A fresh connection with the per-process state cache cleared."""
+    query_flights.invalidate_state_cache()
+    conn = query_flights.connect_db(flighty_db)
+    yield conn
+    conn.close()
+    query_flights.invalidate_state_cache()
+
+
+@pytest.fixture(scope="session")
+def mixed_dates(query_flights, flighty_db):
+    """Dates where a manual flight departs before a tracked one."""
+    conn = query_flights.connect_db(flighty_db)
+    flights = query_flights.get_flights_in_range(conn, "2000-01-01", "2099-12-31")["flights"]
+    conn.close()
+    sources = {}
+    for flight in flights:
+        sources.setdefault(flight["date"], []).append(flight["source"])
+    return [date for date, seen in sources.items()
+            if "manual" in seen and "tracked" in seen[seen.index("manual"):]]
+
+
+@pytest.fixture(params=["America/Los_Angeles", "Pacific/Auckland"])
+def machine_tz(request, monkeypatch):
+    """Run under a machine timezone far from UTC."""
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def tripsy_home(tmp_path):
+    """A HOME holding an empty Tripsy database at its default location.
+
+    Returns (home, database path); tests insert the rows they need.
+    """
+    home = tmp_path / "home"
+    db_path = home / "Library/Group Containers/group.app.tripsy.ios/Tripsy.sqlite"
+    db_path.parent.mkdir(parents=True)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(TRIPSY_SCHEMA)
+    conn.close()
+    return home, db_path
@@ -0,0 +1,39 @@
+"""stats --breakdown totals agree with the year views, backfill included."""
+
+import pytest
+
+
+@pytest.fixture
+def all_years(query_flights, flighty_conn):
+    return query_flights.get_flights_by_all_years(flighty_conn, summary_only=True)
+
+
+def test_whole_history_totals_match_years(query_flights, flighty_conn, flighty_db, all_years):
+    breakdown = query_flights.get_stats_breakdown(flighty_conn, flighty_db, top=0)
+    assert breakdown["total_flights"] == all_years["total_flights"]
+    assert breakdown["total_distance_km"] == pytest.approx(all_years["total_distance_km"])
+    assert 0 < breakdown["backfilled_distance_flights"] < breakdown["total_flights"]
+
+
+def test_year_totals_match_year_bucket(query_flights, flighty_conn, flighty_db, all_years):
+    for bucket in all_years["years"]:
+        breakdown = query_flights.get_stats_breakdown(flighty_conn, flighty_db, year=bucket["year"])
+        assert breakdown["total_flights"] == bucket["count"], bucket["year"]
+        assert breakdown["total_distance_km"] == pytest.approx(bucket["total_distance_km"])
+
+
+def test_groups_sum_to_totals(query_flights, flighty_conn, flighty_db):
+    breakdown = query_flights.get_stats_breakdown(flighty_conn, flighty_db, top=0)
+    route_km = sum(route["distance_km"] for route in breakdown["routes"])
+    assert route_km == pytest.approx(breakdown["total_distance_km"])
+    for dimension in ("routes", "airlines", "aircraft", "cabins"):
+        assert sum(entry["count"] for entry in breakdown[dimension]) == breakdown["total_flights"]
+
+
+def test_date_bounds_use_local_departure_date(query_flights, flighty_conn, flighty_db, all_years, machine_tz):
+    bucket = all_years["years"][len(all_years["years"]) // 2]
+    year = bucket["year"]
+    breakdown = query_flights.get_stats_breakdown(
+        flighty_conn, flighty_db, since=f"{year}-01-01", until=f"{year}-12-31")
+    assert breakdown["total_flights"] == bucket["count"]
+    assert breakdown["total_distance_km"] == pytest.approx(bucket["total_distance_km"])
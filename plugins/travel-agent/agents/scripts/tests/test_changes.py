@@ -0,0 +1,116 @@
+"""changes --since: tokens, generations and the new/changed/cancelled log."""
+
+import shutil
+import sqlite3
+
+import pytest
+from conftest import ANCHOR
+
+
+@pytest.fixture
+def feed(query_flights, flighty_db, tmp_path, monkeypatch):
+    """A copy of the synthetic database with "now" pinned, and a poll helper.
+
+    Yields (poll, edit, upcoming): poll(since) runs get_changes against a
+    private store, edit(sql, params) commits a write to the copy, and
+    upcoming holds (flight id, user id) of tracked flights still to come.
+    """
+    db_path = tmp_path / "flighty.db"
+    shutil.copy(flighty_db, db_path)
+    monkeypatch.setattr(query_flights, "_pinned_now", ANCHOR)
+    query_flights.invalidate_state_cache()
+    conn = query_flights.connect_db(db_path)
+    main_user_id = query_flights.get_main_user_id(conn)
+    rows = query_flights.query_tracked_upcoming(conn, ANCHOR, main_user_id, False, 20)
+    upcoming = list(dict.fromkeys(row[23] for row in rows))
+    store_path = tmp_path / "changes.db"
+
+    def poll(since=None, path=db_path, connection=conn):
+        return query_flights.get_changes(connection, path, since, store_path)
+
+    def edit(sql, params=()):
+        writer = sqlite3.connect(db_path)
+        with writer:
+            writer.execute(sql, params)
+        writer.close()
+        query_flights.invalidate_state_cache()
+
+    yield poll, edit, upcoming, main_user_id
+    conn.close()
+    query_flights.invalidate_state_cache()
+
+
+def test_first_poll_and_bad_token_reset(feed):
+    poll, _, upcoming, _ = feed
+    first = poll()
+    assert first["reset"] is True
+    assert first["count"] >= len(upcoming) > 3
+    assert {entry["kind"] for entry in first["changes"]} == {"snapshot"}
+    assert poll("not-a-token")["reset"] is True
+
+    again = poll(first["token"])
+    assert again == {"token": first["token"], "changes": [], "count": 0}
+
+
+def test_gate_time_and_deleted_edits(feed):
+    poll, edit, upcoming, main_user_id = feed
+    token = poll()["token"]
+    gate_id, time_id, deleted_id = upcoming[:3]
+    edit("UPDATE Flight SET departureGate = 'Z99' WHERE id = ?", (gate_id,))
+    edit("UPDATE Flight SET lastKnownDepartureDate = lastKnownDepartureDate + 3600 WHERE id = ?", (time_id,))
+    edit("UPDATE UserFlight SET deleted = ? WHERE flightId = ? AND userId = ?",
+         (ANCHOR, deleted_id, main_user_id))
+
+    result = poll(token)
+    assert "reset" not in result
+    kinds = sorted(entry["kind"] for entry in result["changes"])
+    assert kinds == ["cancelled", "changed", "changed"]
+    changed = [set(entry["changes"]) for entry in result["changes"] if entry["kind"] == "changed"]
+    assert {"departure.gate"} in changed and {"departure.datetime"} in changed
+    gate = next(entry for entry in result["changes"] if "departure.gate" in entry.get("changes", {}))
+    assert gate["changes"]["departure.gate"]["to"] == "Z99"
+
+    # The same token replays the log; the new token sees nothing more
+    assert poll(token)["changes"] == result["changes"]
+    assert poll(result["token"])["changes"] == []
+
+
+def test_new_manual_booking(feed):
+    poll, edit, upcoming, main_user_id = feed
+    token = poll()["token"]
+    edit("INSERT INTO ManualFlight (id, number, departureAirportId, scheduledArrivalAirportId, "
+         "lastKnownDepartureDate, lastKnownArrivalDate) "
+         "SELECT 'zz-new', 'ZZ 1', departureAirportId, scheduledArrivalAirportId, ?, ? "
+         "FROM Flight WHERE id = ?", (ANCHOR + 5 * 86400, ANCHOR + 5 * 86400 + 7200, upcoming[0]))
+    edit("INSERT INTO UserManualFlight VALUES ('zz-link', 'zz-new', ?, 1, NULL)", (main_user_id,))
+    result = poll(token)
+    assert [(entry["kind"], entry["flight"]) for entry in result["changes"]] == [("new", "ZZ 1")]
+
+
+def test_old_generations_are_pruned(query_flights, feed, monkeypatch):
+    poll, edit, upcoming, _ = feed
+    monkeypatch.setattr(query_flights, "CHANGE_LOG_GENERATIONS", 2)
+    first = poll()["token"]
+    tokens = []
+    for gate in ("Y1", "Y2", "Y3"):
+        edit("UPDATE Flight SET departureGate = ? WHERE id = ?", (gate, upcoming[0]))
+        tokens.append(poll()["token"])
+
+    assert poll(first)["reset"] is True
+    latest = poll(tokens[0])
+    assert "reset" not in latest
+    assert [entry["changes"]["departure.gate"]["to"] for entry in latest["changes"]] == ["Y2", "Y3"]
+
+
+def test_different_database_resets_store(query_flights, feed, flighty_db, tmp_path):
+    poll, edit, upcoming, _ = feed
+    token = poll()["token"]
+    other_path = tmp_path / "other.db"
+    shutil.copy(flighty_db, other_path)
+    other = query_flights.connect_db(other_path)
+    try:
+        result = poll(token, path=other_path, connection=other)
+    finally:
+        other.close()
+    assert result["reset"] is True
+    assert result["token"] != token
@@ -0,0 +1,36 @@
+"""The warm daemon answers only for the database and mode it serves."""
+
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+def start_daemon(query_flights, db_path):
+    socket_path = Path(tempfile.mkdtemp(prefix="qf-")) / "daemon.sock"
+    thread = threading.Thread(target=query_flights.serve, args=(db_path, socket_path, 30), daemon=True)
+    thread.start()
+    for _ in range(100):
+        if query_flights.query_daemon("ping", [], socket_path) is not None:
+            return socket_path, thread
+        time.sleep(0.05)
+    raise RuntimeError("daemon did not start")
+
+
+def test_daemon_declines_other_sources(query_flights, flighty_db, tmp_path):
+    socket_path, thread = start_daemon(query_flights, flighty_db)
+    try:
+        served = query_flights.daemon_source(flighty_db)
+        result = query_flights.query_daemon("stats", [], socket_path, source=served)
+        assert result is not None and result["total_flights"] > 0
+
+        snapshot = query_flights.daemon_source(flighty_db, snapshot=True)
+        assert query_flights.query_daemon("stats", [], socket_path, source=snapshot) is None
+
+        other = query_flights.daemon_source(tmp_path / "other.db")
+        assert query_flights.query_daemon("stats", [], socket_path, source=other) is None
+        assert query_flights.query_daemon_many([("stats", []), ("next", [])], socket_path,
+                                               source=other) is None
+    finally:
+        query_flights.query_daemon("shutdown", [], socket_path)
+        thread.join(5)
@@ -0,0 +1,74 @@
+"""Columnar exports hold every deduped flight, across record batches."""
+
+import io
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def ndjson_count(query_flights, flighty_conn):
+    return sum(1 for _ in query_flights.iter_flight_export(flighty_conn))
+
+
+@pytest.mark.parametrize("export_format", ["arrow", "parquet"])
+def test_pyarrow_round_trip(query_flights, flighty_conn, ndjson_count, tmp_path, export_format):
+    pa = pytest.importorskip("pyarrow")
+    output = tmp_path / f"flights.{export_format}"
+    result = query_flights.export_flights(flighty_conn, ["--format", export_format, "--output", str(output)])
+    assert "error" not in result
+    assert result["rows"] == ndjson_count > query_flights.EXPORT_BATCH_SIZE
+
+    if export_format == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(output)
+    else:
+        with pa.ipc.open_file(output) as reader:
+            table = reader.read_all()
+    assert table.num_rows == ndjson_count
+    assert table.column("dep_code").null_count < ndjson_count
+
+
+def test_columnar_round_trip(query_flights, flighty_conn, ndjson_count, tmp_path):
+    output = tmp_path / "flights.fltcol"
+    result = query_flights.export_flights(flighty_conn, ["--format", "columnar", "--output", str(output)])
+    assert result["rows"] == ndjson_count
+    columns = query_flights.read_columnar_export(output)
+    assert len(columns["departure"]) == len(columns["dep_code"]) == ndjson_count
+
+
+@pytest.mark.parametrize("export_format", ["arrow", "parquet"])
+def test_pyarrow_formats_need_pyarrow(query_flights, flighty_conn, tmp_path, monkeypatch, export_format):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    output = tmp_path / f"flights.{export_format}"
+    result = query_flights.export_flights(flighty_conn, ["--format", export_format, "--output", str(output)])
+    assert "pyarrow" in result["error"]
+    assert not output.exists()
+
+
+def test_failed_export_removes_partial_file(query_flights, flighty_conn, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    real_batches = query_flights.iter_columnar_batches
+
+    def bad_second_batch(conn, since=None, until=None):
+        count, columns = next(real_batches(conn, since, until))
+        yield count, columns
+        yield count, {**columns, "distance_km": ["far"] * count}
+
+    monkeypatch.setattr(query_flights, "iter_columnar_batches", bad_second_batch)
+    output = tmp_path / "flights.arrow"
+    result = query_flights.export_flights(flighty_conn, ["--format", "arrow", "--output", str(output)])
+    assert "error" in result
+    assert not output.exists()
+
+
+def test_date_bounds_use_local_departure_date(query_flights, flighty_conn, machine_tz):
+    years = query_flights.get_flights_by_all_years(flighty_conn, summary_only=True)["years"]
+    year = years[len(years) // 2]
+    out = io.StringIO()
+    query_flights.export_flights(flighty_conn, [
+        "--since", f"{year['year']}-01-01", "--until", f"{year['year']}-12-31",
+        "--fields", "departure.datetime"], out)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == year["count"]
+    assert all(f'"{year["year"]}-' in line for line in lines)
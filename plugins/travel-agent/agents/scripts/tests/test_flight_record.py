@@ -0,0 +1,20 @@
+"""FlightRecord output comes from the single FLIGHT_OUTPUT_FIELDS definition."""
+
+
+def field_paths(fields, prefix=""):
+    for name, getter in fields.items():
+        if isinstance(getter, dict):
+            yield from field_paths(getter, f"{prefix}{name}.")
+        else:
+            yield f"{prefix}{name}"
+
+
+def test_projection_of_every_field_is_to_dict(query_flights, flighty_conn):
+    rows = query_flights.query_history_rows(flighty_conn)[:50]
+    paths = list(field_paths(query_flights.FLIGHT_OUTPUT_FIELDS))
+    for record in query_flights.flight_records(rows):
+        record.now = query_flights.current_timestamp()
+        flight = record.to_dict()
+        assert list(flight) == list(query_flights.FLIGHT_OUTPUT_FIELDS)
+        assert record.project(paths) == flight
+    assert flight["route"] == f"{flight['departure']['airport_code']} → {flight['arrival']['airport_code']}"
@@ -0,0 +1,36 @@
+"""generate_flighty_db.py writes reproducible, Flighty-shaped data."""
+
+import sqlite3
+
+import pytest
+from conftest import ANCHOR, SEED, SIZE, load_script
+
+
+@pytest.fixture(scope="module")
+def generator():
+    return load_script("generate_flighty_db")
+
+
+def test_cabins_use_flighty_identifiers(query_flights, flighty_db):
+    conn = sqlite3.connect(flighty_db)
+    cabins = {cabin for (cabin,) in conn.execute("SELECT DISTINCT cabinClass FROM Ticket")}
+    conn.close()
+    assert cabins == {"economy", "premiumEconomy", "business", "first"}
+    row = (None,) * 13 + ("premiumEconomy",) + (None,) * 11
+    assert query_flights.FlightRecord(row).cabin_display == "Premium Economy"
+
+
+def test_anchor_is_recorded(generator, flighty_db):
+    assert generator.read_meta(flighty_db) == {"size": SIZE, "seed": SEED, "anchor": ANCHOR}
+
+
+def test_same_inputs_same_database(generator, flighty_db, tmp_path):
+    copy = tmp_path / "again.db"
+    generator.generate(copy, SIZE, SEED, ANCHOR)
+    tables = ("Flight", "UserFlight", "Ticket", "ManualFlight", "UserManualFlight")
+    dumps = []
+    for path in (flighty_db, copy):
+        conn = sqlite3.connect(path)
+        dumps.append([conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall() for table in tables])
+        conn.close()
+    assert dumps[0] == dumps[1]
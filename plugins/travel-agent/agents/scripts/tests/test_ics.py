@@ -0,0 +1,51 @@
+"""ics output escapes TEXT values and folds lines at 75 octets."""
+
+import io
+import sqlite3
+
+
+def unfold(lines):
+    """Join continuation lines back onto the line they continue."""
+    joined = []
+    for line in lines:
+        if line.startswith(" "):
+            joined[-1] += line[1:]
+        else:
+            joined.append(line)
+    return joined
+
+
+def test_escape_text(query_trips):
+    assert query_trips.ics_escape("a\\b;c,d\ne\r\nf") == r"a\\b\;c\,d\ne\nf"
+
+
+def test_short_line_unchanged(query_trips):
+    line = "SUMMARY:" + "x" * 67
+    assert query_trips.ics_fold(line) == line
+
+
+def test_fold_keeps_utf8_sequences_whole(query_trips):
+    # Offset by one octet so a fold point lands inside a multibyte character
+    line = "SUMMARY:x" + "Zürich → 東京 " * 20
+    folded = query_trips.ics_fold(line).split("\r\n")
+    assert len(folded) > 1
+    assert all(len(part.encode()) <= query_trips.ICS_LINE_OCTETS for part in folded)
+    assert all(part.startswith(" ") for part in folded[1:])
+    assert unfold(folded) == [line]
+
+
+def test_calendar_lines_are_folded_and_escaped(query_trips, tripsy_home):
+    _, db_path = tripsy_home
+    name = "Zürich; Genève, 東京 and back\n" * 4
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT INTO ZTRIP VALUES (1, 'TRIP-1', ?, ?, ?, NULL)",
+                     (name, 800000000, 800000000 + 5 * 86400))
+    out = io.StringIO(newline="")
+    query_trips.write_calendar(conn, out)
+    conn.close()
+    text = out.getvalue()
+    assert text.endswith("\r\n") and "\n" not in text.replace("\r\n", "")
+    lines = text[:-2].split("\r\n")
+    assert all(len(line.encode()) <= query_trips.ICS_LINE_OCTETS for line in lines)
+    assert f"SUMMARY:{query_trips.ics_escape(name)}" in unfold(lines)
@@ -0,0 +1,145 @@
+"""The sidecar index answers exactly like the live Flighty queries."""
+
+import json
+import shutil
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def index(query_flights, flighty_conn, flighty_db, tmp_path):
+    idx = query_flights.open_flight_index(flighty_conn, flighty_db, tmp_path / "index.db")
+    yield idx
+    idx.close()
+
+
+def test_indexed_stats_match_live(query_flights, flighty_conn, index):
+    live = query_flights.get_flight_stats(flighty_conn)
+    assert live["backfilled_distance_flights"] > 0
+    indexed = query_flights.indexed_flight_stats(flighty_conn, index)
+    assert indexed.keys() == live.keys()
+    assert indexed["backfilled_distance_flights"] == live["backfilled_distance_flights"]
+    assert indexed["total_distance_km"] == pytest.approx(live["total_distance_km"])
+
+
+def test_indexed_years_and_journeys_match_live(query_flights, flighty_conn, index):
+    assert (query_flights.get_flights_by_all_years(flighty_conn, idx=index)
+            == query_flights.get_flights_by_all_years(flighty_conn))
+    assert (query_flights.get_journeys(flighty_conn, since="2024-03-01", until="2024-09-30", idx=index)
+            == query_flights.get_journeys(flighty_conn, since="2024-03-01", until="2024-09-30"))
+
+
+def test_index_command_reports_open_path(query_flights, flighty_conn, flighty_db, index, tmp_path):
+    result = query_flights.run_command(flighty_conn, "index", [], flighty_db, index)
+    assert result["path"] == str(tmp_path / "index.db")
+    assert index.execute("SELECT COUNT(*) FROM unified_flight").fetchone()[0] == result["rows"]
+
+
+def test_index_command_closes_its_own_index(query_flights, flighty_conn, flighty_db, tmp_path, monkeypatch):
+    opened = []
+    open_flight_index = query_flights.open_flight_index
+
+    def open_index(conn, db_path, refresh=True):
+        opened.append(open_flight_index(conn, db_path, tmp_path / "own.db", refresh))
+        return opened[-1]
+
+    monkeypatch.setattr(query_flights, "open_flight_index", open_index)
+    result = query_flights.run_command(flighty_conn, "index", [], flighty_db)
+    assert result["path"] == str(tmp_path / "own.db")
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute("SELECT 1")
+
+
+def test_incremental_refresh_tracks_superseded_flips(query_flights, flighty_db, tmp_path):
+    db_path = tmp_path / "flighty.db"
+    shutil.copy(flighty_db, db_path)
+    conn = query_flights.connect_db(db_path)
+    query_flights.invalidate_state_cache()
+    idx = query_flights.open_flight_index(conn, db_path, tmp_path / "index.db")
+
+    # Supersede an old tracked flight; originalFlightId is not checksummed
+    (flight_id,) = conn.execute(
+        "SELECT f.id FROM Flight f JOIN UserFlight uf ON f.id = uf.flightId "
+        "ORDER BY f.lastKnownDepartureDate LIMIT 1").fetchone()
+    writer = sqlite3.connect(db_path)
+    with writer:
+        writer.execute("UPDATE ManualFlight SET originalFlightId = ? "
+                       "WHERE rowid = (SELECT MIN(rowid) FROM ManualFlight)", (flight_id,))
+    writer.close()
+    query_flights.invalidate_state_cache()
+
+    result = query_flights.refresh_flight_index(conn, db_path, idx)
+    assert result == {"refreshed": True, "rebuilt": False, "resynced_buckets": 0}
+    assert idx.execute("SELECT superseded FROM unified_flight WHERE flight_id = ? AND source = 'tracked'",
+                       (flight_id,)).fetchone() == (1,)
+
+    flags = idx.execute("SELECT uid, superseded FROM unified_flight ORDER BY uid").fetchall()
+    query_flights.refresh_flight_index(conn, db_path, idx, force=True)
+    assert idx.execute("SELECT uid, superseded FROM unified_flight ORDER BY uid").fetchall() == flags
+    idx.close()
+    conn.close()
+    query_flights.invalidate_state_cache()
+
+
+@pytest.fixture
+def edited_db(query_flights, flighty_db, tmp_path):
+    """A copy of the synthetic database with an index built over it."""
+    db_path = tmp_path / "flighty.db"
+    shutil.copy(flighty_db, db_path)
+    query_flights.invalidate_state_cache()
+    conn = query_flights.connect_db(db_path)
+    idx = query_flights.open_flight_index(conn, db_path, tmp_path / "index.db")
+    yield conn, db_path, idx
+    idx.close()
+    conn.close()
+    query_flights.invalidate_state_cache()
+
+
+def old_tracked_ids(conn, year, count):
+    return [flight_id for (flight_id,) in conn.execute(
+        "SELECT f.id FROM Flight f JOIN UserFlight uf ON f.id = uf.flightId "
+        "WHERE uf.isMyFlight = 1 AND uf.deleted IS NULL "
+        "AND strftime('%Y', f.lastKnownDepartureDate, 'unixepoch') = ? "
+        "ORDER BY f.id LIMIT ?", (str(year), count))]
+
+
+@pytest.mark.parametrize("edit", [
+    "UPDATE Flight SET equipmentTailNumber = 'N-EDITED' WHERE id IN (SELECT value FROM json_each(?))",
+    "UPDATE UserFlight SET isMyFlight = 0 WHERE flightId IN (SELECT value FROM json_each(?))",
+    "UPDATE Ticket SET seatNumber = '99Z', pnr = 'EDITED' WHERE flightId IN (SELECT value FROM json_each(?))",
+])
+def test_edits_to_old_flights_reach_the_index(query_flights, edited_db, edit):
+    conn, db_path, idx = edited_db
+    flight_ids = old_tracked_ids(conn, 2024, 5)
+    assert len(flight_ids) == 5
+    writer = sqlite3.connect(db_path)
+    with writer:
+        assert writer.execute(edit, (json.dumps(flight_ids),)).rowcount
+    writer.close()
+    query_flights.invalidate_state_cache()
+
+    result = query_flights.refresh_flight_index(conn, db_path, idx)
+    assert result["rebuilt"] is False and 0 < result["resynced_buckets"] <= 10
+    assert (query_flights.indexed_flights_by_year(conn, idx, 2024)["flights"]
+            == query_flights.get_flights_by_year(conn, 2024)["flights"])
+    rows = idx.execute("SELECT uid, " + query_flights.FLIGHT_ROW_COLUMNS + " FROM unified_flight ORDER BY uid")
+    indexed = rows.fetchall()
+    query_flights.refresh_flight_index(conn, db_path, idx, force=True)
+    rows = idx.execute("SELECT uid, " + query_flights.FLIGHT_ROW_COLUMNS + " FROM unified_flight ORDER BY uid")
+    assert rows.fetchall() == indexed
+
+
+def test_indexed_date_lists_tracked_first(query_flights, flighty_conn, index, mixed_dates):
+    for date in mixed_dates[:5]:
+        live = query_flights.get_flights_on_date(flighty_conn, date)
+        assert query_flights.indexed_flights_on_date(flighty_conn, index, date) == live
+
+
+def test_indexed_recent_pages_like_live(query_flights, flighty_conn, index):
+    after = None
+    for _ in range(4):
+        live = query_flights.get_recent_flights(flighty_conn, 25, after)
+        indexed = query_flights.indexed_recent_flights(flighty_conn, index, 25, after)
+        assert indexed == live
+        after = query_flights.parse_cursor(indexed["next_cursor"])
@@ -0,0 +1,53 @@
+"""journeys: --max-stay-days caps how long a trip lasts."""
+
+DAY = 86400
+HOUR = 3600
+
+
+def flight(dep_code, arr_code, departure, hours=2):
+    """A 25-column row with only the fields link_journeys reads."""
+    row = [None] * 25
+    row[3], row[6], row[9], row[10] = dep_code, arr_code, departure, departure + hours * HOUR
+    return tuple(row)
+
+
+def routes(journeys):
+    return [[f"{row[3]}-{row[6]}" for row in journey] for journey in journeys]
+
+
+def test_max_stay_caps_total_length(query_flights):
+    rows = [flight("SEA", "LHR", 0), flight("LHR", "CDG", 10 * DAY), flight("CDG", "FRA", 20 * DAY)]
+    # Every gap is under the maximum stay, but the trip would last 20 days
+    assert routes(query_flights.link_journeys(rows, 24 * HOUR, 14 * DAY)) == [
+        ["SEA-LHR", "LHR-CDG"], ["CDG-FRA"],
+    ]
+
+
+def test_max_stay_splits_even_connections(query_flights):
+    rows = [flight("SEA", "LHR", 0), flight("LHR", "FRA", 14 * DAY - 3 * HOUR),
+            flight("FRA", "NRT", 14 * DAY + HOUR)]
+    assert routes(query_flights.link_journeys(rows, 24 * HOUR, 14 * DAY)) == [
+        ["SEA-LHR", "LHR-FRA"], ["FRA-NRT"],
+    ]
+
+
+def test_return_home_closes_journey(query_flights):
+    rows = [flight("SEA", "LHR", 0), flight("LHR", "SEA", 5 * DAY), flight("SEA", "SFO", 7 * DAY)]
+    assert routes(query_flights.link_journeys(rows, 24 * HOUR, 14 * DAY)) == [
+        ["SEA-LHR", "LHR-SEA"], ["SEA-SFO"],
+    ]
+
+
+def test_synthetic_journeys_respect_max_stay(query_flights, flighty_conn):
+    result = query_flights.get_journeys(flighty_conn, max_stay_days=14, summary_only=True)
+    assert result["count"] > 0
+    # Elapsed time runs to the last arrival, so allow one final flight
+    assert max(journey["elapsed_hours"] for journey in result["journeys"]) <= 14 * 24 + 24
+
+
+def test_date_bounds_match_year(query_flights, flighty_conn, machine_tz):
+    by_year = query_flights.get_journeys(flighty_conn, year=2024, summary_only=True)
+    by_dates = query_flights.get_journeys(flighty_conn, since="2024-01-01", until="2024-12-31",
+                                          summary_only=True)
+    assert by_dates["count"] == by_year["count"] > 0
+    assert by_dates["journeys"] == by_year["journeys"]
@@ -0,0 +1,99 @@
+"""Keyset cursors page through results without gaps or duplicates."""
+
+import shutil
+import sqlite3
+
+import pytest
+from conftest import ANCHOR
+
+
+def flight_keys(flights):
+    return [(f["flight"], f["route"], f["departure"]["datetime"]) for f in flights]
+
+
+def recent_keys(flights):
+    return [(f["flight"], f["route"], f["date"]) for f in flights]
+
+
+def date_keys(flights):
+    return [(f["flight"], f["route"], f["departure"], f["source"]) for f in flights]
+
+
+def page_through(fetch, limit, list_key="flights", keys_of=flight_keys):
+    keys, after = [], None
+    while True:
+        page = fetch(after, limit)
+        keys.extend(keys_of(page[list_key]))
+        if "next_cursor" not in page:
+            return keys
+        after = page["next_cursor"]
+
+
+@pytest.fixture
+def paging_conn(query_flights, flighty_db, tmp_path, monkeypatch):
+    """Connection to a copy of the synthetic database, with "now" pinned.
+
+    The copy gains a manual entry duplicating an upcoming tracked flight a
+    minute later, so list's dedup has a pair to split across pages.
+    """
+    db_path = tmp_path / "flighty.db"
+    shutil.copy(flighty_db, db_path)
+    monkeypatch.setattr(query_flights, "_pinned_now", ANCHOR)
+    query_flights.invalidate_state_cache()
+    conn = query_flights.connect_db(db_path)
+    main_user_id = query_flights.get_main_user_id(conn)
+    rows = query_flights.query_tracked_upcoming(conn, ANCHOR, main_user_id, False, 20)
+    row = next(row for row in rows if query_flights.convert_date(row[9], row[24])
+               == query_flights.convert_date(row[9] + 60, row[24]))
+    writer = sqlite3.connect(db_path)
+    with writer:
+        flight = writer.execute("SELECT number, departureAirportId, scheduledArrivalAirportId "
+                                "FROM Flight WHERE id = ?", (row[23],)).fetchone()
+        writer.execute("INSERT INTO ManualFlight (id, number, departureAirportId, scheduledArrivalAirportId, "
+                       "lastKnownDepartureDate, lastKnownArrivalDate) VALUES ('zz-duplicate', ?, ?, ?, ?, ?)",
+                       flight + (row[9] + 60, row[10]))
+        writer.execute("INSERT INTO UserManualFlight VALUES ('zz-link', 'zz-duplicate', ?, 1, NULL)",
+                       (main_user_id,))
+    writer.close()
+    query_flights.invalidate_state_cache()
+    yield conn
+    conn.close()
+    query_flights.invalidate_state_cache()
+
+
+@pytest.mark.parametrize("engine", ["python", "union"])
+@pytest.mark.parametrize("limit", [1, 7])
+def test_list_pages_match_unpaged(query_flights, paging_conn, engine, limit):
+    expected = flight_keys(query_flights.list_upcoming_flights(paging_conn, 1000, engine=engine)["flights"])
+    assert expected
+
+    def fetch(cursor, page_limit):
+        after = query_flights.parse_cursor(cursor) if cursor else None
+        return query_flights.list_upcoming_flights(paging_conn, page_limit, engine=engine, after=after)
+
+    assert page_through(fetch, limit) == expected
+
+
+def test_recent_cursor_round_trip(query_flights, flighty_conn):
+    expected = recent_keys(query_flights.get_recent_flights(flighty_conn, 120)["recent_flights"])
+
+    def fetch(cursor, limit):
+        after = query_flights.parse_cursor(cursor) if cursor else None
+        return query_flights.get_recent_flights(flighty_conn, limit, after)
+
+    keys = page_through(fetch, 25, "recent_flights", recent_keys)
+    assert keys[:120] == expected
+    assert len(keys) == len(set(keys))
+
+
+@pytest.mark.parametrize("limit", [1, 2])
+def test_paged_date_matches_unpaged(query_flights, flighty_conn, mixed_dates, limit):
+    assert mixed_dates
+    for date in mixed_dates[:5]:
+        expected = date_keys(query_flights.get_flights_on_date(flighty_conn, date)["flights"])
+
+        def fetch(cursor, page_limit):
+            after = query_flights.parse_cursor(cursor) if cursor else None
+            return query_flights.get_flights_on_date(flighty_conn, date, after, page_limit)
+
+        assert page_through(fetch, limit, keys_of=date_keys) == expected, date
@@ -0,0 +1,81 @@
+"""reconcile matches Tripsy flights to Flighty only inside the window."""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import ANCHOR
+
+CORE_DATA_OFFSET = 978307200
+DAY = 86400
+
+
+def add_flight(db_path, pk, row, departure=None):
+    """A Tripsy airplane entry copied from a Flighty history row."""
+    departure = row[9] if departure is None else departure
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO ZTRANSPORTATION (Z_PK, ZINTERNALIDENTIFIER, ZCOMPANY, ZTRANSPORTNUMBER, ZDEPARTURE, "
+            "ZARRIVAL, ZDEPARTUREADDRESS, ZARRIVALADDRESS, ZRESERVATIONCODE, ZINTERNALTYPE) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'airplane')",
+            (pk, f"T{pk}", row[1], f"{row[0]} {row[2]}", departure - CORE_DATA_OFFSET,
+             row[10] - CORE_DATA_OFFSET if row[10] else None,
+             f"{row[4]} ({row[3]})", f"{row[7]} ({row[6]})", row[11]))
+    conn.close()
+
+
+@pytest.fixture
+def window():
+    """since/until dates a few weeks before the anchor, and their bounds."""
+    start = datetime.fromtimestamp(ANCHOR - 40 * DAY).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = start + timedelta(days=14)
+    until = (end - timedelta(days=1)).strftime("%Y-%m-%d")
+    return start.strftime("%Y-%m-%d"), until, start.timestamp(), end.timestamp() - 1
+
+
+@pytest.fixture
+def segments(query_trips, flighty_db, window):
+    """Flighty segments from a day before to a day after the window."""
+    query_flights = query_trips.load_flighty_module()
+    _, _, start_ts, end_ts = window
+    conn = query_flights.connect_db(flighty_db, read_only=True)
+    try:
+        found = query_trips.load_flighty_segments(query_flights, conn, start_ts - DAY, end_ts + DAY)
+    finally:
+        conn.close()
+    return found
+
+
+def test_buffer_days_are_not_reported(query_trips, tripsy_home, flighty_db, window, segments):
+    _, db_path = tripsy_home
+    since, until, start_ts, end_ts = window
+    inside = [segment for segment in segments if start_ts <= segment["row"][9] <= end_ts]
+    assert inside and len(inside) < len(segments)
+    for pk, segment in enumerate(segments, 1):
+        add_flight(db_path, pk, segment["row"])
+
+    conn = sqlite3.connect(db_path)
+    result = query_trips.reconcile_flights(conn, since, until, flighty_db)
+    conn.close()
+    assert result["counts"] == {"matched": len(inside), "with_mismatches": 0,
+                                "tripsy_only": 0, "flighty_only": 0}
+    assert {entry["date"] for entry in result["matched"]} <= {
+        segment["date"] for segment in inside}
+
+
+def test_buffer_day_match_consumes_segment(query_trips, tripsy_home, flighty_db, window, segments):
+    _, db_path = tripsy_home
+    since, until, start_ts, end_ts = window
+    # Tripsy lists the window's first flight a day early, before `since`
+    first = min((segment for segment in segments if segment["row"][9] >= start_ts),
+                key=lambda segment: segment["row"][9])
+    add_flight(db_path, 1, first["row"], start_ts - 3600)
+
+    conn = sqlite3.connect(db_path)
+    result = query_trips.reconcile_flights(conn, since, until, flighty_db)
+    conn.close()
+    assert result["matched"] == []
+    assert first["date"] not in {entry["date"] for entry in result["flighty_only"]
+                                 if entry["route"] == f"{first['row'][3]} → {first['row'][6]}"}
+    assert result["counts"]["tripsy_only"] == 0
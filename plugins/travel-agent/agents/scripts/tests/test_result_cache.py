@@ -0,0 +1,83 @@
+"""Persistent result cache: keys, invalidation and LRU eviction."""
+
+import itertools
+import shutil
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+from conftest import ANCHOR
+
+
+@pytest.fixture
+def cache(query_flights, tmp_path, monkeypatch):
+    """A private result cache whose clock ticks one second per call."""
+    ticks = itertools.count(ANCHOR)
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(next(ticks), tz=tz or timezone.utc)
+
+    monkeypatch.setattr(query_flights, "datetime", Clock)
+    cache = query_flights.open_result_cache(tmp_path / "result_cache.db")
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def db_path(flighty_db, tmp_path):
+    path = tmp_path / "flighty.db"
+    shutil.copy(flighty_db, path)
+    return path
+
+
+def cached_keys(cache):
+    return {key for (key,) in cache.execute("SELECT key FROM result")}
+
+
+def test_hit_then_miss_after_database_write(query_flights, cache, db_path):
+    key = query_flights.result_cache_key("pnr", ["ABC123"], db_path, now=ANCHOR)
+    assert query_flights.result_cache_get(cache, key, "pnr") is None
+    query_flights.result_cache_put(cache, key, "pnr", {"flights": [1, 2]})
+    assert query_flights.result_cache_get(cache, key, "pnr") == {"flights": [1, 2]}
+
+    writer = sqlite3.connect(db_path)
+    with writer:
+        writer.execute("UPDATE Flight SET departureGate = 'Z99' WHERE rowid = 1")
+    writer.close()
+    fresh = query_flights.result_cache_key("pnr", ["ABC123"], db_path, now=ANCHOR)
+    assert fresh != key
+    assert query_flights.result_cache_get(cache, fresh, "pnr") is None
+
+    stats = query_flights.result_cache_stats(cache)
+    assert stats["by_command"] == {"pnr": {"hits": 1, "misses": 2}}
+    assert stats["entries"] == 1
+
+
+def test_key_varies_with_arguments_and_now_bucket(query_flights, db_path):
+    key = query_flights.result_cache_key
+
+    assert key("next", [], db_path, now=ANCHOR) == key("next", [], db_path, now=ANCHOR + 299)
+    assert key("next", [], db_path, now=ANCHOR) != key("next", [], db_path, now=ANCHOR + 300)
+    assert key("pnr", ["A"], db_path, now=ANCHOR) == key("pnr", ["A"], db_path, now=ANCHOR + 3599)
+    assert key("pnr", ["A"], db_path, now=ANCHOR) != key("pnr", ["A"], db_path, now=ANCHOR + 3600)
+    assert key("pnr", ["A"], db_path, now=ANCHOR) != key("pnr", ["B"], db_path, now=ANCHOR)
+    assert key("pnr", ["A"], db_path, now=ANCHOR) != key("search", ["A"], db_path, now=ANCHOR)
+
+
+def test_lru_eviction_at_size_cap(query_flights, cache):
+    result = {"value": "x" * 100}
+    size = len(query_flights.json.dumps(result))
+    for key in ("a", "b", "c"):
+        query_flights.result_cache_put(cache, key, "search", result, max_bytes=3 * size)
+    assert cached_keys(cache) == {"a", "b", "c"}
+
+    # Reading "a" makes "b" the least recently used entry
+    assert query_flights.result_cache_get(cache, "a", "search") == result
+    query_flights.result_cache_put(cache, "d", "search", result, max_bytes=3 * size)
+    assert cached_keys(cache) == {"a", "c", "d"}
+
+    query_flights.result_cache_put(cache, "e", "search", result, max_bytes=2 * size)
+    assert cached_keys(cache) == {"d", "e"}
+    assert query_flights.result_cache_stats(cache)["bytes"] == 2 * size
@@ -0,0 +1,29 @@
+"""Reading the shadow snapshot gives the same answers as the live file."""
+
+import pytest
+
+
+@pytest.fixture
+def snapshot_conn(query_flights, flighty_db, tmp_path):
+    snapshot_path = tmp_path / "snapshot.db"
+    query_flights.refresh_snapshot(flighty_db, snapshot_path)
+    query_flights.invalidate_state_cache()
+    conn = query_flights.connect_db(snapshot_path)
+    yield conn
+    conn.close()
+    query_flights.invalidate_state_cache()
+
+
+def test_codeshare_dedup_matches_live(query_flights, flighty_conn, snapshot_conn):
+    live_years = query_flights.get_flights_by_all_years(flighty_conn)
+    assert query_flights.get_flights_by_all_years(snapshot_conn) == live_years
+    for bucket in live_years["years"]:
+        year = bucket["year"]
+        assert (query_flights.get_flights_by_year(snapshot_conn, year)
+                == query_flights.get_flights_by_year(flighty_conn, year)), year
+        assert (query_flights.get_stats_breakdown(snapshot_conn, year=year, top=0)
+                == query_flights.get_stats_breakdown(flighty_conn, year=year, top=0)), year
+    assert (list(query_flights.iter_flight_export(snapshot_conn))
+            == list(query_flights.iter_flight_export(flighty_conn)))
+    assert (query_flights.list_upcoming_flights(snapshot_conn, 1000, engine="union")
+            == query_flights.list_upcoming_flights(flighty_conn, 1000, engine="union"))
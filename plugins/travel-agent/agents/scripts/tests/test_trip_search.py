@@ -0,0 +1,40 @@
+"""The trip search sidecar rebuilds only when Tripsy changes."""
+
+import json
+import sqlite3
+
+
+def add_trip(db_path, pk, name, starts):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT INTO ZTRIP VALUES (?, ?, ?, ?, ?, NULL)",
+                     (pk, f"TRIP-{pk}", name, starts, starts + 5 * 86400))
+    conn.close()
+
+
+def test_fingerprint_matches_query_flights(query_flights, query_trips, tripsy_home, tmp_path):
+    _, db_path = tripsy_home
+    add_trip(db_path, 1, "Lisbon", 0)
+    search_path = tmp_path / "search.db"
+    conn = sqlite3.connect(db_path)
+    search = query_trips.open_search_index(conn, db_path, search_path)
+    stored = dict(search.execute("SELECT key, value FROM search_meta").fetchall())["fingerprint"]
+    search.close()
+    conn.close()
+    assert json.loads(stored) == json.loads(json.dumps(query_flights.file_fingerprint(db_path)))
+
+
+def test_rebuilds_after_tripsy_changes(query_trips, tripsy_home, tmp_path):
+    _, db_path = tripsy_home
+    add_trip(db_path, 1, "Lisbon", 0)
+    search_path = tmp_path / "search.db"
+    conn = sqlite3.connect(db_path)
+    search = query_trips.open_search_index(conn, db_path, search_path)
+    assert [match[0] for match in query_trips.search_trips(search, "Lisbon")] == ["TRIP-1"]
+    search.close()
+
+    add_trip(db_path, 2, "Kyoto", 10 * 86400)
+    search = query_trips.open_search_index(conn, db_path, search_path)
+    assert [match[0] for match in query_trips.search_trips(search, "Kyoto")] == ["TRIP-2"]
+    search.close()
+    conn.close()
@@ -0,0 +1,50 @@
+"""query_trips.py --profile reports through query_flights.py's profiler."""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from conftest import SCRIPT_DIR
+
+CORE_DATA_OFFSET = 978307200
+
+
+def run_trips(home, *args):
+    return subprocess.run(
+        [sys.executable, str(SCRIPT_DIR / "query_trips.py"), *args],
+        capture_output=True, text=True, env={**os.environ, "HOME": str(home)}, check=True,
+    )
+
+
+def add_trip(db_path):
+    starts = time.time() + 10 * 86400 - CORE_DATA_OFFSET
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT INTO ZTRIP VALUES (1, 'TRIP-1', 'Lisbon', ?, ?, NULL)",
+                     (starts, starts + 5 * 86400))
+        conn.execute("INSERT INTO ZHOSTING VALUES (1, 1, 'HOTEL-1', 'Hotel Central', '1 Main St', ?, ?, "
+                     "'H123', NULL, NULL)", (starts + 3600, starts + 4 * 86400))
+    conn.close()
+
+
+def test_profile_report_on_stderr(tripsy_home):
+    home, db_path = tripsy_home
+    add_trip(db_path)
+    completed = run_trips(home, "trips", "--full", "--profile")
+    assert json.loads(completed.stdout)["count"] == 1
+    report = json.loads(completed.stderr)["profile"]
+    assert report["command"] == "trips"
+    assert report["statements"] and all("database" in entry for entry in report["statements"])
+    assert "serialization_ms" in report
+
+
+def test_ics_to_stdout_keeps_profile(tripsy_home, tmp_path):
+    home, db_path = tripsy_home
+    add_trip(db_path)
+    profile_path = tmp_path / "profile.json"
+    completed = run_trips(home, "ics", "--profile-file", str(profile_path))
+    assert completed.stdout.startswith("BEGIN:VCALENDAR")
+    assert json.loads(profile_path.read_text())["profile"]["command"] == "ics"
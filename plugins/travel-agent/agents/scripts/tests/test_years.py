@@ -0,0 +1,50 @@
+"""`year Y` and the Y bucket of `years` agree, flight for flight."""
+
+import pytest
+
+
+def flight_keys(flights):
+    return [(f["flight"], f["route"], f["departure"]["datetime"]) for f in flights]
+
+
+@pytest.fixture
+def all_years(query_flights, flighty_conn):
+    return query_flights.get_flights_by_all_years(flighty_conn)
+
+
+def test_every_year_matches_years_bucket(query_flights, flighty_conn, all_years):
+    assert all_years["year_count"] > 1
+    for bucket in all_years["years"]:
+        single = query_flights.get_flights_by_year(flighty_conn, bucket["year"])
+        assert single["count"] == bucket["count"], bucket["year"]
+        assert flight_keys(single["flights"]) == flight_keys(bucket["flights"])
+        assert single["total_distance_km"] == pytest.approx(bucket["total_distance_km"])
+
+
+def test_indexed_year_matches_years_bucket(query_flights, flighty_conn, flighty_db, all_years, tmp_path):
+    idx = query_flights.open_flight_index(flighty_conn, flighty_db, tmp_path / "index.db")
+    try:
+        for bucket in all_years["years"]:
+            indexed = query_flights.indexed_flights_by_year(flighty_conn, idx, bucket["year"])
+            assert flight_keys(indexed["flights"]) == flight_keys(bucket["flights"]), bucket["year"]
+    finally:
+        idx.close()
+
+
+def test_year_departures_carry_the_local_year(query_flights, flighty_conn, all_years):
+    for bucket in all_years["years"]:
+        for flight in query_flights.get_flights_by_year(flighty_conn, bucket["year"])["flights"]:
+            assert flight["departure"]["datetime"].startswith(f"{bucket['year']}-")
+
+
+def test_paged_year_matches_unpaged(query_flights, flighty_conn, all_years):
+    year = all_years["years"][len(all_years["years"]) // 2]["year"]
+    expected = flight_keys(query_flights.get_flights_by_year(flighty_conn, year)["flights"])
+    pages, after = [], None
+    while True:
+        page = query_flights.get_flights_by_year(flighty_conn, year, after=after, limit=37)
+        pages.extend(flight_keys(page["flights"]))
+        if "next_cursor" not in page:
+            break
+        after = query_flights.parse_cursor(page["next_cursor"])
+    assert pages == expected